@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2019 Daniel Hammer. All Rights Reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os.path
+import timeit
+
+import numpy as np
+
+from kalman_estimator import KalmanFilter, AdaptiveKalmanFilter
+from kalman_estimator import ParallelKalmanFilter
+from kalman_estimator import MovingWeightedSigWindow
+from kalman_estimator import MovingWeightedSigExpWindow
+from kalman_estimator import StateEstimator, BagSysIO
+from kalman_estimator import BagReader, BagCache
+
+from thesis import ThesisConfig
+
+
+class BenchmarkConfig(object):
+    samples = 20000
+    rate = 400.
+    repeat = 3
+
+
+def get_tuy(samples=BenchmarkConfig.samples, rate=BenchmarkConfig.rate):
+    np.random.seed(0)
+    t = 1 + np.arange(samples) / rate
+    U = np.zeros((samples, 2))
+    U[samples // 4:3 * samples // 4, 0] = 0.5
+    U[samples // 2:, 1] = 0.3
+    Y = np.random.normal(0, 0.05, (samples, 2))
+    return t, U, Y
+
+
+def get_bag_tuy(bag=""):
+    # merged event timeline of a thesis bag, as the estimator filters it
+    bag_reader = BagReader(bag, BagCache(ThesisConfig.cache))
+    bag_sys_IO = BagSysIO(bag_reader,
+                          ThesisConfig.twist_topic, ThesisConfig.imu_topic)
+    bag_reader.close()
+    state_estimator = StateEstimator()
+    state_estimator.set_stamped_input(bag_sys_IO.get_input())
+    state_estimator.set_stamped_output(bag_sys_IO.get_output())
+    t, U, Y = state_estimator._get_merged_input_output()
+    return t, U, Y, state_estimator.get_event_table().get_has_y()
+
+
+def get_kalman_filter(kernel="dense", dtype=np.float64):
+    return KalmanFilter(
+        ThesisConfig.Q_k, ThesisConfig.R_k,
+        ThesisConfig.alpha, ThesisConfig.beta,
+        ThesisConfig.mass,
+        ThesisConfig.length, ThesisConfig.width,
+        ThesisConfig.micro_v, ThesisConfig.micro_dpsi,
+        kernel=kernel, dtype=dtype)
+
+
+def time_per_sample(run=None, samples=BenchmarkConfig.samples):
+    if not run:
+        raise ValueError
+    else:
+        best = min(timeit.repeat(run, number=1,
+                                 repeat=BenchmarkConfig.repeat))
+        return best / samples
+
+
+def bench_filter_iter(kernel="dense"):
+    tuy = [(t, tuple(u), tuple(y)) for t, u, y in zip(*get_tuy())]
+
+    def run():
+        kalman_filter = get_kalman_filter(kernel)
+        for sample in tuy:
+            kalman_filter.filter_iter(sample)
+    return time_per_sample(run, len(tuy))
+
+
+def bench_filter_batch(kernel="dense", dtype=np.float64,
+                       samples=BenchmarkConfig.samples):
+    t, U, Y = get_tuy(samples)
+
+    def run():
+        kalman_filter = get_kalman_filter(kernel, dtype)
+        kalman_filter.filter_batch(t, U, Y)
+    return time_per_sample(run, len(t))
+
+
+def bench_parallel(processes=1, samples=BenchmarkConfig.samples):
+    t, U, Y = get_tuy(samples)
+
+    def run():
+        parallel_kalman_filter = ParallelKalmanFilter(
+            get_kalman_filter("in_place"), processes)
+        parallel_kalman_filter.filter_batch(t, U, Y)
+    return time_per_sample(run, len(t))
+
+
+def bench_adaptive(size=5, kernel="dense", offline=False,
+                   window_type=MovingWeightedSigWindow):
+    t, U, Y = get_tuy()
+
+    def run():
+        adaptive_kalman_filter = AdaptiveKalmanFilter(
+            ThesisConfig.Q_k, ThesisConfig.R_k,
+            ThesisConfig.alpha, ThesisConfig.beta,
+            ThesisConfig.mass,
+            ThesisConfig.length, ThesisConfig.width,
+            ThesisConfig.micro_v, ThesisConfig.micro_dpsi,
+            window_type(size, 7), ThesisConfig.line_sim_M_k,
+            kernel=kernel, offline=offline)
+        adaptive_kalman_filter.filter_batch(t, U, Y)
+    return time_per_sample(run, len(t))
+
+
+def print_accuracy(name="", t=None, U=None, Y=None, has_y=None):
+    # float32 kernels against the float64 dense baseline, the error is the
+    # worst deviation per state over the whole run
+    if t is None:
+        raise ValueError
+    else:
+        baseline = get_kalman_filter().filter_batch(t, U, Y, has_y=has_y)
+        scale = np.maximum(np.ptp(baseline, axis=0), 1e-12)
+        print(name)
+        for kernel in KalmanFilter.kernels[1:]:
+            states = get_kalman_filter(kernel, np.float32).filter_batch(
+                t, U, Y, has_y=has_y)
+            error = np.abs(states - baseline).max(axis=0)
+            print("  {:<12} max |err| {}  max rel {:.2e}".format(
+                kernel, " ".join("{:.1e}".format(e) for e in error),
+                (error / scale).max()))
+
+
+def print_speedups(name="", timings=None):
+    if not timings:
+        raise ValueError
+    else:
+        baseline = timings[0][1]
+        print(name)
+        for label, timing in timings:
+            print("  {:<12} {:8.2f} us/sample  x{:.2f}".format(
+                label, timing * 1e6, baseline / timing))
+
+
+if __name__ == '__main__':
+    print_speedups("filter_iter", [
+        (kernel, bench_filter_iter(kernel))
+        for kernel in KalmanFilter.kernels])
+    print_speedups("filter_batch", [
+        ("filter_iter", bench_filter_iter())] + [
+        (kernel, bench_filter_batch(kernel))
+        for kernel in KalmanFilter.kernels])
+    print_speedups("adaptive filter_batch", [
+        ("window {}".format(size), bench_adaptive(size))
+        for size in (5, 200, 2000)])
+    print_speedups("adaptive offline filter_batch", [
+        ("online", bench_adaptive(200)),
+        ("offline", bench_adaptive(200, offline=True)),
+        ("in_place", bench_adaptive(200, "in_place", offline=True))])
+    print_speedups("adaptive recursive window", [
+        ("sig {}".format(size), bench_adaptive(size))
+        for size in (200, 2000)] + [
+        ("sig exp {}".format(size),
+         bench_adaptive(size, window_type=MovingWeightedSigExpWindow))
+        for size in (200, 2000)])
+    print_speedups("float64 vs float32 filter_batch", [
+        (kernel, bench_filter_batch(kernel))
+        for kernel in KalmanFilter.kernels] + [
+        (kernel + " f32", bench_filter_batch(kernel, np.float32))
+        for kernel in KalmanFilter.kernels[1:]])
+    # ten minutes of events at the benchmark rate
+    samples = int(600 * BenchmarkConfig.rate)
+    print_speedups("parallel in time filter_batch, ten minutes", [
+        ("in_place", bench_filter_batch("in_place", samples=samples))] + [
+        ("{} process".format(processes), bench_parallel(processes, samples))
+        for processes in (1, 2, 4, 8)])
+    t, U, Y = get_tuy()
+    print_accuracy("float32 accuracy, synthetic", t, U, Y)
+    for bag in (ThesisConfig.straight_nojerk_bag, ThesisConfig.turn_nojerk_bag,
+                ThesisConfig.octagon_bag, ThesisConfig.floor_bag):
+        if os.path.isfile(bag):
+            print_accuracy("float32 accuracy, " + os.path.basename(bag),
+                           *get_bag_tuy(bag))
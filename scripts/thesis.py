@@ -19,7 +19,7 @@ import numpy as np
 from kalman_estimator import KalmanFilter, AdaptiveKalmanFilter
 from kalman_estimator import MovingWeightedSigWindow
 from kalman_estimator import SimSysIO, BagSysIO
-from kalman_estimator import BagReader
+from kalman_estimator import BagReader, BagCache
 
 from experiments import Experiment, NoRotationExperiment, SimExperiment
 from experiments import ExperimentSuite
@@ -60,6 +60,7 @@ class ThesisConfig(object):
 
     output = "/home/dan/ws/rosbag/garry3/"
     out_trans = output + "trans/"
+    cache = output + "cache/"
 
     straight_nojerk_bag_name = "5m_medium.bag"
     straight_nojerk_bag = out_trans + "trans_" + straight_nojerk_bag_name
@@ -92,6 +93,7 @@ class ThesisConfig(object):
     micro_dpsi_test_legend = ["nojerk", "jerk"]
 
     straight_line_slice = (14, 30)
+    warmup = 2.
     straight_line_legend = ["KF", "aKF"]
 
     octagon_slice = (0, np.inf)
@@ -134,13 +136,18 @@ class ThesisExperimentSuite(ExperimentSuite):
         self._set_kalman_filters()
         self._set_experiments()
 
-    def _get_bag_IOs(self, bags=[]):
+    def _get_bag_IOs(self, bags=[], time_window=None):
         bags_sys_IO = []
+        bag_cache = BagCache(ThesisConfig.cache)
         for bag in bags:
-            bag_reader = BagReader(bag)
+            bag_reader = BagReader(bag, bag_cache)
             bag_sys_IO = BagSysIO(bag_reader,
                                   ThesisConfig.twist_topic,
-                                  ThesisConfig.imu_topic)
+                                  ThesisConfig.imu_topic,
+                                  time_window=time_window,
+                                  warmup=ThesisConfig.warmup)
+            # the topics are read by now, the bag isn't needed anymore
+            bag_reader.close()
             bags_sys_IO.append(bag_sys_IO)
         return bags_sys_IO
 
@@ -264,7 +271,8 @@ class MicroDPsiTesting(ThesisExperimentSuite):
     def _set_IOs(self):
         self._sys_IOs = self._get_bag_IOs([
             ThesisConfig.turn_nojerk_bag,
-            ThesisConfig.turn_jerk_bag])
+            ThesisConfig.turn_jerk_bag],
+            ThesisConfig.micro_dpsi_test_slice)
 
     def _set_kalman_filters(self):
         kalman_filter = KalmanFilter(
@@ -292,7 +300,7 @@ class MicroDPsiTesting(ThesisExperimentSuite):
             experiment = Experiment(
                 sys_IO,
                 kalman_filter,
-                ThesisConfig.micro_dpsi_test_slice,
+                sys_IO.get_slice(),
                 legend
             )
             self._experiments.append(experiment)
@@ -304,7 +312,8 @@ class StraightLine(ThesisExperimentSuite):
         super(StraightLine, self).__init__("straight_line")
 
     def _set_IOs(self):
-        self._sys_IOs = self._get_bag_IOs([ThesisConfig.straight_nojerk_bag])
+        self._sys_IOs = self._get_bag_IOs([ThesisConfig.straight_nojerk_bag],
+                                          ThesisConfig.straight_line_slice)
 
     def _set_kalman_filters(self):
         kalman_filter = KalmanFilter(
@@ -331,7 +340,7 @@ class StraightLine(ThesisExperimentSuite):
             experiment = Experiment(
                 self._sys_IOs[0],
                 kalman_filter,
-                ThesisConfig.straight_line_slice,
+                self._sys_IOs[0].get_slice(),
                 legend)
             self._experiments.append(experiment)
 
@@ -1,5 +1,17 @@
+from bag_cache import BagCache
 from bag_reader import BagReader
+from event_table import EventTable
+from native_bag import NativeBagReader, NativeBagWriter
 from kalman_estimator import SysIO, SimSysIO, BagSysIO
 from kalman_estimator import StateEstimator, KalmanEstimator, EstimationPlots
+from kalman_estimator import BatchKalmanEstimator
 from kalman_filter import KalmanFilter, AdaptiveKalmanFilter
+from kalman_filter import BatchKalmanFilter
+from kalman_filter import pack_covariances, unpack_covariances
+from kalman_filter import allocate_history, rts_smooth
+from parallel_kalman_filter import ParallelKalmanFilter
 from moving_weighted_window import MovingWeightedSigWindow
+from moving_weighted_window import MovingWeightedExpWindow
+from moving_weighted_window import MovingWeightedSigExpWindow
+from moving_weighted_window import MovingWindowBuffer
+from stamped_history import StampedHistory, StampedSink
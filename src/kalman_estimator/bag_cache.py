@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2019 Daniel Hammer. All Rights Reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import glob
+import hashlib
+
+import numpy as np
+
+from stamped_history import StampedHistory
+
+
+def get_digest(*parts):
+    text = "\0".join(str(part) for part in parts)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+
+
+class BagCache(object):
+    # one <bag>_<topic>_<stamp>.npy per decoded topic, where <stamp> hashes
+    # the size and mtime of the bag so a rewritten bag never hits an old
+    # entry; column 0 of the stored array is the time, the rest the values
+
+    def __init__(self, directory=None, max_size=1 << 30):
+        if not directory:
+            raise ValueError("Cache directory not defined!")
+        if max_size <= 0:
+            raise ValueError("Invalid cache size!")
+        self._directory = os.path.expanduser(directory)
+        self._max_size = max_size
+        if not os.path.exists(self._directory):
+            os.makedirs(self._directory)
+
+    def get_directory(self):
+        return self._directory
+
+    def get_size(self):
+        return sum(os.path.getsize(path) for path in self._get_entries())
+
+    def load(self, bag_path=None, topic=None, kind=None,
+             window=(None, None)):
+        path = self._get_path(bag_path, topic, kind, window)
+        if not os.path.exists(path):
+            return None
+        else:
+            # the mtime of an entry doubles as its last use for eviction
+            os.utime(path, None)
+            array = np.load(path, mmap_mode='r')
+            return StampedHistory.from_arrays(array[:, 0], array[:, 1:])
+
+    def store(self, bag_path=None, topic=None, kind=None,
+              stamped_data=None, window=(None, None)):
+        if not isinstance(stamped_data, StampedHistory):
+            raise ValueError
+        else:
+            path = self._get_path(bag_path, topic, kind, window)
+            # entries for an older version of the same bag are stale
+            self._remove(self._get_entries(path[:path.rindex("_")]))
+            array = np.column_stack((stamped_data.get_time(),
+                                     stamped_data.get_values()))
+            tmp_path = path + ".tmp.npy"
+            np.save(tmp_path, array)
+            os.rename(tmp_path, path)
+            self._evict()
+
+    def invalidate(self, bag_path=None):
+        if bag_path is None:
+            self._remove(self._get_entries())
+        else:
+            self._remove(self._get_entries(
+                os.path.join(self._directory, self._get_bag_digest(bag_path))))
+
+    def _evict(self):
+        entries = sorted(self._get_entries(), key=os.path.getmtime)
+        size = sum(os.path.getsize(path) for path in entries)
+        # the newest entry always stays, even if it alone exceeds the cap
+        for path in entries[:-1]:
+            if size <= self._max_size:
+                break
+            size -= os.path.getsize(path)
+            os.remove(path)
+
+    def _get_path(self, bag_path=None, topic=None, kind=None,
+                  window=(None, None)):
+        if not bag_path or not topic or not kind:
+            raise ValueError
+        else:
+            stat = os.stat(bag_path)
+            start_time, end_time = window
+            name = "{}_{}_{}.npy".format(
+                self._get_bag_digest(bag_path),
+                get_digest(topic, kind, repr(start_time), repr(end_time)),
+                get_digest(stat.st_size, repr(stat.st_mtime)))
+            return os.path.join(self._directory, name)
+
+    def _get_entries(self, prefix=None):
+        if prefix is None:
+            prefix = os.path.join(self._directory, "")
+        return [path for path in glob.glob(prefix + "*.npy")
+                if not path.endswith(".tmp.npy")]
+
+    @staticmethod
+    def _get_bag_digest(bag_path=None):
+        return get_digest(os.path.abspath(bag_path))
+
+    @staticmethod
+    def _remove(paths=None):
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
@@ -14,91 +14,147 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import tf
-import rosbag
-
-
-class BagReader(object):
-    def __init__(self, bag_path=""):
-        if not bag_path:
-            raise ValueError
-        else:
-            self.bag = rosbag.Bag(bag_path)
-
-    def read_odom(self, topic=None):
-        if not topic:
-            raise ValueError
-        else:
-            odom_msgs = self.bag.read_messages(topics=topic)
-            odom = []
-            for odom_msg in odom_msgs:
-                t = odom_msg.message.header.stamp.to_sec()
-
-                pos_x = odom_msg.message.pose.pose.position.x
-                pos_y = odom_msg.message.pose.pose.position.y
-                pos_z = odom_msg.message.pose.pose.position.z
-
-                orient_x = odom_msg.message.pose.pose.orientation.x
-                orient_y = odom_msg.message.pose.pose.orientation.y
-                orient_z = odom_msg.message.pose.pose.orientation.z
-                orient_w = odom_msg.message.pose.pose.orientation.w
-                q = [orient_x, orient_y, orient_z, orient_w]
-                roll, pitch, yaw = tf.transformations.euler_from_quaternion(q)
-
-                lin_x = odom_msg.message.twist.twist.linear.x
-                lin_y = odom_msg.message.twist.twist.linear.y
-                lin_z = odom_msg.message.twist.twist.linear.z
-
-                ang_x = odom_msg.message.twist.twist.angular.x
-                ang_y = odom_msg.message.twist.twist.angular.y
-                ang_z = odom_msg.message.twist.twist.angular.z
-
-                odom_data = (pos_x, pos_y, pos_z,
-                             roll, pitch, yaw,
-                             lin_x, lin_y, lin_z,
-                             ang_x, ang_y, ang_z)
-                odom.append((t, odom_data))
-            return odom
-
-    def read_imu(self, topic=None):
-        if not topic:
-            raise ValueError
-        else:
-            imu = []
-            imu_msgs = self.bag.read_messages(topics=topic)
-            for imu_msg in imu_msgs:
-                t = imu_msg.message.header.stamp.to_sec()
-                accel_x = imu_msg.message.linear_acceleration.x
-                accel_y = imu_msg.message.linear_acceleration.y
-                accel_z = imu_msg.message.linear_acceleration.z
-
-                gyro_x = imu_msg.message.angular_velocity.x
-                gyro_y = imu_msg.message.angular_velocity.y
-                gyro_z = imu_msg.message.angular_velocity.z
-
-                imu_data = (accel_x, accel_y, accel_z,
-                            gyro_x, gyro_y, gyro_z)
-                imu.append((t, imu_data))
-            return imu
-
-    def read_twist(self, topic=None):
-        if not topic:
-            raise ValueError
+from native_bag import NativeBagReader
+from topic_reader import TopicReader
+
+
+class BagReader(TopicReader):
+
+    def __init__(self, bag_path="", cache=None):
+        super(BagReader, self).__init__(bag_path, cache)
+        # rosbag is only needed once a bag is opened through ROS, the
+        # NativeBagReader works without it
+        import rosbag
+        self.bag = rosbag.Bag(bag_path)
+        self._decoders = {
+            "odom": self._decode_odom,
+            "imu": self._decode_imu,
+            "twist": self._decode_twist
+        }
+        self._native_reader = None
+
+    def close(self):
+        # the native reader holds its own handle of the same file
+        if self._native_reader is not None:
+            self._native_reader.close()
+            self._native_reader = None
+        self.bag.close()
+
+    def get_start_time(self):
+        return self.bag.get_start_time()
+
+    def get_end_time(self):
+        return self.bag.get_end_time()
+
+    def _read_raw(self, topics=None, start_time=None, end_time=None):
+        msgs = self._read_messages(topics, start_time, end_time, raw=True)
+        for msg in msgs:
+            yield msg.topic, msg.message[0], msg.message[1], msg.message
+
+    def _build_index(self, topic=None):
+        # rosbag writes the same v2.0 container, its chunk index records
+        # are read directly instead of through rosbag's private API
+        return self._get_native_reader()._build_index(topic)
+
+    def _read_entries(self, topic=None, entries=None):
+        return self._get_native_reader()._read_entries(topic, entries)
+
+    def _get_native_reader(self):
+        if self._native_reader is None:
+            self._native_reader = NativeBagReader(self._bag_path)
+        return self._native_reader
+
+    def _decode_message(self, kind=None, raw_message=None):
+        # types without a raw layout go through genpy
+        return self._decoders[kind](self._deserialize(raw_message))
+
+    @staticmethod
+    def _deserialize(raw_message=None):
+        # raw messages come as (datatype, data, md5sum, position, pytype)
+        message = raw_message[-1]()
+        message.deserialize(raw_message[1])
+        return message
+
+    def _read_messages(self, topics=None, start_time=None, end_time=None,
+                       raw=False):
+        # the window is handed to rosbag, which only loads the chunks
+        # that overlap it
+        import rospy
+        if start_time is not None:
+            start_time = rospy.Time.from_sec(start_time)
+        if end_time is not None:
+            end_time = rospy.Time.from_sec(end_time)
+        return self.bag.read_messages(topics=topics, start_time=start_time,
+                                      end_time=end_time, raw=raw)
+
+    def _get_message_count(self, topic=None, start_time=None, end_time=None):
+        count = self.bag.get_message_count(topic_filters=[topic])
+        if start_time is None and end_time is None:
+            return count
         else:
-            twist = []
-            twist_msgs = self.bag.read_messages(topics=topic)
-            for twist_msg in twist_msgs:
-                t = twist_msg.message.header.stamp.to_sec()
-
-                lin_x = twist_msg.message.twist.twist.linear.x
-                lin_y = twist_msg.message.twist.twist.linear.y
-                lin_z = twist_msg.message.twist.twist.linear.z
-
-                ang_x = twist_msg.message.twist.twist.angular.x
-                ang_y = twist_msg.message.twist.twist.angular.y
-                ang_z = twist_msg.message.twist.twist.angular.z
-
-                twist_data = (lin_x, lin_y, lin_z,
-                              ang_x, ang_y, ang_z)
-                twist.append((t, twist_data))
-            return twist
+            # rosbag only counts whole topics, scale by the windowed share
+            # of the bag and let the history grow if the rate was uneven
+            bag_start = self.get_start_time()
+            bag_end = self.get_end_time()
+            start = bag_start if start_time is None else start_time
+            end = bag_end if end_time is None else end_time
+            share = (end - start) / max(bag_end - bag_start, 1e-9)
+            return int(count * min(max(share, 0), 1)) + 1
+
+    @staticmethod
+    def _decode_odom(odom_msg=None):
+        t = odom_msg.header.stamp.to_sec()
+
+        pos_x = odom_msg.pose.pose.position.x
+        pos_y = odom_msg.pose.pose.position.y
+        pos_z = odom_msg.pose.pose.position.z
+
+        orient_x = odom_msg.pose.pose.orientation.x
+        orient_y = odom_msg.pose.pose.orientation.y
+        orient_z = odom_msg.pose.pose.orientation.z
+        orient_w = odom_msg.pose.pose.orientation.w
+
+        lin_x = odom_msg.twist.twist.linear.x
+        lin_y = odom_msg.twist.twist.linear.y
+        lin_z = odom_msg.twist.twist.linear.z
+
+        ang_x = odom_msg.twist.twist.angular.x
+        ang_y = odom_msg.twist.twist.angular.y
+        ang_z = odom_msg.twist.twist.angular.z
+
+        odom_data = (pos_x, pos_y, pos_z,
+                     orient_x, orient_y, orient_z, orient_w,
+                     lin_x, lin_y, lin_z,
+                     ang_x, ang_y, ang_z)
+        return t, odom_data
+
+    @staticmethod
+    def _decode_imu(imu_msg=None):
+        t = imu_msg.header.stamp.to_sec()
+        accel_x = imu_msg.linear_acceleration.x
+        accel_y = imu_msg.linear_acceleration.y
+        accel_z = imu_msg.linear_acceleration.z
+
+        gyro_x = imu_msg.angular_velocity.x
+        gyro_y = imu_msg.angular_velocity.y
+        gyro_z = imu_msg.angular_velocity.z
+
+        imu_data = (accel_x, accel_y, accel_z,
+                    gyro_x, gyro_y, gyro_z)
+        return t, imu_data
+
+    @staticmethod
+    def _decode_twist(twist_msg=None):
+        t = twist_msg.header.stamp.to_sec()
+
+        lin_x = twist_msg.twist.twist.linear.x
+        lin_y = twist_msg.twist.twist.linear.y
+        lin_z = twist_msg.twist.twist.linear.z
+
+        ang_x = twist_msg.twist.twist.angular.x
+        ang_y = twist_msg.twist.twist.angular.y
+        ang_z = twist_msg.twist.twist.angular.z
+
+        twist_data = (lin_x, lin_y, lin_z,
+                      ang_x, ang_y, ang_z)
+        return t, twist_data
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2019 Daniel Hammer. All Rights Reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+
+
+class EventTable(object):
+    # merged timeline of an input and an output stream, one event per
+    # distinct timestamp; an input and an output sharing a timestamp
+    # become a single event with both has_u and has_y set
+
+    def __init__(self, input_time=None, output_time=None):
+        if input_time is None or output_time is None:
+            raise ValueError
+        input_time = np.asarray(input_time, dtype=float)
+        output_time = np.asarray(output_time, dtype=float)
+        if input_time.ndim != 1 or output_time.ndim != 1:
+            raise ValueError("Times have to be (T,) arrays!")
+        else:
+            # bags store messages by receive time, so header stamps can be
+            # slightly out of order; each stream is stably sorted by stamp
+            # and the indexes below point back into the stream as given
+            input_order = np.argsort(input_time, kind="mergesort")
+            output_order = np.argsort(output_time, kind="mergesort")
+            input_time = input_time[input_order]
+            output_time = output_time[output_order]
+            time = np.concatenate((input_time, output_time))
+            # a stable sort of two sorted runs is a single linear merge
+            order = np.argsort(time, kind="mergesort")
+            time = time[order]
+            is_new = np.ones(len(time), dtype=bool)
+            is_new[1:] = time[1:] != time[:-1]
+            event = np.cumsum(is_new) - 1
+            self._time = time[is_new]
+            from_input = order < len(input_time)
+            input_count = np.bincount(event[from_input],
+                                      minlength=len(self._time))
+            output_count = np.bincount(event[~from_input],
+                                       minlength=len(self._time))
+            self._has_u = input_count > 0
+            self._has_y = output_count > 0
+            # latest sample at or before each event, -1 before the first
+            self._input_index = self._get_index(input_count, input_order)
+            self._output_index = self._get_index(output_count, output_order)
+            self._input_len = len(input_time)
+            self._output_len = len(output_time)
+
+    def __len__(self):
+        return len(self._time)
+
+    def get_time(self):
+        return self._time
+
+    def get_has_u(self):
+        return self._has_u
+
+    def get_has_y(self):
+        return self._has_y
+
+    def get_input_index(self):
+        return self._input_index
+
+    def get_output_index(self):
+        return self._output_index
+
+    def get_input(self, input_values=None):
+        return self._hold(input_values, self._input_index, self._input_len)
+
+    def get_output(self, output_values=None):
+        return self._hold(output_values, self._output_index,
+                          self._output_len)
+
+    @staticmethod
+    def _get_index(count=None, order=None):
+        index = np.cumsum(count) - 1
+        started = index >= 0
+        index[started] = order[index[started]]
+        return index
+
+    @staticmethod
+    def _hold(values=None, index=None, length=0):
+        # zero order hold of the samples on the event timeline, events
+        # before the first sample see zeros
+        if values is None:
+            raise ValueError
+        values = np.asarray(values, dtype=float)
+        if values.ndim != 2 or len(values) != length:
+            raise ValueError("Values do not match the event table!")
+        else:
+            held = np.zeros((len(index), values.shape[1]))
+            started = index >= 0
+            held[started] = values[index[started]]
+            return held
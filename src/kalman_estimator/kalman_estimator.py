@@ -15,13 +15,14 @@
 # limitations under the License.
 
 import os.path
-from itertools import compress, chain
 
 import numpy as np
-from scipy import signal
 
-from kalman_filter import KalmanFilter
-from bag_reader import BagReader
+from event_table import EventTable
+from kalman_filter import KalmanFilter, BatchKalmanFilter
+from kalman_filter import allocate_history, rts_smooth
+from topic_reader import TopicReader
+from stamped_history import StampedHistory, StampedSink
 
 
 def check_directory(dir=None):
@@ -63,52 +64,83 @@ class BagSysIO(SysIO):
                  bag_reader=None,
                  input_twist=None,
                  output_imu=None,
-                 state_odom=None):
-        if not isinstance(bag_reader, BagReader):
-            raise ValueError("Passed bag_reader not BagReader!")
+                 state_odom=None,
+                 time_window=None,
+                 warmup=0.):
+        if not isinstance(bag_reader, TopicReader):
+            raise ValueError("Passed bag_reader not a BagReader!")
+        if time_window is not None and \
+                not 0 <= time_window[0] <= time_window[1]:
+            raise ValueError("Invalid time window!")
+        if warmup < 0:
+            raise ValueError("Warm-up margin has to be positive!")
         super(BagSysIO, self).__init__()
         self._bag_reader = bag_reader
         self._input_twist = input_twist
         self._output_imu = output_imu
         self._state_odom = state_odom
+        self._time_window = time_window
+        self._warmup = warmup
 
         self._input_mask = [1, 0, 0, 0, 0, 1]
         self._output_mask = [1, 0, 0, 0, 0, 1]
         self._state_mask = [1, 1, 0, 0, 0, 1, 1, 1, 0, 0, 0, 1]
 
-        self._set_input()
-        self._set_output()
+        self._stamped_states = None
 
-    def _set_output(self):
-        if not self._output_imu:
-            raise ValueError("Output topic not defined!")
-        stamped_output = self._bag_reader.read_imu(self._output_imu)
-        self._output = self._filter(stamped_output, self._output_mask)
+        self._read_topics()
 
-    def _set_input(self):
+    def _read_topics(self):
         if not self._input_twist:
             raise ValueError("Input topic not defined!")
-        stamped_input = self._bag_reader.read_twist(self._input_twist)
-        self._input = self._filter(stamped_input, self._input_mask)
+        if not self._output_imu:
+            raise ValueError("Output topic not defined!")
+        topics = {self._input_twist: "twist", self._output_imu: "imu"}
+        if self._state_odom:
+            topics[self._state_odom] = "odom"
+        stamped_topics = self._bag_reader.read_topics(topics,
+                                                      *self._get_read_window())
+        self._input = self._filter(stamped_topics[self._input_twist],
+                                   self._input_mask)
+        self._output = self._filter(stamped_topics[self._output_imu],
+                                    self._output_mask)
+        if self._state_odom:
+            self._stamped_states = self._filter(
+                stamped_topics[self._state_odom], self._state_mask)
+
+    def get_slice(self):
+        if self._time_window is None:
+            return 0, np.inf
+        else:
+            # the slice is relative to the first read sample, which lies
+            # the (clipped) warm-up margin before the window
+            start, end = self._time_window
+            warmup = min(self._warmup, start)
+            return warmup, warmup + end - start
+
+    def _get_read_window(self):
+        if self._time_window is None:
+            return None, None
+        else:
+            # the filter already runs during the warm-up margin, so it has
+            # settled by the time the window starts
+            bag_start = self._bag_reader.get_start_time()
+            start, end = self._time_window
+            start_time = bag_start + max(start - self._warmup, 0)
+            end_time = bag_start + end if not np.isinf(end) else None
+            return start_time, end_time
 
     def get_states(self, stamped_states=None):
         if not self._state_odom:
             raise ValueError("State topic not defined!")
-        stamped_states = self._bag_reader.read_odom(self._state_odom)
-        return self._filter(stamped_states, self._state_mask)
+        return self._stamped_states
 
     @staticmethod
     def _filter(stamped_points=None, mask=None):
         if not stamped_points or not mask:
             raise ValueError
         else:
-            time, points = zip(*stamped_points)
-            mask = np.array(mask, dtype=bool)
-            filtered_stamped_points = []
-            for t, point in zip(time, points):
-                filtered_stamped_points.append(
-                    (t, tuple(compress(point, mask))))
-            return filtered_stamped_points
+            return stamped_points.select(np.array(mask, dtype=bool))
 
 
 class StateEstimator(object):
@@ -118,7 +150,7 @@ class StateEstimator(object):
         self._stamped_input = []
         self._stamped_output = []
         self._stamped_Q = []
-        self._time = []
+        self._event_table = None
 
     def get_stamped_states(self):
         return self._stamped_states
@@ -147,27 +179,26 @@ class StateEstimator(object):
             raise ValueError
         else:
             self._stamped_input = stamped_input
-            self._add_time_from_input()
+            self._event_table = None
 
     def set_u1y1_zero(self):
-        new_stamped_input = []
-        new_stamped_output = []
         if self._stamped_input and self._stamped_output:
-            for t, u in self._stamped_input:
-                u0, u1 = u
-                new_stamped_input.append((t, (u0, 0)))
-            for t, y in self._stamped_output:
-                y0, y1 = y
-                new_stamped_output.append((t, (y0, 0)))
-            self._stamped_input = new_stamped_input
-            self._stamped_output = new_stamped_output
+            input_time, U = self._get_time_values(self._stamped_input)
+            output_time, Y = self._get_time_values(self._stamped_output)
+            U = np.array(U, dtype=float)
+            Y = np.array(Y, dtype=float)
+            U[:, 1] = 0
+            Y[:, 1] = 0
+            self._stamped_input = StampedHistory.from_arrays(input_time, U)
+            self._stamped_output = StampedHistory.from_arrays(output_time, Y)
+            self._event_table = None
 
     def set_stamped_output(self, stamped_output=None):
         if not stamped_output:
             raise ValueError
         else:
             self._stamped_output = stamped_output
-            self._add_time_from_output()
+            self._event_table = None
 
     def set_stamped_Q(self, stamped_Q=None):
         self._stamped_Q = stamped_Q
@@ -194,6 +225,25 @@ class StateEstimator(object):
                 psi += 2 * np.pi * (k + 1)
             return x, y, v, a, psi, dpsi, ddpsi
 
+    @staticmethod
+    def _psi_limit(psi=None):
+        if psi is None:
+            raise ValueError
+        else:
+            k = np.abs(np.trunc(psi / (2 * np.pi)))
+            return np.where(psi > 2 * np.pi, psi - 2 * np.pi * k,
+                            np.where(psi < -2 * np.pi * k,
+                                     psi + 2 * np.pi * (k + 1), psi))
+
+    @staticmethod
+    def _psi_states_limit(states=None):
+        if states is None:
+            raise ValueError
+        else:
+            states = np.array(states, dtype=float)
+            states[..., 4] = StateEstimator._psi_limit(states[..., 4])
+            return states
+
     # @staticmethod
     # def _order_state(state=None):
     #     if not state:
@@ -202,61 +252,155 @@ class StateEstimator(object):
     #         x, y, psi, v, dpsi = state
     #         return x, y, v, psi, dpsi
 
-    def _add_time_from_output(self):
-        for t_y, _y in self._stamped_output:
-            self._time.append(t_y)
+    @staticmethod
+    def _get_time_values(stamped_data=None):
+        if stamped_data is None:
+            raise ValueError
+        elif isinstance(stamped_data, StampedHistory):
+            return stamped_data.get_time(), stamped_data.get_values()
+        else:
+            time = np.array([t for t, _data in stamped_data], dtype=float)
+            values = np.array([data for _t, data in stamped_data],
+                              dtype=float)
+            return time, values
 
-    def _add_time_from_input(self):
-        for t_u, _u in self._stamped_input:
-            self._time.append(t_u)
+    def get_event_table(self):
+        if len(self._stamped_input) <= 1 or len(self._stamped_output) <= 1:
+            raise ValueError
+        elif self._event_table is None:
+            # built once per input and output, every filter run reuses it
+            input_time, _input = self._get_time_values(self._stamped_input)
+            output_time, _output = self._get_time_values(
+                self._stamped_output)
+            self._event_table = EventTable(input_time, output_time)
+        return self._event_table
+
+    def _get_merged_input_output(self):
+        event_table = self.get_event_table()
+        _input_time, input_values = self._get_time_values(self._stamped_input)
+        _output_time, output_values = self._get_time_values(
+            self._stamped_output)
+        return (event_table.get_time(),
+                event_table.get_input(input_values),
+                event_table.get_output(output_values))
 
 
 class KalmanEstimator(StateEstimator):
 
-    def __init__(self, kalman_filter=None):
+    def __init__(self, kalman_filter=None, dtype=np.float64, smooth=False):
         if not isinstance(kalman_filter, KalmanFilter):
             raise ValueError
         else:
             super(KalmanEstimator, self).__init__()
             self._kalman_filter = kalman_filter
+            # the recorded histories may be narrower than the filter
+            self._stamped_states = StampedHistory(7, dtype=dtype)
+            self._stamped_Q = StampedHistory(2, dtype=dtype)
+            self._smooth = smooth
+            self._stamped_smoothed_states = StampedHistory(7, dtype=dtype)
+            self._filtered_event_table = None
 
     def get_stamped_states(self):
-        if len(self._stamped_states) == len(self._time):
-            return self._stamped_states
-        else:
+        if self._filtered_event_table is not self.get_event_table():
             self._run_kalman()
-            return self._stamped_states
+        return self._stamped_states
+
+    def get_stamped_smoothed_states(self):
+        if not self._smooth:
+            raise ValueError("Estimator was created without smoothing!")
+        else:
+            self.get_stamped_states()
+            return self._stamped_smoothed_states
+
+    def filter_stream(self, tuy_events=None, sink=None, Q_sink=None):
+        if tuy_events is None:
+            raise ValueError
+        if not isinstance(sink, StampedSink) or sink.get_width() != 7:
+            raise ValueError("States sink has to be a StampedSink of 7!")
+        if Q_sink is not None and (not isinstance(Q_sink, StampedSink) or
+                                   Q_sink.get_width() != 2):
+            raise ValueError("Q sink has to be a StampedSink of 2!")
+        else:
+            # events are filtered one at a time, nothing is kept besides
+            # the filter state and the bounded sinks
+            states = np.zeros(7)
+            for tuy in tuy_events:
+                self._kalman_filter.filter_iter(tuy)
+                states[:] = self._kalman_filter.get_post_states()[:, 0]
+                states[4] = self._psi_limit(states[4])
+                sink.append(tuy[0], states)
+                if Q_sink is not None:
+                    Q = self._kalman_filter.get_Q()
+                    Q_sink.append(tuy[0], (Q[0][0], Q[1][1]))
+            sink.flush()
+            if Q_sink is not None:
+                Q_sink.flush()
+            return sink
 
     def _run_kalman(self):
-        if len(self._stamped_input) <= 1 or len(self._stamped_output) <= 1:
+        time, U, Y = self._get_merged_input_output()
+        self._filtered_event_table = self._event_table
+        self._stamped_states.clear()
+        self._stamped_Q.clear()
+        states_time, states = self._stamped_states.allocate(len(time))
+        Q_time, Q = self._stamped_Q.allocate(len(time))
+        states_time[:] = time
+        Q_time[:] = time
+        # input only events just propagate the estimate, the measurement
+        # update runs once per new output sample
+        history = allocate_history(len(time)) if self._smooth else None
+        # every run starts over, not from where the last data set ended
+        self._kalman_filter.reset()
+        self._kalman_filter.filter_batch(
+            time, U, Y, states=states, Q_diag=Q,
+            has_y=self._event_table.get_has_y(), history=history)
+        if self._smooth:
+            self._stamped_smoothed_states.clear()
+            smoothed_time, smoothed = \
+                self._stamped_smoothed_states.allocate(len(time))
+            smoothed_time[:] = time
+            smoothed[:] = rts_smooth(states, history)
+            smoothed[:, 4] = self._psi_limit(smoothed[:, 4])
+        states[:, 4] = self._psi_limit(states[:, 4])
+
+
+class BatchKalmanEstimator(StateEstimator):
+
+    def __init__(self, batch_kalman_filter=None):
+        if not isinstance(batch_kalman_filter, BatchKalmanFilter):
             raise ValueError
         else:
-            u_index = 0
-            y_index = 0
-            u = (0, 0)
-            y = (0, 0)
-            stamped_states = []
-            stamped_Q = []
-            for t in np.sort(self._time):
-                last_u_t, last_u = self._stamped_input[u_index]
-                last_y_t, last_y = self._stamped_output[y_index]
-                if t == last_u_t:
-                    u = last_u
-                    if u_index != len(self._stamped_input)-1:
-                        u_index += 1
-                elif t == last_y_t:
-                    y = last_y
-                    if y_index != len(self._stamped_output)-1:
-                        y_index += 1
-                self._kalman_filter.filter_iter((t, u, y))
-                states = self._kalman_filter.get_post_states()
-                states = list(chain(*states))
-                states = self._psi_state_limit(states)
-                stamped_states.append((t, states))
-                Q = self._kalman_filter.get_Q()
-                stamped_Q.append((t, (Q[0][0], Q[1][1])))
-            self._stamped_states = stamped_states
-            self._stamped_Q = stamped_Q
+            super(BatchKalmanEstimator, self).__init__()
+            self._batch_kalman_filter = batch_kalman_filter
+            self._batch_time = None
+            self._batch_states = None
+            self._filtered_event_table = None
+
+    def get_batch_states(self):
+        if self._filtered_event_table is not self.get_event_table():
+            self._run_batch_kalman()
+        return self._batch_time, self._batch_states
+
+    def get_state_estimator(self, index=0):
+        time, batch_states = self.get_batch_states()
+        if not 0 <= index < len(batch_states):
+            raise ValueError("No filter with index {}!".format(index))
+        state_estimator = StateEstimator()
+        state_estimator.set_stamped_input(self._stamped_input)
+        state_estimator.set_stamped_output(self._stamped_output)
+        state_estimator.set_stamped_states(
+            list(zip(time, map(tuple, batch_states[index]))))
+        return state_estimator
+
+    def _run_batch_kalman(self):
+        time, U, Y = self._get_merged_input_output()
+        self._filtered_event_table = self._event_table
+        # every run starts over, not from where the last data set ended
+        self._batch_kalman_filter.reset()
+        batch_states = self._batch_kalman_filter.filter_batch(
+            time, U, Y, self._event_table.get_has_y())
+        self._batch_time = time
+        self._batch_states = self._psi_states_limit(batch_states)
 
 
 class EstimationPlots(object):
@@ -427,6 +571,7 @@ class EstimationPlots(object):
 
     @staticmethod
     def filter_butter(array, order=5, fc=1 / 50.):
+        from scipy import signal
         fs = 50
         w = fc / (fs / 2.)  # Normalize the frequency
         b, a = signal.butter(order, w, 'low', analog=False)
@@ -14,21 +14,239 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import math
 import numpy as np
-from collections import deque
 
-from moving_weighted_window import MovingWeightedWindow
+from moving_weighted_window import MovingWeightedWindow, MovingWindowBuffer
+from moving_weighted_window import get_moving_max
+
+# upper triangle of a 7x7 covariance, row by row
+_TRIU = np.triu_indices(7)
+
+
+def pack_covariances(P=None):
+    # (..., 7, 7) symmetric matrices to (..., 28) upper triangles
+    if P is None:
+        raise ValueError
+    P = np.asarray(P)
+    if P.shape[-2:] != (7, 7):
+        raise ValueError("Covariances have to be (..., 7, 7) arrays!")
+    else:
+        return P[..., _TRIU[0], _TRIU[1]]
+
+
+def unpack_covariances(P_packed=None):
+    if P_packed is None:
+        raise ValueError
+    P_packed = np.asarray(P_packed)
+    if P_packed.shape[-1] != len(_TRIU[0]):
+        raise ValueError("Packed covariances have to be (..., 28) arrays!")
+    else:
+        P = np.zeros(P_packed.shape[:-1] + (7, 7), dtype=P_packed.dtype)
+        P[..., _TRIU[0], _TRIU[1]] = P_packed
+        P[..., _TRIU[1], _TRIU[0]] = P_packed
+        return P
+
+
+def allocate_history(length=0, dtype=np.float64):
+    # x_pre (T, 7), P_pre, P_post and Phi_k (T, 7, 7) of a forward pass,
+    # what rts_smooth needs to run backwards
+    if not isinstance(length, int) or length < 1:
+        raise ValueError("Invalid history length!")
+    else:
+        return (np.zeros((length, 7), dtype),
+                np.zeros((length, 7, 7), dtype),
+                np.zeros((length, 7, 7), dtype),
+                np.zeros((length, 7, 7), dtype))
+
+
+def rts_smooth(states=None, history=None, P_smooth=None):
+    # Rauch-Tung-Striebel pass over a recorded forward pass; x_pre[k + 1]
+    # was extrapolated from x_post[k] with Phi_k, so the smoother gain is
+    # A_k = P_post[k] Phi_k^T P_pre[k + 1]^+
+    if states is None or history is None:
+        raise ValueError
+    x_pre, P_pre, P_post, Phi = history
+    states = np.asarray(states)
+    if states.shape != x_pre.shape or \
+            not P_pre.shape == P_post.shape == Phi.shape == \
+            (len(states), 7, 7):
+        raise ValueError("States and history do not match!")
+    if P_smooth is not None and P_smooth.shape != P_post.shape:
+        raise ValueError("Smoothed covariance has to be a (T, 7, 7) array!")
+    else:
+        A = np.matmul(np.matmul(P_post[:-1], np.swapaxes(Phi[:-1], 1, 2)),
+                      _pinv_symmetric(P_pre[1:]))
+        b = states[:-1] - np.matmul(A, x_pre[1:, :, np.newaxis])[..., 0]
+        smoothed = np.empty(states.shape, dtype=np.result_type(states, A))
+        smoothed[-1] = states[-1]
+        if P_smooth is None:
+            smoothed[:-1] = _backward_affine(A, b, states[-1])
+        else:
+            C = P_post[:-1] - np.matmul(np.matmul(A, P_pre[1:]),
+                                        np.swapaxes(A, 1, 2))
+            smoothed[:-1], P_smooth[:-1] = _backward_affine(
+                A, b, states[-1], C, P_post[-1])
+            P_smooth[-1] = P_post[-1]
+        return smoothed
+
+
+def _pinv_symmetric(P=None):
+    # batched pseudo inverse of positive semidefinite matrices, the prior
+    # starts at zero and only gains full rank after a few steps
+    w, V = np.linalg.eigh(P)
+    tol = w[..., -1:] * P.shape[-1] * np.finfo(P.dtype).eps
+    w_inv = np.where(w > tol, 1 / np.where(w > tol, w, 1), 0)
+    return np.matmul(V * w_inv[..., np.newaxis, :], np.swapaxes(V, -1, -2))
+
+
+def inv_2x2(S=None, out=None, mask=None):
+    # closed form inverse of a 2x2 or of stacked (..., 2, 2) matrices,
+    # np.linalg.inv would allocate; masked out matrices of a stack get a
+    # zero inverse
+    if out is None:
+        out = np.empty(S.shape)
+    if S.ndim == 2:
+        # unpacking to python floats beats indexing entry by entry
+        (s00, s01), (s10, s11) = S.tolist()
+        det = s00 * s11 - s01 * s10
+        out[0, 0] = s11 / det
+        out[0, 1] = - s01 / det
+        out[1, 0] = - s10 / det
+        out[1, 1] = s00 / det
+        return out
+    det = S[..., 0, 0] * S[..., 1, 1] - S[..., 0, 1] * S[..., 1, 0]
+    if mask is not None:
+        det = np.where(mask, det, 1)
+    out[..., 0, 0] = S[..., 1, 1] / det
+    out[..., 0, 1] = - S[..., 0, 1] / det
+    out[..., 1, 0] = - S[..., 1, 0] / det
+    out[..., 1, 1] = S[..., 0, 0] / det
+    if mask is not None:
+        out[~np.asarray(mask, dtype=bool)] = 0
+    return out
+
+
+def get_Phi(dt=None, psi=None, v_damping=0, dpsi_damping=0):
+    # Phi_k for any shape of dt and psi, as _update_Phi_k builds it from
+    # psi of the previous a posteriori estimate
+    Phi = np.zeros(np.shape(dt) + (7, 7))
+    cos_psi = np.cos(psi)
+    sin_psi = np.sin(psi)
+    Phi[..., 0, 0] = 1
+    Phi[..., 1, 1] = 1
+    Phi[..., 2, 2] = 1
+    Phi[..., 3, 2] = v_damping
+    Phi[..., 4, 4] = 1
+    Phi[..., 5, 5] = 1
+    Phi[..., 6, 5] = dpsi_damping
+    Phi[..., 0, 2] = dt * cos_psi
+    Phi[..., 0, 3] = 0.5 * dt * dt * cos_psi
+    Phi[..., 1, 2] = dt * sin_psi
+    Phi[..., 1, 3] = 0.5 * dt * dt * sin_psi
+    Phi[..., 2, 3] = dt
+    Phi[..., 4, 5] = dt
+    Phi[..., 4, 6] = 0.5 * dt * dt
+    Phi[..., 5, 6] = dt
+    return Phi
+
+
+def get_batch_arrays(t=None, U=None, Y=None, states=None, P_diag=None,
+                     Q_diag=None, has_y=None, P_packed=None, history=None):
+    # checks the arrays of a filter_batch call, the outputs have to match
+    # the length of the timeline; returns t, U, Y, states and has_y
+    t = np.ascontiguousarray(t, dtype=float)
+    U = np.ascontiguousarray(U, dtype=float)
+    Y = np.ascontiguousarray(Y, dtype=float)
+    if t.ndim != 1 or not len(t):
+        raise ValueError("Time has to be a non empty (T,) array!")
+    if U.shape != (len(t), 2) or Y.shape != (len(t), 2):
+        raise ValueError("Input and output have to be (T, 2) arrays!")
+    if states is None:
+        states = np.zeros((len(t), 7))
+    if states.shape != (len(t), 7):
+        raise ValueError("States output has to be a (T, 7) array!")
+    if P_diag is not None and P_diag.shape != (len(t), 7):
+        raise ValueError("Covariance output has to be a (T, 7) array!")
+    if P_packed is not None and P_packed.shape != (len(t), 28):
+        raise ValueError("Packed covariance output has to be (T, 28)!")
+    if Q_diag is not None and Q_diag.shape != (len(t), 2):
+        raise ValueError("Q output has to be a (T, 2) array!")
+    if history is not None and \
+            [len(array) for array in history] != [len(t)] * 4:
+        raise ValueError("History has to be allocated for T steps!")
+    return t, U, Y, states, KalmanFilter._get_has_y(has_y, len(t))
+
+
+def _backward_affine(A=None, b=None, x_last=None, C=None, P_last=None):
+    # x_k = A_k x_k+1 + b_k and P_k = A_k P_k+1 A_k^T + C_k run backwards
+    # from x_last and P_last; the timeline is cut into about sqrt(T)
+    # blocks that are composed side by side, so the python loops only run
+    # over the block length and the block count
+    n = len(A)
+    if not n:
+        return (A[:, 0], A) if C is not None else A[:, 0]
+    size = int(np.ceil(np.sqrt(n)))
+    count = -(-n // size)
+    # reversed and padded with identity steps to count * size
+    A_r = np.tile(np.identity(7, A.dtype), (count * size, 1, 1))
+    A_r[:n] = A[::-1]
+    A_r = A_r.reshape(count, size, 7, 7)
+    b_r = np.zeros((count * size, 7), b.dtype)
+    b_r[:n] = b[::-1]
+    b_r = b_r.reshape(count, size, 7, 1)
+    if C is not None:
+        C_r = np.zeros((count * size, 7, 7), C.dtype)
+        C_r[:n] = C[::-1]
+        C_r = C_r.reshape(count, size, 7, 7)
+        Z = np.zeros((count, size, 7, 7), C.dtype)
+    # block local solutions z (zero start) and products M of the A_k
+    z = np.zeros((count, size, 7, 1), b.dtype)
+    M = np.zeros((count, size, 7, 7), A.dtype)
+    z_i = np.zeros((count, 7, 1), b.dtype)
+    M_i = np.tile(np.identity(7, A.dtype), (count, 1, 1))
+    if C is not None:
+        Z_i = np.zeros((count, 7, 7), C.dtype)
+    for i in range(size):
+        A_i = A_r[:, i]
+        z_i = np.matmul(A_i, z_i) + b_r[:, i]
+        M_i = np.matmul(A_i, M_i)
+        z[:, i] = z_i
+        M[:, i] = M_i
+        if C is not None:
+            Z_i = np.matmul(np.matmul(A_i, Z_i), np.swapaxes(A_i, 1, 2)) \
+                + C_r[:, i]
+            Z[:, i] = Z_i
+    # values entering each block, then every step from its block start
+    x_start = np.zeros((count, 7, 1), z.dtype)
+    x_start[0, :, 0] = x_last
+    for j in range(count - 1):
+        x_start[j + 1] = np.dot(M[j, -1], x_start[j]) + z[j, -1]
+    x = (np.matmul(M, x_start[:, np.newaxis]) + z).reshape(-1, 7)[:n]
+    if C is None:
+        return x[::-1]
+    P_start = np.zeros((count, 7, 7), Z.dtype)
+    P_start[0] = P_last
+    for j in range(count - 1):
+        P_start[j + 1] = np.dot(np.dot(M[j, -1], P_start[j]), M[j, -1].T) \
+            + Z[j, -1]
+    P = np.matmul(np.matmul(M, P_start[:, np.newaxis]), np.swapaxes(M, 2, 3))
+    P = (P + Z).reshape(-1, 7, 7)[:n]
+    return x[::-1], P[::-1]
 
 
 class KalmanFilter(object):
 
+    kernels = ("dense", "in_place", "block", "sequential", "cholesky")
+
     def __init__(self,
                  Q_k=np.zeros((2, 2)), R_k=np.zeros((2, 2)),
                  alpha=1, beta=1,
                  mass=1,
                  length=1, width=1,
                  micro_v=1, micro_dpsi=1,
-                 x0=(0, 0, 0, 0, 0, 0, 0)):
+                 x0=(0, 0, 0, 0, 0, 0, 0),
+                 kernel="dense", dtype=np.float64):
         if not isinstance(alpha, float) and not isinstance(alpha, int):
             raise ValueError("Alpha is a number!")
         if not isinstance(beta, float) and not isinstance(beta, int):
@@ -45,6 +263,19 @@ class KalmanFilter(object):
             raise ValueError("Q_k or R_k covariance underdefined!")
         if np.array(x0).shape != (7, ):
             raise ValueError("Incorrect shape for x0!")
+        if kernel not in KalmanFilter.kernels:
+            raise ValueError("Unknown kernel {}!".format(kernel))
+        if np.dtype(dtype) not in (np.float32, np.float64):
+            raise ValueError("Filters run in float32 or float64!")
+        if kernel == "dense" and np.dtype(dtype) != np.float64:
+            # the dense kernel builds float64 temporaries every step, the
+            # in_place kernel runs the same products in the given dtype
+            kernel = "in_place"
+        if kernel == "sequential" and \
+                np.count_nonzero(R_k - np.diag(R_k.diagonal())):
+            raise ValueError("Sequential kernel needs a diagonal R_k!")
+        self._kernel = kernel
+        self._dtype = np.dtype(dtype)
         self._alpha = alpha
         self._beta = beta
         self._mass = mass
@@ -53,71 +284,180 @@ class KalmanFilter(object):
         self._J = (mass * (length * length + width * width)) / 12
         self._micro_v = micro_v
         self._micro_dpsi = micro_dpsi
-        self._R_k = R_k  # Observation Covariance Matrix
-        self._Q_k = Q_k  # Process Covariance Matrix
+        self._R_k = np.asarray(R_k, self._dtype)  # Observation Covariance
+        self._Q_k = np.asarray(Q_k, self._dtype)  # Process Covariance
         self._x0 = np.array(x0).reshape((7, 1))  # Initial State Vector
 
-        self._u_k = np.zeros((2, 1))  # Input Vector
-        self._y_k = np.zeros((2, 1))  # Measurement Vector
-        self._L_k = np.zeros((7, 2))  # Kalman Gain Matrix
-
-        self._x_k_pre = self._x0  # A Priori state vector
-        self._x_k_post = np.zeros((7, 1))  # A Posteriori state vector
-        self._x_k_extr = np.zeros((7, 1))  # Extrapolated state vector
-
-        # A Priori Parameter Covariance Matrix
-        self._P_k_pre = np.zeros((7, 7))
-        # A Posteriori Parameter Covariance Matrix
-        self._P_k_post = np.zeros((7, 7))
-        # Extrapolated Parameter Covariance Matrix
-        self._P_k_extr = np.zeros((7, 7))
-
-        self._Phi_k = np.zeros((7, 7))  # Dynamic Coefficient Matrix
-        self._Gamma_k = np.zeros((7, 2))  # Input Coupling Matrix
+        # Input Coupling Matrix
+        self._Gamma_k = np.zeros((7, 2), self._dtype)
         self._Gamma_k[3][0] = self._alpha / self._mass
         self._Gamma_k[6][1] = self._beta / self._J
-        self._G_k = np.zeros((7, 2))  # Process Noise Input Coupling Matrix
+        # Process Noise Input Coupling Matrix
+        self._G_k = np.zeros((7, 2), self._dtype)
         self._G_k[3][0] = self._alpha / self._mass
         self._G_k[6][1] = self._beta / self._J
 
-        self._C_k = np.zeros((2, 7))  # Measurement Sensitivity Matrix
+        # Measurement Sensitivity Matrix
+        self._C_k = np.zeros((2, 7), self._dtype)
         self._C_k[0][3] = 1
         self._C_k[1][5] = 1
-        self._D_k = np.zeros((2, 2))  # Output Coupling Matrix
-        self._H_k = np.zeros((2, 2))  # Process Noise Output Coupling Matrix
+        # Output Coupling Matrix
+        self._D_k = np.zeros((2, 2), self._dtype)
+        # Process Noise Output Coupling Matrix
+        self._H_k = np.zeros((2, 2), self._dtype)
+
+        self._set_states()
+        if self._kernel != "dense":
+            self._set_workspace()
+
+    def _set_states(self):
+        self._u_k = np.zeros((2, 1), self._dtype)  # Input Vector
+        self._y_k = np.zeros((2, 1), self._dtype)  # Measurement Vector
+        self._L_k = np.zeros((7, 2), self._dtype)  # Kalman Gain Matrix
+
+        self._x_k_pre = self._x0  # A Priori state vector
+        # A Posteriori state vector
+        self._x_k_post = np.zeros((7, 1), self._dtype)
+        # Extrapolated state vector
+        self._x_k_extr = np.zeros((7, 1), self._dtype)
+
+        # A Priori Parameter Covariance Matrix
+        self._P_k_pre = np.zeros((7, 7), self._dtype)
+        # A Posteriori Parameter Covariance Matrix
+        self._P_k_post = np.zeros((7, 7), self._dtype)
+        # Extrapolated Parameter Covariance Matrix
+        self._P_k_extr = np.zeros((7, 7), self._dtype)
+
+        # Dynamic Coefficient Matrix
+        self._Phi_k = np.zeros((7, 7), self._dtype)
 
         self._dt = 0
         self._t = 0
 
+    def reset(self):
+        # back to x0 with a zero covariance at t = 0, like a new filter
+        self._set_states()
+        if self._kernel != "dense":
+            self._set_workspace()
+
     def filter_iter(self, tuy=(None, None, None)):
         if not isinstance(tuy, tuple) and not isinstance(tuy, list):
             raise ValueError("Iteration input is not a list or a tuple!")
         if not any(tuy):
             raise ValueError("Iteration input contains an empty element!")
         t, u, y = tuy
+        self._step(t, u, y)
+
+    def filter_batch(self, t=None, U=None, Y=None,
+                     states=None, P_diag=None, Q_diag=None, has_y=None,
+                     P_packed=None, history=None):
+        t, U, Y, states, has_y = get_batch_arrays(
+            t, U, Y, states, P_diag, Q_diag, has_y, P_packed, history)
+        # python floats keep the scalar dt arithmetic cheap
+        for k, t_k in enumerate(t.tolist()):
+            if history is not None:
+                history[0][k] = self._x_k_pre[:, 0]
+                history[1][k] = self.get_pre_covariance()
+            self._step(t_k, U[k], Y[k] if has_y[k] else None)
+            states[k] = self._x_k_post[:, 0]
+            if history is not None:
+                history[2][k] = self.get_post_covariance()
+                history[3][k] = self._Phi_k
+            if P_diag is not None or P_packed is not None:
+                P_post = self.get_post_covariance()
+                if P_diag is not None:
+                    P_diag[k] = P_post.diagonal()
+                if P_packed is not None:
+                    P_packed[k] = P_post[_TRIU]
+            if Q_diag is not None:
+                Q_diag[k, 0] = self._Q_k[0, 0]
+                Q_diag[k, 1] = self._Q_k[1, 1]
+        return states
+
+    @staticmethod
+    def _get_has_y(has_y=None, length=0):
+        if has_y is None:
+            return [True] * length
+        has_y = np.asarray(has_y, dtype=bool)
+        if has_y.shape != (length, ):
+            raise ValueError("Measurement mask has to be a (T,) array!")
+        else:
+            return has_y.tolist()
+
+    def _step(self, t, u, y):
+        # y is None for events without a new measurement, those only run
+        # the time update
         self._dt = t - self._t
         self._t = t
 
-        self._u_k[0] = u[0]
-        self._u_k[1] = u[1]
-        self._y_k[0] = y[0]
-        self._y_k[1] = y[1]
+        self._u_k[:, 0] = u
+        update = y is not None
+        if update:
+            self._y_k[:, 0] = y
 
         # execute iteration steps
-        self._update_Phi_k()
-        self._set_gain()
-        self._update_states()
-        self._update_error_covars()
-        self._extr_states()
-        self._extr_error_covars()
-        self._setup_next_iter()
+        if self._kernel == "in_place":
+            self._iter_in_place(update)
+        elif self._kernel == "block":
+            self._iter_block(update)
+        elif self._kernel == "sequential":
+            self._iter_sequential(update)
+        elif self._kernel == "cholesky":
+            self._iter_cholesky(update)
+        else:
+            self._update_Phi_k()
+            if update:
+                self._set_gain()
+                self._update_states()
+                self._update_error_covars()
+            else:
+                self._skip_update()
+            self._extr_states()
+            self._extr_error_covars()
+            self._setup_next_iter()
+
+    def get_pre_states(self):
+        return self._x_k_pre
 
     def get_post_states(self):
         return self._x_k_post
 
+    def get_time(self):
+        # stamp of the last step, the next one starts from here
+        return self._t
+
     def get_Q(self):
         return tuple(self._Q_k)
 
+    def get_model(self):
+        # the matrices that stay fixed while filtering, Phi_k follows from
+        # get_Phi with the two damping terms
+        return {"Gamma": self._Gamma_k, "G": self._G_k,
+                "C": self._C_k, "D": self._D_k,
+                "H": self._H_k, "R": self._R_k,
+                "v_damping": - self._micro_v / self._mass,
+                "dpsi_damping": - self._micro_dpsi / self._J}
+
+    def get_pre_covariance(self):
+        if self._kernel == "cholesky":
+            return np.dot(self._S_k_pre, self._S_k_pre.T)
+        else:
+            return self._P_k_pre
+
+    def get_post_covariance(self):
+        if self._kernel == "cholesky":
+            return np.dot(self._S_k_post, self._S_k_post.T)
+        else:
+            return self._P_k_post
+
+    def smooth_batch(self, t=None, U=None, Y=None, has_y=None,
+                     P_smooth=None):
+        # forward pass recording its priors, then the RTS backward pass
+        t = np.asarray(t, dtype=float)
+        history = allocate_history(len(t), self._dtype)
+        states = self.filter_batch(t, U, Y, has_y=has_y, history=history)
+        return rts_smooth(states, history, P_smooth)
+
     def _update_Phi_k(self):
         self._Phi_k = np.array([
             [1, 0,
@@ -151,6 +491,15 @@ class KalmanFilter(object):
         self._P_k_post = \
             (np.identity(7) - self._L_k.dot(self._C_k)).dot(self._P_k_pre)
 
+    def _skip_update(self):
+        # without a measurement the a posteriori estimate is the a priori
+        if self._kernel == "dense":
+            self._x_k_post = self._x_k_pre
+            self._P_k_post = self._P_k_pre
+        else:
+            np.copyto(self._x_k_post, self._x_k_pre)
+            np.copyto(self._P_k_post, self._P_k_pre)
+
     def _extr_states(self):
         self._x_k_extr = \
             self._Phi_k.dot(self._x_k_post) + self._Gamma_k.dot(self._u_k)
@@ -163,6 +512,300 @@ class KalmanFilter(object):
         self._x_k_pre = self._x_k_extr
         self._P_k_pre = self._P_k_extr
 
+    def _set_workspace(self):
+        # every buffer used by _iter_in_place is allocated once here
+        self._x_k_pre = self._x0.astype(self._dtype)
+        self._Phi_k[0][0] = 1
+        self._Phi_k[1][1] = 1
+        self._Phi_k[2][2] = 1
+        self._Phi_k[3][2] = - self._micro_v / self._mass
+        self._Phi_k[4][4] = 1
+        self._Phi_k[5][5] = 1
+        self._Phi_k[6][5] = - self._micro_dpsi / self._J
+        self._I_k = np.identity(7, self._dtype)
+        self._PC_T_k = np.zeros((7, 2), self._dtype)
+        self._S_k = np.zeros((2, 2), self._dtype)
+        self._S_k_inv = np.zeros((2, 2), self._dtype)
+        self._HQ_k = np.zeros((2, 2), self._dtype)
+        self._HQH_k = np.zeros((2, 2), self._dtype)
+        self._GQ_k = np.zeros((7, 2), self._dtype)
+        self._GQG_k = np.zeros((7, 7), self._dtype)
+        self._e_k = np.zeros((2, 1), self._dtype)  # Innovation Vector
+        self._Cx_k = np.zeros((2, 1), self._dtype)
+        self._Du_k = np.zeros((2, 1), self._dtype)
+        self._Gu_k = np.zeros((7, 1), self._dtype)
+        self._Lx_k = np.zeros((7, 1), self._dtype)
+        self._LC_k = np.zeros((7, 7), self._dtype)
+        self._PhiP_k = np.zeros((7, 7), self._dtype)
+        self._PhiPPhi_T_k = np.zeros((7, 7), self._dtype)
+        if self._kernel == "block":
+            self._set_block_views()
+        self._Pc_k = np.zeros(7, self._dtype)
+        self._PcPc_k = np.zeros((7, 7), self._dtype)
+        if self._kernel == "cholesky":
+            self._set_cholesky_workspace()
+        # rows of C_k picking a single state read P and x directly
+        self._C_columns = [
+            int(np.flatnonzero(c)[0])
+            if np.count_nonzero(c) == 1 and c.sum() == 1 else None
+            for c in self._C_k]
+
+    def _iter_in_place(self, update=True):
+        self._update_Phi_k_in_place()
+        if update:
+            self._set_gain_in_place()
+            self._update_states_in_place()
+            self._update_error_covars_in_place()
+        else:
+            self._skip_update()
+        self._extr_states_in_place()
+        self._extr_error_covars_in_place()
+        self._setup_next_iter_in_place()
+
+    def _update_Phi_k_in_place(self):
+        dt = self._dt
+        cos_psi = math.cos(self._x_k_post[4, 0])
+        sin_psi = math.sin(self._x_k_post[4, 0])
+        self._Phi_k[0, 2] = dt * cos_psi
+        self._Phi_k[0, 3] = 0.5 * dt * dt * cos_psi
+        self._Phi_k[1, 2] = dt * sin_psi
+        self._Phi_k[1, 3] = 0.5 * dt * dt * sin_psi
+        self._Phi_k[2, 3] = dt
+        self._Phi_k[4, 5] = dt
+        self._Phi_k[4, 6] = 0.5 * dt * dt
+        self._Phi_k[5, 6] = dt
+
+    def _set_gain_in_place(self):
+        np.dot(self._P_k_pre, self._C_k.T, out=self._PC_T_k)
+        np.dot(self._C_k, self._PC_T_k, out=self._S_k)
+        np.dot(self._H_k, self._Q_k, out=self._HQ_k)
+        np.dot(self._HQ_k, self._H_k.T, out=self._HQH_k)
+        self._S_k += self._HQH_k
+        self._S_k += self._R_k
+        inv_2x2(self._S_k, self._S_k_inv)
+        np.dot(self._PC_T_k, self._S_k_inv, out=self._L_k)
+
+    def _update_states_in_place(self):
+        np.dot(self._C_k, self._x_k_pre, out=self._Cx_k)
+        np.dot(self._D_k, self._u_k, out=self._Du_k)
+        np.subtract(self._y_k, self._Cx_k, out=self._e_k)
+        self._e_k -= self._Du_k
+        np.dot(self._L_k, self._e_k, out=self._Lx_k)
+        np.add(self._x_k_pre, self._Lx_k, out=self._x_k_post)
+
+    def _update_error_covars_in_place(self):
+        np.dot(self._L_k, self._C_k, out=self._LC_k)
+        np.subtract(self._I_k, self._LC_k, out=self._LC_k)
+        np.dot(self._LC_k, self._P_k_pre, out=self._P_k_post)
+
+    def _extr_states_in_place(self):
+        np.dot(self._Phi_k, self._x_k_post, out=self._x_k_extr)
+        np.dot(self._Gamma_k, self._u_k, out=self._Gu_k)
+        self._x_k_extr += self._Gu_k
+
+    def _extr_error_covars_in_place(self):
+        np.dot(self._Phi_k, self._P_k_post, out=self._PhiP_k)
+        np.dot(self._PhiP_k, self._Phi_k.T, out=self._P_k_extr)
+        np.dot(self._G_k, self._Q_k, out=self._GQ_k)
+        np.dot(self._GQ_k, self._G_k.T, out=self._GQG_k)
+        self._P_k_extr += self._GQG_k
+
+    def _setup_next_iter_in_place(self):
+        # swap the buffers instead of rebinding to fresh arrays
+        self._x_k_pre, self._x_k_extr = self._x_k_extr, self._x_k_pre
+        self._P_k_pre, self._P_k_extr = self._P_k_extr, self._P_k_pre
+
+    def _iter_block(self, update=True):
+        self._update_Phi_k_in_place()
+        if update:
+            self._set_gain_block()
+            self._update_states_block()
+            self._update_error_covars_block()
+        else:
+            self._skip_update()
+        # blocking a 7x1 product saves less than the extra calls cost
+        self._extr_states_in_place()
+        self._extr_error_covars_block()
+        self._setup_next_iter_block()
+
+    def _iter_sequential(self, update=True):
+        self._update_Phi_k_in_place()
+        if update:
+            self._update_sequential()
+        else:
+            self._skip_update()
+        self._extr_states_in_place()
+        self._extr_error_covars_in_place()
+        self._setup_next_iter_in_place()
+
+    def _update_sequential(self):
+        # with a diagonal R_k and a zero H_k the rows of C_k are independent
+        # measurements, each one is a scalar update without any inverse;
+        # channels with a NaN sample are left out
+        np.copyto(self._x_k_post, self._x_k_pre)
+        np.copyto(self._P_k_post, self._P_k_pre)
+        np.dot(self._D_k, self._u_k, out=self._Du_k)
+        x = self._x_k_post[:, 0]
+        Pc = self._Pc_k
+        for i, j in enumerate(self._C_columns):
+            y = self._y_k[i, 0]
+            if y != y:
+                continue
+            if j is None:
+                c = self._C_k[i]
+                np.dot(self._P_k_post, c, out=Pc)
+                s = c.dot(Pc) + self._R_k[i, i]
+                e = y - c.dot(x) - self._Du_k[i, 0]
+            else:
+                np.copyto(Pc, self._P_k_post[:, j])
+                s = Pc[j] + self._R_k[i, i]
+                e = y - x[j] - self._Du_k[i, 0]
+            x += Pc * (e / s)
+            # P - (P c) (P c)^T / s
+            np.multiply(Pc[:, np.newaxis], Pc / s, out=self._PcPc_k)
+            self._P_k_post -= self._PcPc_k
+
+    def _set_cholesky_workspace(self):
+        # lower factors S with P = S S^T replace the covariances, P_0 = 0
+        # has the zero factor
+        self._S_k_pre = np.zeros((7, 7), self._dtype)
+        self._S_k_post = np.zeros((7, 7), self._dtype)
+        self._S_k_extr = np.zeros((7, 7), self._dtype)
+        # H_k is zero, so the measurement noise factor stays fixed
+        self._R_k_sqrt = np.linalg.cholesky(self._R_k)
+        self._update_array = np.zeros((9, 9), self._dtype)
+        self._update_array[:2, :2] = self._R_k_sqrt
+        self._extr_array = np.zeros((7, 9), self._dtype)
+        # G Q^1/2 only changes when Q_k is replaced, as the adaptive
+        # filters do every step
+        self._set_Q_factor()
+
+    def _set_Q_factor(self):
+        # any factor of Q works, the one from its symmetric part also
+        # takes a semidefinite Q, which a Cholesky factorization rejects
+        Q = 0.5 * (self._Q_k + self._Q_k.T)
+        w, V = np.linalg.eigh(Q)
+        if w[0] < - np.finfo(self._dtype).eps * 16 * max(w[-1], 0.):
+            raise ValueError("Q_k is not positive semidefinite!")
+        self._extr_array[:, 7:] = np.dot(self._G_k,
+                                         V * np.sqrt(np.maximum(w, 0)))
+        self._Q_k_factored = self._Q_k
+
+    def _iter_cholesky(self, update=True):
+        self._update_Phi_k_in_place()
+        if update:
+            self._update_cholesky()
+        else:
+            np.copyto(self._x_k_post, self._x_k_pre)
+            np.copyto(self._S_k_post, self._S_k_pre)
+        self._extr_states_in_place()
+        self._extr_factor_cholesky()
+        # swap the buffers instead of rebinding to fresh arrays
+        self._x_k_pre, self._x_k_extr = self._x_k_extr, self._x_k_pre
+        self._S_k_pre, self._S_k_extr = self._S_k_extr, self._S_k_pre
+
+    def _update_cholesky(self):
+        # square root measurement update: a QR turns [[R^1/2, C S], [0, S]]
+        # into the lower triangular [[S_y, 0], [P C^T S_y^-T, S_post]],
+        # S_y S_y^T being the innovation covariance
+        A = self._update_array
+        A[:2, 2:] = np.dot(self._C_k, self._S_k_pre)
+        A[2:, 2:] = self._S_k_pre
+        B = np.linalg.qr(A.T, mode='r').T
+        np.copyto(self._S_k_post, B[2:, 2:])
+        np.dot(self._C_k, self._x_k_pre, out=self._Cx_k)
+        np.dot(self._D_k, self._u_k, out=self._Du_k)
+        np.subtract(self._y_k, self._Cx_k, out=self._e_k)
+        self._e_k -= self._Du_k
+        # L e = (P C^T S_y^-T) S_y^-1 e, a triangular 2x2 solve
+        np.dot(B[2:, :2], np.linalg.solve(B[:2, :2], self._e_k),
+               out=self._Lx_k)
+        np.add(self._x_k_pre, self._Lx_k, out=self._x_k_post)
+
+    def _extr_factor_cholesky(self):
+        # Phi P Phi^T + G Q G^T = M M^T with M = [Phi S, G Q^1/2]
+        M = self._extr_array
+        M[:, :7] = np.dot(self._Phi_k, self._S_k_post)
+        if self._Q_k is not self._Q_k_factored:
+            self._set_Q_factor()
+        np.copyto(self._S_k_extr, np.linalg.qr(M.T, mode='r').T)
+
+    def _set_block_views(self):
+        # Phi_k is block diagonal in (x, y, v, a) and (psi, dpsi, ddpsi),
+        # C_k only picks a and dpsi (3:6:2), G_k only drives a and ddpsi
+        # (3:7:3); all views point into the fixed buffers
+        self._Phi_k_lon = self._Phi_k[:4, :4]
+        self._Phi_k_psi = self._Phi_k[4:, 4:]
+        # views of both the a priori and the extrapolated buffers, they are
+        # swapped along with the buffers
+        self._pre_views = self._get_block_views(self._x_k_pre, self._P_k_pre)
+        self._extr_views = self._get_block_views(self._x_k_extr,
+                                                 self._P_k_extr)
+        self._set_pre_extr_views()
+        self._P_post_lon = self._P_k_post[:4]
+        self._P_post_psi = self._P_k_post[4:]
+        self._PhiP_lon = self._PhiP_k[:4]
+        self._PhiP_psi = self._PhiP_k[4:]
+        self._PhiP_lon_T = self._PhiP_k[:, :4].T
+        self._PhiP_psi_T = self._PhiP_k[:, 4:].T
+        self._PhiPPhi_T_lon = self._PhiPPhi_T_k[:4]
+        self._PhiPPhi_T_psi = self._PhiPPhi_T_k[4:]
+        G_G = np.array([self._G_k[3][0], self._G_k[6][1]], self._dtype)
+        self._GG_T_k = np.outer(G_G, G_G)
+        self._GQG_G = np.zeros((2, 2), self._dtype)
+        self._has_H_k = bool(np.count_nonzero(self._H_k))
+        self._has_D_k = bool(np.count_nonzero(self._D_k))
+
+    @staticmethod
+    def _get_block_views(x=None, P=None):
+        # C x, P C^T, C P, C P C^T and the G Q G^T block of P
+        return (x[3:6:2], P[:, 3:6:2], P[3:6:2], P[3:6:2, 3:6:2],
+                P[3:7:3, 3:7:3])
+
+    def _set_pre_extr_views(self):
+        self._Cx_pre, self._PC_T_pre, self._CP_pre, self._CPC_T_pre, \
+            _P_G = self._pre_views
+        self._P_extr_G = self._extr_views[4]
+
+    def _set_gain_block(self):
+        # P C^T and C P C^T are views of P, no products needed
+        np.add(self._CPC_T_pre, self._R_k, out=self._S_k)
+        if self._has_H_k:
+            np.dot(self._H_k, self._Q_k, out=self._HQ_k)
+            np.dot(self._HQ_k, self._H_k.T, out=self._HQH_k)
+            self._S_k += self._HQH_k
+        inv_2x2(self._S_k, self._S_k_inv)
+        np.dot(self._PC_T_pre, self._S_k_inv, out=self._L_k)
+
+    def _update_states_block(self):
+        np.subtract(self._y_k, self._Cx_pre, out=self._e_k)
+        if self._has_D_k:
+            np.dot(self._D_k, self._u_k, out=self._Du_k)
+            self._e_k -= self._Du_k
+        np.dot(self._L_k, self._e_k, out=self._Lx_k)
+        np.add(self._x_k_pre, self._Lx_k, out=self._x_k_post)
+
+    def _update_error_covars_block(self):
+        # (I - L C) P = P - L (C P)
+        np.dot(self._L_k, self._CP_pre, out=self._LC_k)
+        np.subtract(self._P_k_pre, self._LC_k, out=self._P_k_post)
+
+    def _extr_error_covars_block(self):
+        # Phi P Phi^T = (Phi (Phi P)^T)^T, blockwise on both sides
+        np.dot(self._Phi_k_lon, self._P_post_lon, out=self._PhiP_lon)
+        np.dot(self._Phi_k_psi, self._P_post_psi, out=self._PhiP_psi)
+        np.dot(self._Phi_k_lon, self._PhiP_lon_T, out=self._PhiPPhi_T_lon)
+        np.dot(self._Phi_k_psi, self._PhiP_psi_T, out=self._PhiPPhi_T_psi)
+        np.copyto(self._P_k_extr, self._PhiPPhi_T_k.T)
+        np.multiply(self._GG_T_k, self._Q_k, out=self._GQG_G)
+        self._P_extr_G += self._GQG_G
+
+    def _setup_next_iter_block(self):
+        self._setup_next_iter_in_place()
+        self._pre_views, self._extr_views = \
+            self._extr_views, self._pre_views
+        self._set_pre_extr_views()
+
 
 class AdaptiveKalmanFilter(KalmanFilter):
 
@@ -173,7 +816,8 @@ class AdaptiveKalmanFilter(KalmanFilter):
                  length=1, width=1,
                  micro_v=1, micro_dpsi=1,
                  window=None, M_k=np.zeros((2, 2)),
-                 x0=(0, 0, 0, 0, 0, 0, 0)):
+                 x0=(0, 0, 0, 0, 0, 0, 0),
+                 kernel="dense", offline=False, dtype=np.float64):
         if not isinstance(window, MovingWeightedWindow):
             raise ValueError("Window is not a MovingWeightedWindow object!")
         if np.count_nonzero(M_k) < 2:
@@ -184,37 +828,298 @@ class AdaptiveKalmanFilter(KalmanFilter):
             mass=mass,
             length=1, width=1,
             micro_v=micro_v, micro_dpsi=micro_dpsi,
-            x0=x0)
+            x0=x0, kernel=kernel, dtype=dtype)
         self._window = window
         self._M_k = M_k
-        self._Lambda_k = np.identity(2)
+        self._Q_k_0 = self._Q_k
         self._Ro_k = self._Q_k.dot(np.linalg.inv(self._R_k))
+        self._offline = offline
+        self._Q_schedule = None
+        self._set_adaptive_states()
+
+    def _set_adaptive_states(self):
+        self._Q_k = self._Q_k_0
+        self._Lambda_k = np.identity(2, self._dtype)
+        # recursive windows keep their weighted sum in a few pole states,
+        # the buffers then only track the window maxima
         self._du_buffer = [
-            deque([], self._window.get_size()),
-            deque([], self._window.get_size())]
+            MovingWindowBuffer(self._window.get_size(),
+                               not self._window.is_recursive()),
+            MovingWindowBuffer(self._window.get_size(),
+                               not self._window.is_recursive())]
+        if self._window.is_recursive():
+            self._du_sum_state = self._window.get_initial_state()
+        self._du_sum = 0
         self._last_u = (0, 0)
 
+    def reset(self):
+        # the input history and Q start over as well
+        super(AdaptiveKalmanFilter, self).reset()
+        self._set_adaptive_states()
+
+    def filter_batch(self, t=None, U=None, Y=None,
+                     states=None, P_diag=None, Q_diag=None, has_y=None,
+                     P_packed=None, history=None):
+        if not self._offline:
+            return super(AdaptiveKalmanFilter, self).filter_batch(
+                t, U, Y, states, P_diag, Q_diag, has_y, P_packed, history)
+        U = np.ascontiguousarray(U, dtype=float)
+        self._check_input(U)
+        Lambda = self._get_Lambda_schedule(U)
+        Q_schedule = self._get_Q_schedule(Lambda)
+        if Q_diag is not None and Q_diag.shape != (len(U), 2):
+            raise ValueError("Q output has to be a (T, 2) array!")
+        self._Q_schedule = iter(Q_schedule.astype(self._dtype))
+        try:
+            states = super(AdaptiveKalmanFilter, self).filter_batch(
+                t, U, Y, states, P_diag, has_y=has_y, P_packed=P_packed,
+                history=history)
+        finally:
+            self._Q_schedule = None
+        if Q_diag is not None:
+            Q_diag[:, 0] = Q_schedule[:, 0, 0]
+            Q_diag[:, 1] = Q_schedule[:, 1, 1]
+        self._set_du_history(U)
+        self._Lambda_k = np.diag(Lambda[-1]).astype(self._dtype)
+        return states
+
+    def get_Q_schedule(self, U=None):
+        U = np.asarray(U, dtype=float)
+        self._check_input(U)
+        return self._get_Q_schedule(self._get_Lambda_schedule(U))
+
+    @staticmethod
+    def _check_input(U=None):
+        if U.ndim != 2 or U.shape[1] != 2 or not len(U):
+            raise ValueError("Input has to be a non empty (T, 2) array!")
+
+    def _get_Q_schedule(self, Lambda=None):
+        # Lambda_k is diagonal, so Lambda_k Ro_k only scales rows of Ro_k
+        Lambda_Ro = Lambda[:, :, np.newaxis] * self._Ro_k[np.newaxis]
+        return np.matmul(Lambda_Ro, self._R_k)
+
+    def _get_Lambda_schedule(self, U=None):
+        size = self._window.get_size()
+        du = np.abs(np.diff(np.vstack((self._last_u, U)), axis=0))
+        du_history = [
+            np.concatenate((self._du_buffer[i].get_max_view(), du[:, i]))
+            for i in range(2)]
+        Lambda = np.empty((len(U), 2))
+        Lambda[:] = self._Lambda_k.diagonal()
+        # sample k adapts once the buffer holds a full window
+        first = max(size - len(self._du_buffer[0]) - 1, 0)
+        if first < len(U):
+            start = len(self._du_buffer[0]) + first - size + 1
+            if self._window.is_recursive():
+                weighted_sums = self._window.filter(
+                    du[:, 0], self._du_sum_state.copy())[first:]
+            else:
+                weighted_sums = self._window.get_moving_weighted_sums(
+                    du_history[0])[start:]
+            # |du| is non negative, so is its weighted sum; rounding in the
+            # recursive windows must not shrink Q below Ro R
+            weighted_sums = np.maximum(weighted_sums, 0)
+            for i in range(2):
+                du_max = get_moving_max(du_history[i], size)[start:]
+                Lambda_i = np.ones(len(du_max))
+                adapt = du_max != 0.0
+                Lambda_i[adapt] = 1 \
+                    + self._M_k[i][i] / du_max[adapt] \
+                    * weighted_sums[adapt]
+                Lambda[first:, i] = Lambda_i
+        return Lambda
+
+    def _set_du_history(self, U=None):
+        size = self._window.get_size()
+        last_U = np.vstack((self._last_u, U))[-size - 1:]
+        for du in np.abs(np.diff(last_U, axis=0)):
+            self._du_buffer[0].append(du[0])
+            self._du_buffer[1].append(du[1])
+        if self._window.is_recursive():
+            du = np.abs(np.diff(np.vstack((self._last_u, U)), axis=0))
+            self._du_sum = self._window.filter(
+                du[:, 0], self._du_sum_state)[-1]
+        self._last_u = (U[-1][0], U[-1][1])
+
+    def _step(self, t, u, y):
+        if self._Q_schedule is not None:
+            self._Q_k = next(self._Q_schedule)
+        else:
+            du = abs(u[0] - self._last_u[0])
+            self._du_buffer[0].append(du)
+            self._du_buffer[1].append(abs(u[1] - self._last_u[1]))
+            if self._window.is_recursive():
+                self._du_sum = self._window.update(self._du_sum_state, du)
+            self._last_u = (u[0], u[1])
+            self._adapt_covariance()
+        super(AdaptiveKalmanFilter, self)._step(t, u, y)
+
+    def _adapt_covariance(self):
+        if len(self._du_buffer[0]) >= self._window.get_size():
+            self._Lambda_k = np.identity(2, self._dtype)
+            if self._window.is_recursive():
+                weighted_sum = self._du_sum
+            else:
+                weighted_sum = self._window.get_weighted_sum(
+                    self._du_buffer[0].get_view())
+            weighted_sum = max(weighted_sum, 0)
+            du_max = self._du_buffer[0].get_max()
+            if du_max != 0.0:
+                self._Lambda_k[0][0] = 1 \
+                    + self._M_k[0][0] / du_max * weighted_sum
+            du_max = self._du_buffer[1].get_max()
+            if du_max != 0.0:
+                self._Lambda_k[1][1] = 1 \
+                    + self._M_k[1][1] / du_max * weighted_sum
+        self._Q_k = self._Lambda_k.dot(self._Ro_k).dot(self._R_k)
+
+
+class BatchKalmanFilter(object):
+
+    def __init__(self, kalman_filters=[]):
+        if not isinstance(kalman_filters, list) or not kalman_filters:
+            raise ValueError("Pass a non empty list of KalmanFilter!")
+        if not all(type(kf) is KalmanFilter for kf in kalman_filters):
+            raise ValueError("Pass a list only containing KalmanFilter!")
+        self._N = len(kalman_filters)
+
+        self._R_k = np.array([kf._R_k for kf in kalman_filters])
+        self._Q_k = np.array([kf._Q_k for kf in kalman_filters])
+        self._x0 = np.array([kf._x0 for kf in kalman_filters])
+        self._Gamma_k = np.array([kf._Gamma_k for kf in kalman_filters])
+        self._G_k = np.array([kf._G_k for kf in kalman_filters])
+        self._C_k = np.array([kf._C_k for kf in kalman_filters])
+        self._D_k = np.array([kf._D_k for kf in kalman_filters])
+        self._H_k = np.array([kf._H_k for kf in kalman_filters])
+        self._GQG_k = np.matmul(np.matmul(self._G_k, self._Q_k),
+                                np.swapaxes(self._G_k, 1, 2))
+        self._HQH_k = np.matmul(np.matmul(self._H_k, self._Q_k),
+                                np.swapaxes(self._H_k, 1, 2))
+        self._v_damping = np.array(
+            [- kf._micro_v / kf._mass for kf in kalman_filters])
+        self._dpsi_damping = np.array(
+            [- kf._micro_dpsi / kf._J for kf in kalman_filters])
+
+        self._set_states()
+
+        # only the dt, cos and sin entries change between iterations
+        self._Phi_k = np.zeros((self._N, 7, 7))
+        self._Phi_k[:, 0, 0] = 1
+        self._Phi_k[:, 1, 1] = 1
+        self._Phi_k[:, 2, 2] = 1
+        self._Phi_k[:, 3, 2] = self._v_damping
+        self._Phi_k[:, 4, 4] = 1
+        self._Phi_k[:, 5, 5] = 1
+        self._Phi_k[:, 6, 5] = self._dpsi_damping
+
+    def _set_states(self):
+        self._u_k = np.zeros((2, 1))  # Input Vector, shared by all filters
+        self._y_k = np.zeros((2, 1))  # Measurement Vector, shared too
+        self._L_k = np.zeros((self._N, 7, 2))
+
+        self._x_k_pre = self._x0.copy()
+        self._x_k_post = np.zeros((self._N, 7, 1))
+        self._x_k_extr = np.zeros((self._N, 7, 1))
+
+        self._P_k_pre = np.zeros((self._N, 7, 7))
+        self._P_k_post = np.zeros((self._N, 7, 7))
+        self._P_k_extr = np.zeros((self._N, 7, 7))
+
+        self._dt = 0
+        self._t = 0
+
+    def reset(self):
+        # back to x0 with a zero covariance at t = 0, like a new filter
+        self._set_states()
+
+    def get_size(self):
+        return self._N
+
+    def get_post_states(self):
+        return self._x_k_post
+
     def filter_iter(self, tuy=(None, None, None)):
         if not isinstance(tuy, tuple) and not isinstance(tuy, list):
             raise ValueError("Iteration input is not a list or a tuple!")
         if not any(tuy):
             raise ValueError("Iteration input contains an empty element!")
         t, u, y = tuy
-        self._du_buffer[0].append(abs(u[0] - self._last_u[0]))
-        self._du_buffer[1].append(abs(u[1] - self._last_u[1]))
-        self._last_u = u
-        self._adapt_covariance()
-        super(AdaptiveKalmanFilter, self).filter_iter(tuy)
+        self._step(t, u, y)
 
-    def _adapt_covariance(self):
-        if len(self._du_buffer[0]) >= self._window.get_size():
-            self._Lambda_k = np.identity(2)
-            if np.max(self._du_buffer[0]) != 0.0:
-                self._Lambda_k[0][0] = 1 \
-                    + self._M_k[0][0] / np.max(self._du_buffer[0]) \
-                    * self._window.get_weighted_sum(tuple(self._du_buffer[0]))
-            if np.max(self._du_buffer[1]) != 0.0:
-                self._Lambda_k[1][1] = 1 \
-                    + self._M_k[1][1] / np.max(self._du_buffer[1]) \
-                    * self._window.get_weighted_sum(tuple(self._du_buffer[0]))
-        self._Q_k = self._Lambda_k.dot(self._Ro_k).dot(self._R_k)
+    def filter_batch(self, t=None, U=None, Y=None, has_y=None):
+        t = np.asarray(t, dtype=float)
+        U = np.asarray(U, dtype=float)
+        Y = np.asarray(Y, dtype=float)
+        if t.ndim != 1 or not len(t):
+            raise ValueError("Time has to be a non empty (T,) array!")
+        if U.shape != (len(t), 2) or Y.shape != (len(t), 2):
+            raise ValueError("Input and output have to be (T, 2) arrays!")
+        states = np.zeros((self._N, len(t), 7))
+        has_y = KalmanFilter._get_has_y(has_y, len(t))
+        for k, t_k in enumerate(t.tolist()):
+            self._step(t_k, U[k], Y[k] if has_y[k] else None)
+            states[:, k, :] = self._x_k_post[:, :, 0]
+        return states
+
+    def _step(self, t, u, y):
+        self._dt = t - self._t
+        self._t = t
+
+        self._u_k[:, 0] = u
+
+        self._update_Phi_k()
+        if y is not None:
+            self._y_k[:, 0] = y
+            self._set_gain()
+            self._update_states()
+            self._update_error_covars()
+        else:
+            self._x_k_post = self._x_k_pre
+            self._P_k_post = self._P_k_pre
+        self._extr_states()
+        self._extr_error_covars()
+        self._setup_next_iter()
+
+    def _update_Phi_k(self):
+        cos_psi = np.cos(self._x_k_post[:, 4, 0])
+        sin_psi = np.sin(self._x_k_post[:, 4, 0])
+        self._Phi_k[:, 0, 2] = self._dt * cos_psi
+        self._Phi_k[:, 0, 3] = 0.5 * self._dt * self._dt * cos_psi
+        self._Phi_k[:, 1, 2] = self._dt * sin_psi
+        self._Phi_k[:, 1, 3] = 0.5 * self._dt * self._dt * sin_psi
+        self._Phi_k[:, 2, 3] = self._dt
+        self._Phi_k[:, 4, 5] = self._dt
+        self._Phi_k[:, 4, 6] = 0.5 * self._dt * self._dt
+        self._Phi_k[:, 5, 6] = self._dt
+
+    def _set_gain(self):
+        C_T = np.swapaxes(self._C_k, 1, 2)
+        self._L_k = np.matmul(np.matmul(self._P_k_pre, C_T), np.linalg.inv(
+            np.matmul(np.matmul(self._C_k, self._P_k_pre), C_T)
+            + self._HQH_k
+            + self._R_k
+        ))
+
+    def _update_states(self):
+        self._x_k_post = self._x_k_pre + np.matmul(
+            self._L_k,
+            self._y_k - np.matmul(self._C_k, self._x_k_pre)
+            - np.matmul(self._D_k, self._u_k)
+        )
+
+    def _update_error_covars(self):
+        self._P_k_post = np.matmul(
+            np.identity(7) - np.matmul(self._L_k, self._C_k), self._P_k_pre)
+
+    def _extr_states(self):
+        self._x_k_extr = np.matmul(self._Phi_k, self._x_k_post) \
+            + np.matmul(self._Gamma_k, self._u_k)
+
+    def _extr_error_covars(self):
+        self._P_k_extr = np.matmul(
+            np.matmul(self._Phi_k, self._P_k_post),
+            np.swapaxes(self._Phi_k, 1, 2)) + self._GQG_k
+
+    def _setup_next_iter(self):
+        self._x_k_pre = self._x_k_extr
+        self._P_k_pre = self._P_k_extr
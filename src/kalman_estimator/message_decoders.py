@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2019 Daniel Hammer. All Rights Reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import struct
+
+import numpy as np
+
+# same threshold as tf.transformations
+_EPS = np.finfo(float).eps * 4.0
+
+
+def euler_from_quaternions(quaternions=None):
+    # vectorized tf.transformations.euler_from_quaternion for the static
+    # xyz axes, takes (N, 4) x, y, z, w rows and returns (N, 3) roll, pitch,
+    # yaw rows following the same rotation matrix route as tf
+    if quaternions is None:
+        raise ValueError
+    q = np.array(quaternions, dtype=np.float64, ndmin=2)
+    if q.ndim != 2 or q.shape[1] != 4:
+        raise ValueError("Quaternions have to be a (N, 4) array!")
+    else:
+        nq = np.einsum('ij,ij->i', q, q)
+        # tf maps a zero quaternion to the identity rotation
+        identity = nq < _EPS
+        q *= np.sqrt(2.0 / np.where(identity, 1.0, nq))[:, np.newaxis]
+        q[identity] = 0
+        x, y, z, w = q.T
+        M_00 = 1.0 - y * y - z * z
+        M_10 = x * y + z * w
+        M_20 = x * z - y * w
+        M_21 = y * z + x * w
+        M_22 = 1.0 - x * x - y * y
+        M_11 = 1.0 - x * x - z * z
+        M_12 = y * z - x * w
+        cy = np.sqrt(M_00 * M_00 + M_10 * M_10)
+        gimbal_lock = cy <= _EPS
+        euler = np.empty((len(q), 3))
+        euler[:, 0] = np.where(gimbal_lock, np.arctan2(-M_12, M_11),
+                               np.arctan2(M_21, M_22))
+        euler[:, 1] = np.arctan2(-M_20, cy)
+        euler[:, 2] = np.where(gimbal_lock, 0.0, np.arctan2(M_10, M_00))
+        return euler
+
+
+# float64 fields read from the serialized messages, as (offset, count)
+# after the header, or after the child_frame_id for odometry; the order
+# matches BagReader.decoded_fields
+RAW_LAYOUTS = {
+    "sensor_msgs/Imu": ("imu", ((200, 3), (104, 3)), 296),
+    "geometry_msgs/TwistWithCovarianceStamped": ("twist", ((0, 6),), 336),
+    "nav_msgs/Odometry": ("odom", ((0, 7), (344, 6)), 680)
+}
+
+
+def get_raw_kind(datatype=None):
+    if datatype in RAW_LAYOUTS:
+        return RAW_LAYOUTS[datatype][0]
+
+
+def decode_raw(datatype=None, buffers=None):
+    # decodes serialized messages of one type straight from their buffers,
+    # messages with the same frame id lengths share a record layout and
+    # are read with a single np.frombuffer
+    if datatype not in RAW_LAYOUTS:
+        raise ValueError("No raw layout for {}!".format(datatype))
+    if buffers is None:
+        raise ValueError
+    else:
+        _kind, fields, size = RAW_LAYOUTS[datatype]
+        width = sum(count for _offset, count in fields)
+        time = np.empty(len(buffers))
+        values = np.empty((len(buffers), width))
+        groups = {}
+        for index, buffer in enumerate(buffers):
+            body = _get_body_offset(datatype, buffer)
+            if len(buffer) != body + size:
+                raise ValueError("Unexpected {} length!".format(datatype))
+            groups.setdefault(body, []).append(index)
+        for body, indices in groups.items():
+            dtype = _get_record_dtype(body, fields, body + size)
+            records = np.frombuffer(
+                b"".join([buffers[index] for index in indices]), dtype)
+            time[indices] = records["secs"] + records["nsecs"] / 1e9
+            column = 0
+            for k, (_offset, count) in enumerate(fields):
+                values[indices, column:column + count] = \
+                    records["f{}".format(k)]
+                column += count
+        return time, values
+
+
+def _get_body_offset(datatype=None, buffer=None):
+    # seq, stamp and the length prefixed frame_id come first
+    offset = 16 + struct.unpack_from("<I", buffer, 12)[0]
+    if datatype == "nav_msgs/Odometry":
+        offset += 4 + struct.unpack_from("<I", buffer, offset)[0]
+    return offset
+
+
+def _get_record_dtype(body=0, fields=None, itemsize=0):
+    names = ["secs", "nsecs"]
+    formats = ["<u4", "<u4"]
+    offsets = [4, 8]
+    for k, (offset, count) in enumerate(fields):
+        names.append("f{}".format(k))
+        formats.append(("<f8", (count,)))
+        offsets.append(body + offset)
+    return np.dtype({"names": names, "formats": formats,
+                     "offsets": offsets, "itemsize": itemsize})
+
+
+def encode_raw(datatype=None, t=0., values=None, frame_id="",
+               child_frame_id=""):
+    # inverse of decode_raw for a single message, fields without a decoded
+    # value (covariances, unused orientation) are left zero
+    if datatype not in RAW_LAYOUTS:
+        raise ValueError("No raw layout for {}!".format(datatype))
+    if values is None:
+        raise ValueError
+    else:
+        _kind, fields, size = RAW_LAYOUTS[datatype]
+        values = np.asarray(values, dtype="<f8")
+        if len(values) != sum(count for _offset, count in fields):
+            raise ValueError("Values do not match {}!".format(datatype))
+        secs = int(t // 1)
+        nsecs = int(round((t - secs) * 1e9))
+        if nsecs >= 1000000000:
+            secs, nsecs = secs + 1, nsecs - 1000000000
+        frame_id = frame_id.encode("utf-8")
+        header = struct.pack("<4I", 0, secs, nsecs, len(frame_id)) + frame_id
+        if datatype == "nav_msgs/Odometry":
+            child_frame_id = child_frame_id.encode("utf-8")
+            header += struct.pack("<I", len(child_frame_id)) + child_frame_id
+        body = bytearray(size)
+        column = 0
+        for offset, count in fields:
+            body[offset:offset + 8 * count] = \
+                values[column:column + count].tobytes()
+            column += count
+        return header + bytes(body)
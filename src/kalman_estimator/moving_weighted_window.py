@@ -15,6 +15,77 @@
 # limitations under the License.
 
 import numpy as np
+from collections import deque
+from numpy.lib.stride_tricks import as_strided
+
+
+def get_moving_max(array=None, size=0):
+    array = np.ascontiguousarray(array, dtype=float)
+    if not size or len(array) < size:
+        return np.zeros(0)
+    # (len - size + 1, size) strided view, one row per full window
+    windows = as_strided(array,
+                         shape=(len(array) - size + 1, size),
+                         strides=(array.strides[0], array.strides[0]),
+                         writeable=False)
+    return windows.max(axis=1)
+
+
+class MovingWindowBuffer(object):
+
+    def __init__(self, size=0, keep_values=True):
+        if not size or not isinstance(size, int):
+            raise ValueError("Invalid window size!")
+        self._size = size
+        # every sample is written twice, so the window is always the
+        # contiguous slice _buffer[start:start + len]
+        self._buffer = np.zeros(2 * size) if keep_values else None
+        self._head = 0
+        self._len = 0
+        self._count = 0
+        # (count, value) pairs with decreasing values, front is the max
+        self._max_deque = deque()
+
+    def __len__(self):
+        return self._len
+
+    def get_size(self):
+        return self._size
+
+    def append(self, x=0):
+        if self._buffer is not None:
+            self._buffer[self._head] = x
+            self._buffer[self._head + self._size] = x
+        self._head = (self._head + 1) % self._size
+        self._len = min(self._len + 1, self._size)
+        self._count += 1
+        while self._max_deque and self._max_deque[-1][1] <= x:
+            self._max_deque.pop()
+        self._max_deque.append((self._count, x))
+        if self._max_deque[0][0] <= self._count - self._size:
+            self._max_deque.popleft()
+
+    def get_max(self):
+        if not self._len:
+            raise ValueError("Window buffer is empty!")
+        return self._max_deque[0][1]
+
+    def get_view(self):
+        if self._buffer is None:
+            raise ValueError("Window buffer keeps no values!")
+        start = (self._head - self._len) % self._size
+        return self._buffer[start:start + self._len]
+
+    def get_max_view(self):
+        if self._buffer is not None:
+            return self.get_view()
+        # only the max candidates are known, every other sample is
+        # dominated by a later candidate, so zeros keep all window maxima
+        # of non negative samples
+        view = np.zeros(self._len)
+        for count, x in self._max_deque:
+            view[count - self._count + self._len - 1] = x
+        return view
 
 
 class MovingWeightedWindow(object):
@@ -31,7 +102,17 @@ class MovingWeightedWindow(object):
     def get_size(self):
         return self._size
 
+    def is_recursive(self):
+        return False
+
+    def get_weights(self):
+        return self._weights
+
     def get_weighted_sum(self, array=[]):
+        if isinstance(array, np.ndarray):
+            if not len(array):
+                raise ValueError("Input array is empty!")
+            return np.dot(array, self._weights[:len(array)])
         if not isinstance(array, list) and not isinstance(array, tuple):
             raise ValueError("Input array is neither an array nor a tuple!")
         if not array or all(array):
@@ -41,6 +122,13 @@ class MovingWeightedWindow(object):
             sum += elem * weight
         return sum
 
+    def get_moving_weighted_sums(self, array=None):
+        array = np.asarray(array, dtype=float)
+        if len(array) < self._size:
+            return np.zeros(0)
+        # weighted sum of every full window, oldest sample first
+        return np.correlate(array, self._weights, 'valid')
+
     def _set_weights(self):
         raise NotImplementedError
 
@@ -70,3 +158,126 @@ class MovingWeightedSigWindow(MovingWeightedWindow):
         for i in range(self._size):
             w[i] = 1 / (1 + np.exp(self._alpha * (x[i] - 0.5)))
         return w
+
+
+class RecursiveWeightedWindow(MovingWeightedWindow):
+
+    def __init__(self, size=0, poles=(), gains=()):
+        if len(poles) != len(gains) or not len(poles):
+            raise ValueError("Poles and gains don't match!")
+        if any(not 0 <= pole < 1 for pole in poles):
+            raise ValueError("Poles have to be in [0, 1)!")
+        self._poles = np.array(poles, dtype=float)
+        self._gains = np.array(gains, dtype=float)
+        super(RecursiveWeightedWindow, self).__init__(size)
+
+    def is_recursive(self):
+        return True
+
+    def get_poles(self):
+        return self._poles
+
+    def get_gains(self):
+        return self._gains
+
+    def get_initial_state(self):
+        return np.zeros(len(self._poles))
+
+    def update(self, state=None, x=0):
+        # O(1) step of every exponential, state is updated in place
+        state *= self._poles
+        state += x
+        return np.dot(self._gains, state)
+
+    def filter(self, array=None, state=None):
+        # scipy is only imported for offline filtering, the core filters
+        # import with numpy alone
+        from scipy import signal
+        array = np.asarray(array, dtype=float)
+        if state is None:
+            state = self.get_initial_state()
+        sums = np.zeros(len(array))
+        for i in range(len(self._poles)):
+            pole = self._poles[i]
+            exp_sum, zf = signal.lfilter([1.], [1., -pole], array,
+                                         zi=[pole * state[i]])
+            sums += self._gains[i] * exp_sum
+            if len(array):
+                state[i] = exp_sum[-1]
+        return sums
+
+    def get_weighted_sum(self, array=[]):
+        if not len(array):
+            raise ValueError("Input array is empty!")
+        return self.filter(array)[-1]
+
+    def get_moving_weighted_sums(self, array=None):
+        array = np.asarray(array, dtype=float)
+        if len(array) < self._size:
+            return np.zeros(0)
+        return self.filter(array)[self._size - 1:]
+
+    def _set_weights(self):
+        # the finite weights the recursion amounts to, oldest first
+        age = np.arange(self._size - 1, -1, -1)
+        return np.power.outer(self._poles, age).T.dot(self._gains)
+
+
+class MovingWeightedExpWindow(RecursiveWeightedWindow):
+
+    def __init__(self, size, alpha=3):
+        if not isinstance(alpha, float) and not isinstance(alpha, int):
+            raise ValueError("Alpha must be float or int!")
+        if alpha <= 0:
+            raise ValueError("Alpha has to be positive!")
+        self._alpha = alpha
+        # the weights drop to exp(-alpha) after size samples
+        pole = np.exp(-float(alpha) / size)
+        super(MovingWeightedExpWindow, self).__init__(size, (pole, ), (1, ))
+
+
+class MovingWeightedSigExpWindow(RecursiveWeightedWindow):
+
+    def __init__(self, size, alpha=10, order=6):
+        if not isinstance(alpha, float) and not isinstance(alpha, int):
+            raise ValueError("Alpha must be float or int!")
+        if not alpha:
+            raise ValueError("Alpha can't be zero!")
+        if not isinstance(order, int) or order < 1:
+            raise ValueError("Order has to be a positive int!")
+        if not size or not isinstance(size, int):
+            raise ValueError("Invalid window size!")
+        self._alpha = alpha
+        poles, gains = self._fit_sigmoid(size, alpha, order)
+        super(MovingWeightedSigExpWindow, self).__init__(size, poles, gains)
+
+    @staticmethod
+    def _fit_sigmoid(size=0, alpha=10, order=6):
+        # least squares fit of the MovingWeightedSigWindow weights by
+        # exponentials with fixed, geometrically spaced time constants,
+        # the tail after size samples is fitted towards zero
+        #
+        # the weights have to stay non negative at every age, or a step
+        # leaving the window drives the weighted sum of |du| below zero;
+        # the gains themselves can't be, a sum of decaying exponentials
+        # with positive gains is convex and misses the sigmoid plateau
+        from scipy import optimize
+        age = np.arange(3 * size)
+        x = age / max(size - 1., 1.)
+        sigmoid = np.where(age < size, 1 / (1 + np.exp(alpha * (x - 0.5))), 0)
+        poles = np.exp(-1 / (size * np.logspace(np.log10(0.05), 0, order)))
+        A = np.power.outer(poles, age).T
+        gains = np.linalg.lstsq(A, sigmoid, rcond=-1)[0]
+        # past 20 sizes the slowest pole dominates, its gain keeps the
+        # rest of the tail non negative
+        positive = np.vstack((np.power.outer(poles, np.arange(20 * size)).T,
+                              np.identity(order)[-1]))
+        result = optimize.minimize(
+            lambda g: np.sum(np.square(A.dot(g) - sigmoid)), gains,
+            jac=lambda g: 2 * A.T.dot(A.dot(g) - sigmoid),
+            constraints={"type": "ineq", "fun": positive.dot,
+                         "jac": lambda g: positive},
+            method="SLSQP")
+        if not result.success:
+            raise ValueError("Sigmoid fit failed: {}!".format(result.message))
+        return poles, result.x
@@ -0,0 +1,400 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2019 Daniel Hammer. All Rights Reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import bz2
+import struct
+
+import numpy as np
+
+from topic_reader import TopicReader
+
+_VERSION = b"#ROSBAG V2.0\n"
+_BAG_HEADER_LENGTH = 4096
+
+_OP_MESSAGE_DATA = 0x02
+_OP_BAG_HEADER = 0x03
+_OP_INDEX_DATA = 0x04
+_OP_CHUNK = 0x05
+_OP_CHUNK_INFO = 0x06
+_OP_CONNECTION = 0x07
+
+_INDEX_ENTRY = np.dtype([("secs", "<u4"), ("nsecs", "<u4"), ("offset", "<u4")])
+_CHUNK_CONNECTION = np.dtype([("conn", "<u4"), ("count", "<u4")])
+
+compressions = ("none", "bz2", "lz4")
+
+
+def _pack_time(t_ns=0):
+    return struct.pack("<2I", t_ns // 1000000000, t_ns % 1000000000)
+
+
+def _unpack_time(buffer=None):
+    secs, nsecs = struct.unpack("<2I", buffer)
+    return secs * 1000000000 + nsecs
+
+
+def _parse_fields(buffer=None):
+    # name=value fields, each prefixed with its uint32 length
+    fields = {}
+    offset = 0
+    while offset < len(buffer):
+        length = struct.unpack_from("<I", buffer, offset)[0]
+        field = buffer[offset + 4:offset + 4 + length]
+        name, value = field.split(b"=", 1)
+        fields[name.decode("ascii")] = value
+        offset += 4 + length
+    return fields
+
+
+def _pack_fields(fields=None):
+    buffer = b""
+    for name, value in fields:
+        field = name.encode("ascii") + b"=" + value
+        buffer += struct.pack("<I", len(field)) + field
+    return buffer
+
+
+def _read_record(bag_file=None, skip_data=False):
+    header_length = struct.unpack("<I", bag_file.read(4))[0]
+    header = _parse_fields(bag_file.read(header_length))
+    data_length = struct.unpack("<I", bag_file.read(4))[0]
+    if skip_data:
+        bag_file.seek(data_length, 1)
+        return header, None
+    return header, bag_file.read(data_length)
+
+
+def _get_record_data(buffer=None, offset=0):
+    # skips the record header, the index already told us what it holds
+    header_length = struct.unpack_from("<I", buffer, offset)[0]
+    offset += 4 + header_length
+    data_length = struct.unpack_from("<I", buffer, offset)[0]
+    return buffer[offset + 4:offset + 4 + data_length]
+
+
+def _pack_record(fields=None, data=b""):
+    header = _pack_fields(fields)
+    return struct.pack("<I", len(header)) + header + \
+        struct.pack("<I", len(data)) + data
+
+
+def _get_op(header=None):
+    return struct.unpack("<B", header["op"])[0]
+
+
+def _decompress(compression=None, data=None):
+    if compression == "none":
+        return data
+    elif compression == "bz2":
+        return bz2.decompress(data)
+    elif compression == "lz4":
+        return _get_lz4().decompress(data)
+    else:
+        raise ValueError("Unknown chunk compression {}!".format(compression))
+
+
+def _compress(compression=None, data=None):
+    if compression == "none":
+        return data
+    elif compression == "bz2":
+        return bz2.compress(data)
+    elif compression == "lz4":
+        return _get_lz4().compress(data)
+    else:
+        raise ValueError("Unknown chunk compression {}!".format(compression))
+
+
+def _get_lz4():
+    # roslz4 writes standard lz4 frames, only needed for lz4 bags
+    try:
+        import lz4.frame
+    except ImportError:
+        raise ValueError("Reading lz4 chunks needs the lz4 package!")
+    return lz4.frame
+
+
+class NativeBagReader(TopicReader):
+
+    def __init__(self, bag_path="", cache=None):
+        super(NativeBagReader, self).__init__(bag_path, cache)
+        self._bag_file = open(bag_path, "rb")
+        if self._bag_file.read(len(_VERSION)) != _VERSION:
+            raise ValueError("Not a bag v2.0 file!")
+        header, _data = _read_record(self._bag_file)
+        if _get_op(header) != _OP_BAG_HEADER:
+            raise ValueError("Bag header record missing!")
+        index_pos = struct.unpack("<Q", header["index_pos"])[0]
+        conn_count = struct.unpack("<I", header["conn_count"])[0]
+        chunk_count = struct.unpack("<I", header["chunk_count"])[0]
+        if not index_pos:
+            raise ValueError("Bag is not indexed, run rosbag reindex!")
+        self._connections = {}
+        self._chunk_infos = []
+        # the last decompressed chunk, so scrubbing within it stays cheap
+        self._last_chunk_pos = None
+        self._last_chunk = None
+        self._read_index(index_pos, conn_count, chunk_count)
+
+    def close(self):
+        self._bag_file.close()
+
+    def get_start_time(self):
+        return min(info[1] for info in self._chunk_infos) / 1e9
+
+    def get_end_time(self):
+        return max(info[2] for info in self._chunk_infos) / 1e9
+
+    def get_topics(self):
+        return dict((topic, datatype) for topic, datatype
+                    in self._connections.values())
+
+    def _read_index(self, index_pos=0, conn_count=0, chunk_count=0):
+        # connection and chunk info records sit behind the last chunk
+        self._bag_file.seek(index_pos)
+        for _k in range(conn_count):
+            header, data = _read_record(self._bag_file)
+            if _get_op(header) != _OP_CONNECTION:
+                raise ValueError("Connection record missing!")
+            conn = struct.unpack("<I", header["conn"])[0]
+            connection_header = _parse_fields(data)
+            self._connections[conn] = (
+                header["topic"].decode("utf-8"),
+                connection_header["type"].decode("ascii"))
+        for _k in range(chunk_count):
+            header, data = _read_record(self._bag_file)
+            if _get_op(header) != _OP_CHUNK_INFO:
+                raise ValueError("Chunk info record missing!")
+            counts = np.frombuffer(data, _CHUNK_CONNECTION)
+            self._chunk_infos.append((
+                struct.unpack("<Q", header["chunk_pos"])[0],
+                _unpack_time(header["start_time"]),
+                _unpack_time(header["end_time"]),
+                dict(zip(counts["conn"].tolist(), counts["count"].tolist()))))
+
+    def _get_chunk_infos(self, conns=None, start_time=None, end_time=None):
+        start_ns = -1 if start_time is None else int(round(start_time * 1e9))
+        end_ns = np.inf if end_time is None else int(round(end_time * 1e9))
+        for chunk_info in self._chunk_infos:
+            _chunk_pos, chunk_start, chunk_end, counts = chunk_info
+            if chunk_end >= start_ns and chunk_start <= end_ns and \
+                    any(conn in counts for conn in conns):
+                yield chunk_info
+
+    def _get_conns(self, topics=None):
+        return [conn for conn, (topic, _datatype)
+                in self._connections.items() if topic in topics]
+
+    def _read_chunk(self, chunk_pos=0, counts=None, skip_data=False):
+        # a chunk record is followed by one index record per connection
+        self._bag_file.seek(chunk_pos)
+        header, data = _read_record(self._bag_file, skip_data)
+        if _get_op(header) != _OP_CHUNK:
+            raise ValueError("Chunk record missing at {}!".format(chunk_pos))
+        chunk = None
+        if not skip_data:
+            chunk = _decompress(header["compression"].decode("ascii"), data)
+        index = {}
+        for _k in range(len(counts)):
+            header, data = _read_record(self._bag_file)
+            if _get_op(header) != _OP_INDEX_DATA:
+                raise ValueError("Index record missing!")
+            index[struct.unpack("<I", header["conn"])[0]] = \
+                np.frombuffer(data, _INDEX_ENTRY)
+        return chunk, index
+
+    def _read_raw(self, topics=None, start_time=None, end_time=None):
+        conns = self._get_conns(topics)
+        start_ns = -1 if start_time is None else int(round(start_time * 1e9))
+        end_ns = np.inf if end_time is None else int(round(end_time * 1e9))
+        for chunk_pos, _start, _end, counts in self._get_chunk_infos(
+                conns, start_time, end_time):
+            chunk, index = self._read_chunk(chunk_pos, counts)
+            # the index entries point straight at the message records,
+            # merged across connections in receive time order
+            entries = []
+            for conn in conns:
+                if conn in index:
+                    time = index[conn]["secs"].astype(np.int64) * \
+                        1000000000 + index[conn]["nsecs"]
+                    for t_ns, offset in zip(time.tolist(),
+                                            index[conn]["offset"].tolist()):
+                        if start_ns <= t_ns <= end_ns:
+                            entries.append((t_ns, offset, conn))
+            entries.sort()
+            for _t_ns, offset, conn in entries:
+                data = _get_record_data(chunk, offset)
+                topic, datatype = self._connections[conn]
+                yield topic, datatype, data, (datatype, data)
+
+    def _build_index(self, topic=None):
+        # only the chunk headers and index records are read, the chunks
+        # themselves are skipped
+        conns = self._get_conns([topic])
+        indexes = []
+        for chunk_pos, _start, _end, counts in self._get_chunk_infos(conns):
+            _chunk, index = self._read_chunk(chunk_pos, counts, True)
+            for conn in conns:
+                if conn in index:
+                    entries = np.empty(len(index[conn]), self.index_dtype)
+                    entries["time"] = index[conn]["secs"].astype(np.int64) * \
+                        1000000000 + index[conn]["nsecs"]
+                    entries["chunk_pos"] = chunk_pos
+                    entries["offset"] = index[conn]["offset"]
+                    indexes.append(entries)
+        if not indexes:
+            return np.empty(0, self.index_dtype)
+        else:
+            index = np.concatenate(indexes)
+            return index[np.argsort(index["time"], kind="mergesort")]
+
+    def _read_entries(self, topic=None, entries=None):
+        datatype = self.get_topics()[topic]
+        raw_messages = []
+        for chunk_pos, offset in zip(entries["chunk_pos"].tolist(),
+                                     entries["offset"].tolist()):
+            if chunk_pos != self._last_chunk_pos:
+                self._last_chunk, _index = self._read_chunk(chunk_pos, {})
+                self._last_chunk_pos = chunk_pos
+            data = _get_record_data(self._last_chunk, offset)
+            raw_messages.append((datatype, data))
+        return raw_messages
+
+    def _decode_message(self, kind=None, raw_message=None):
+        raise ValueError("No raw decoder for {}!".format(raw_message[0]))
+
+    def _get_message_count(self, topic=None, start_time=None, end_time=None):
+        conns = self._get_conns([topic])
+        return sum(counts.get(conn, 0) for conn in conns
+                   for _pos, _start, _end, counts
+                   in self._get_chunk_infos(conns, start_time, end_time))
+
+
+class NativeBagWriter(object):
+
+    def __init__(self, bag_path="", compression="none",
+                 chunk_threshold=768 * 1024):
+        if not bag_path:
+            raise ValueError
+        if compression not in compressions:
+            raise ValueError("Unknown compression {}!".format(compression))
+        else:
+            self._bag_file = open(bag_path, "wb")
+            self._compression = compression
+            self._chunk_threshold = chunk_threshold
+            self._connections = {}
+            self._chunk_infos = []
+            self._chunk = b""
+            self._chunk_index = {}
+            self._chunk_times = None
+            self._bag_file.write(_VERSION)
+            self._write_bag_header(0)
+
+    @staticmethod
+    def get_compressions():
+        try:
+            _get_lz4()
+        except ValueError:
+            return tuple(c for c in compressions if c != "lz4")
+        return compressions
+
+    def write(self, topic=None, datatype=None, data=None, t=0.,
+              md5sum="*", message_definition=""):
+        if not topic or not datatype or data is None:
+            raise ValueError
+        else:
+            if topic not in self._connections:
+                conn = len(self._connections)
+                self._connections[topic] = (conn, datatype, md5sum,
+                                            message_definition)
+                self._chunk += self._get_connection_record(topic)
+            conn = self._connections[topic][0]
+            t_ns = int(round(t * 1e9))
+            self._chunk_index.setdefault(conn, []).append(
+                (t_ns, len(self._chunk)))
+            if self._chunk_times is None:
+                self._chunk_times = [t_ns, t_ns]
+            self._chunk_times = [min(self._chunk_times[0], t_ns),
+                                 max(self._chunk_times[1], t_ns)]
+            self._chunk += _pack_record([
+                ("op", struct.pack("<B", _OP_MESSAGE_DATA)),
+                ("conn", struct.pack("<I", conn)),
+                ("time", _pack_time(t_ns))], data)
+            if len(self._chunk) >= self._chunk_threshold:
+                self._write_chunk()
+
+    def close(self):
+        if self._chunk_index:
+            self._write_chunk()
+        index_pos = self._bag_file.tell()
+        for topic in self._connections:
+            self._bag_file.write(self._get_connection_record(topic))
+        for chunk_pos, start_ns, end_ns, counts in self._chunk_infos:
+            data = b"".join(struct.pack("<2I", conn, count)
+                            for conn, count in sorted(counts.items()))
+            self._bag_file.write(_pack_record([
+                ("op", struct.pack("<B", _OP_CHUNK_INFO)),
+                ("ver", struct.pack("<I", 1)),
+                ("chunk_pos", struct.pack("<Q", chunk_pos)),
+                ("start_time", _pack_time(start_ns)),
+                ("end_time", _pack_time(end_ns)),
+                ("count", struct.pack("<I", len(counts)))], data))
+        self._bag_file.seek(len(_VERSION))
+        self._write_bag_header(index_pos)
+        self._bag_file.close()
+
+    def _write_bag_header(self, index_pos=0):
+        fields = [("op", struct.pack("<B", _OP_BAG_HEADER)),
+                  ("index_pos", struct.pack("<Q", index_pos)),
+                  ("conn_count", struct.pack("<I", len(self._connections))),
+                  ("chunk_count", struct.pack("<I", len(self._chunk_infos)))]
+        # the bag header is padded so it can be rewritten in place
+        padding = _BAG_HEADER_LENGTH - len(_pack_record(fields))
+        self._bag_file.write(_pack_record(fields, b" " * padding))
+
+    def _write_chunk(self):
+        chunk_pos = self._bag_file.tell()
+        self._bag_file.write(_pack_record([
+            ("op", struct.pack("<B", _OP_CHUNK)),
+            ("compression", self._compression.encode("ascii")),
+            ("size", struct.pack("<I", len(self._chunk)))],
+            _compress(self._compression, self._chunk)))
+        counts = {}
+        for conn, entries in sorted(self._chunk_index.items()):
+            data = b"".join(_pack_time(t_ns) + struct.pack("<I", offset)
+                            for t_ns, offset in entries)
+            self._bag_file.write(_pack_record([
+                ("op", struct.pack("<B", _OP_INDEX_DATA)),
+                ("ver", struct.pack("<I", 1)),
+                ("conn", struct.pack("<I", conn)),
+                ("count", struct.pack("<I", len(entries)))], data))
+            counts[conn] = len(entries)
+        self._chunk_infos.append((chunk_pos, self._chunk_times[0],
+                                  self._chunk_times[1], counts))
+        self._chunk = b""
+        self._chunk_index = {}
+        self._chunk_times = None
+
+    def _get_connection_record(self, topic=None):
+        conn, datatype, md5sum, message_definition = self._connections[topic]
+        data = _pack_fields([
+            ("topic", topic.encode("utf-8")),
+            ("type", datatype.encode("ascii")),
+            ("md5sum", md5sum.encode("ascii")),
+            ("message_definition", message_definition.encode("utf-8"))])
+        return _pack_record([
+            ("op", struct.pack("<B", _OP_CONNECTION)),
+            ("conn", struct.pack("<I", conn)),
+            ("topic", topic.encode("utf-8"))], data)
@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2019 Daniel Hammer. All Rights Reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+
+from kalman_filter import KalmanFilter, AdaptiveKalmanFilter
+from kalman_filter import allocate_history, rts_smooth
+from kalman_filter import get_batch_arrays, get_Phi, inv_2x2
+
+_I = np.identity(7)
+
+
+class ParallelKalmanFilter(object):
+    # parallel in time filtering of a KalmanFilter, following the
+    # associative scan formulation of Saerkkae and Garcia-Fernandez: every
+    # step k becomes an element (A, b, C, eta, J) of the conditional
+    # p(x_k | x_k-1, y_k), and the filtered estimates are the prefixes of
+    # composing these elements in order
+    #
+    # Phi_k depends on psi of the previous estimate, so each pass
+    # linearizes about the psi trajectory of the pass before; psi itself
+    # only depends on the linear part of the model, so the second pass
+    # already reproduces its own trajectory and the sequential filter
+
+    chunk_size = 1 << 16
+
+    def __init__(self, kalman_filter=None, processes=1, max_passes=3,
+                 tolerance=1e-9):
+        if not isinstance(kalman_filter, KalmanFilter):
+            raise ValueError("Filter is not a KalmanFilter object!")
+        if not isinstance(processes, int) or processes < 1:
+            raise ValueError("Invalid number of processes!")
+        if not isinstance(max_passes, int) or max_passes < 1:
+            raise ValueError("Invalid number of passes!")
+        else:
+            self._kalman_filter = kalman_filter
+            self._processes = processes
+            self._max_passes = max_passes
+            self._tolerance = tolerance
+            self._passes = 0
+
+    def get_passes(self):
+        # passes the last filter_batch needed to reproduce its trajectory
+        return self._passes
+
+    def filter_batch(self, t=None, U=None, Y=None,
+                     states=None, P_diag=None, Q_diag=None, has_y=None,
+                     history=None, reference=None):
+        # runs from the current prior of the wrapped filter without
+        # advancing it; reference are the (T, 7) states of an earlier pass
+        # to linearize the first pass about
+        t, U, Y, states, has_y = get_batch_arrays(
+            t, U, Y, states, P_diag, Q_diag, has_y, history=history)
+        if reference is not None and np.shape(reference) != (len(t), 7):
+            raise ValueError("Reference has to be a (T, 7) array!")
+        else:
+            kf = self._kalman_filter
+            has_y = np.asarray(has_y)
+            if isinstance(kf, AdaptiveKalmanFilter):
+                Q = kf.get_Q_schedule(U)
+            else:
+                Q = np.tile(np.array(kf.get_Q(), dtype=float),
+                            (len(t), 1, 1))
+            model = _get_model(kf)
+            psi_post = float(kf.get_post_states()[4, 0])
+            prior = (kf.get_pre_states()[:, 0].astype(float),
+                     kf.get_pre_covariance().astype(float))
+            dt = np.diff(np.concatenate(([kf.get_time()], t)))
+            if reference is None:
+                psi = np.full(len(t), psi_post)
+            else:
+                psi = np.asarray(reference, dtype=float)[:, 4]
+            chunks = self._get_chunks(len(t))
+            pool = self._get_pool()
+            self._passes = 0
+            try:
+                while self._passes < self._max_passes:
+                    # Phi_k is built from dt_k and psi of step k - 1
+                    psi_prev = np.concatenate(([psi_post], psi[:-1]))
+                    x, P = self._filter_pass(
+                        pool, chunks, model, prior,
+                        (dt, psi_prev, U, Y, has_y, Q), history is not None)
+                    self._passes += 1
+                    # only cos and sin of psi enter Phi_k, so a wrapped
+                    # reference is as good as the unwrapped trajectory
+                    change = x[:, 4] - psi
+                    change = np.max(np.abs(np.arctan2(np.sin(change),
+                                                      np.cos(change))))
+                    psi = x[:, 4]
+                    if change <= self._tolerance:
+                        break
+            finally:
+                if pool is not None:
+                    pool.terminate()
+            states[:] = x
+            if P_diag is not None:
+                P_diag[:] = P if P.ndim == 2 else np.diagonal(P, 0, 1, 2)
+            if Q_diag is not None:
+                Q_diag[:, 0] = Q[:, 0, 0]
+                Q_diag[:, 1] = Q[:, 1, 1]
+            if history is not None:
+                self._set_history(history, model, prior,
+                                  (dt, psi_prev, U, Q), x, P)
+            return states
+
+    def smooth_batch(self, t=None, U=None, Y=None, has_y=None,
+                     P_smooth=None, reference=None):
+        t = np.asarray(t, dtype=float)
+        history = allocate_history(len(t))
+        states = self.filter_batch(t, U, Y, has_y=has_y, history=history,
+                                   reference=reference)
+        return rts_smooth(states, history, P_smooth)
+
+    def _get_chunks(self, length=0):
+        # at least one contiguous chunk of the timeline per process, and
+        # no chunk longer than chunk_size to bound the memory of a worker
+        count = max(self._processes, -(-length // self.chunk_size))
+        count = min(count, length)
+        bounds = np.linspace(0, length, count + 1).astype(int)
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def _get_pool(self):
+        if self._processes < 2:
+            return None
+        else:
+            # only imported when the timeline is actually split
+            import multiprocessing
+            return multiprocessing.Pool(self._processes)
+
+    @staticmethod
+    def _filter_pass(pool=None, chunks=None, model=None, prior=None,
+                     arrays=None, full=False):
+        # step k runs the time update of step k - 1 before its own
+        # measurement update, the first step starts from the prior
+        dt, psi_prev, U, Y, has_y, Q = arrays
+        arrays = (np.roll(dt, 1), np.roll(psi_prev, 1), np.roll(U, 1, 0),
+                  np.roll(Q, 1, 0), U, Y, has_y, Q)
+        tasks = [(model, [array[start:end] for array in arrays],
+                  prior if not start else None)
+                 for start, end in chunks]
+        if pool is None:
+            totals = [_reduce_chunk(task) for task in tasks]
+        else:
+            totals = pool.map(_reduce_chunk, tasks)
+        # the estimate entering each block, a short sequential scan over
+        # the block totals of all chunks; the first step ignores the zero
+        # estimate before it, its Phi is zero
+        starts = []
+        start = (np.zeros((7, 1)), np.zeros((7, 7)))
+        for chunk_totals in totals:
+            chunk_starts = []
+            for total in zip(*chunk_totals):
+                chunk_starts.append(start)
+                start = _combine_filtered(start, total)
+            starts.append([np.array(start_part)
+                           for start_part in zip(*chunk_starts)])
+        tasks = [task + (start, full) for task, start in zip(tasks, starts)]
+        if pool is None:
+            results = [_scan_chunk(task) for task in tasks]
+        else:
+            results = pool.map(_scan_chunk, tasks)
+        return (np.concatenate([x for x, _P in results]),
+                np.concatenate([P for _x, P in results]))
+
+    @staticmethod
+    def _set_history(history=None, model=None, prior=None, arrays=None,
+                     x=None, P=None):
+        # the priors follow from the estimates of the step before
+        x_pre, P_pre, P_post, Phi = history
+        dt, psi_prev, U, Q = arrays
+        Phi[:] = _get_Phi(model, dt, psi_prev)
+        x_pre[0], P_pre[0] = prior
+        x_pre[1:] = np.matmul(Phi[:-1], x[:-1, :, np.newaxis])[..., 0] \
+            + np.matmul(model["Gamma"], U[:-1, :, np.newaxis])[..., 0]
+        P_pre[1:] = np.matmul(np.matmul(Phi[:-1], P[:-1]),
+                              np.swapaxes(Phi[:-1], 1, 2)) \
+            + _get_GQG(model, Q[:-1])
+        P_post[:] = P
+
+
+def _get_model(kalman_filter=None):
+    # the constant model matrices in float64, small enough to ship to
+    # every worker
+    model = dict((name, np.array(matrix, dtype=float))
+                 for name, matrix in kalman_filter.get_model().items())
+    # batched matmul is much slower on transposed views
+    for name in ("G", "C", "H"):
+        model[name + "_T"] = np.ascontiguousarray(model[name].T)
+    return model
+
+
+def _get_Phi(model=None, dt=None, psi=None):
+    return get_Phi(dt, psi, model["v_damping"], model["dpsi_damping"])
+
+
+def _get_GQG(model=None, Q=None):
+    return np.matmul(np.matmul(model["G"], Q), model["G_T"])
+
+
+def _get_blocks(model=None, arrays=None, prior=None):
+    # step k conditions x_k on x_k-1: the time update with Phi_k-1,
+    # Gamma u_k-1 and G Q_k-1 G^T, then the measurement update with y_k;
+    # the first step of the timeline starts from the prior instead
+    #
+    # the steps are cut into about sqrt(n) blocks of about sqrt(n) steps,
+    # laid out (size, count) so step i of every block is contiguous, and
+    # padded with steps that leave the estimate as it is
+    n = len(arrays[0])
+    size = int(np.ceil(np.sqrt(n)))
+    count = -(-n // size)
+    index = np.arange(count * size).reshape(count, size).T
+    pad = index >= n
+    index[pad] = n - 1
+    dt_prev, psi_prev, U_prev, Q_prev, U, Y, has_y, Q = \
+        [array[index] for array in arrays]
+    F = _get_Phi(model, dt_prev, psi_prev)
+    c = np.matmul(model["Gamma"], U_prev[..., np.newaxis])
+    Q_n = _get_GQG(model, Q_prev)
+    if prior is not None:
+        F[0, 0] = 0
+        c[0, 0, :, 0] = prior[0]
+        Q_n[0, 0] = prior[1]
+    y = Y[..., np.newaxis] - np.matmul(model["D"], U[..., np.newaxis])
+    R = np.matmul(np.matmul(model["H"], Q), model["H_T"]) + model["R"]
+    F[pad] = _I
+    c[pad] = 0
+    Q_n[pad] = 0
+    y[pad] = 0
+    R[pad] = np.identity(2)
+    has_y[pad] = False
+    return F, c, Q_n, y, R, has_y
+
+
+def _get_element(model=None, step=None):
+    # element (A, b, C, eta, J) of a single step, after Saerkkae and
+    # Garcia-Fernandez; a step without a measurement has eta = J = 0
+    F, c, Q_n, y, R, has_y = step
+    C = model["C"]
+    CF = np.matmul(C, F)
+    W = np.swapaxes(CF, -1, -2)
+    CQ_n = np.matmul(C, Q_n)
+    S_inv = inv_2x2(np.matmul(CQ_n, model["C_T"]) + R,
+                    mask=has_y)
+    K = np.matmul(np.swapaxes(CQ_n, -1, -2), S_inv)
+    e = y - np.matmul(C, c)
+    return (F - np.matmul(K, CF), c + np.matmul(K, e),
+            Q_n - np.matmul(K, CQ_n), np.matmul(W, np.matmul(S_inv, e)),
+            np.matmul(np.matmul(W, S_inv), CF))
+
+
+def _combine_step(model=None, first=None, step=None):
+    # first composed with a single step; J of the step has rank two, so
+    # (I + C_i J_j)^-1 = I - C_i W (S + W^T C_i W)^-1 W^T with W = F^T C^T
+    # only needs 2x2 inverses
+    A_i, b_i, C_i, eta_i, J_i = first
+    A_j, b_j, C_j, eta_j, J_j = _get_element(model, step)
+    F, c, Q_n, y, R, has_y = step
+    C = model["C"]
+    W_T = np.matmul(C, F)
+    C_iW = np.matmul(C_i, np.swapaxes(W_T, -1, -2))
+    S = np.matmul(np.matmul(C, Q_n), model["C_T"]) + R \
+        + np.matmul(W_T, C_iW)
+    M = _I - np.matmul(np.matmul(C_iW, inv_2x2(S, mask=has_y)), W_T)
+    A_jM = np.matmul(A_j, M)
+    A_iM_T = np.matmul(np.swapaxes(A_i, -1, -2), np.swapaxes(M, -1, -2))
+    return (np.matmul(A_jM, A_i),
+            np.matmul(A_jM, b_i + np.matmul(C_i, eta_j)) + b_j,
+            np.matmul(np.matmul(A_jM, C_i), np.swapaxes(A_j, -1, -2)) + C_j,
+            np.matmul(A_iM_T, eta_j - np.matmul(J_j, b_i)) + eta_i,
+            np.matmul(np.matmul(A_iM_T, J_j), A_i) + J_i)
+
+
+def _combine_filtered(filtered=None, second=None):
+    # a filtered estimate (b, C) composed with the element of later steps
+    b_i, C_i = filtered
+    A_j, b_j, C_j, eta_j, J_j = second
+    A_jM = np.matmul(A_j, np.linalg.inv(_I + np.matmul(C_i, J_j)))
+    return (np.matmul(A_jM, b_i + np.matmul(C_i, eta_j)) + b_j,
+            np.matmul(np.matmul(A_jM, C_i), np.swapaxes(A_j, -1, -2)) + C_j)
+
+
+def _reduce_chunk(task=None):
+    # the element of every block of a chunk, the blocks are composed side
+    # by side so the loop only runs over the block size
+    model, arrays, prior = task
+    blocks = _get_blocks(model, arrays, prior)
+    total = _get_element(model, [block[0] for block in blocks])
+    for i in range(1, len(blocks[0])):
+        total = _combine_step(model, total, [block[i] for block in blocks])
+    return total
+
+
+def _scan_chunk(task=None):
+    # plain filter steps from the estimate entering each block, again
+    # side by side over the blocks
+    model, arrays, prior, start, full = task
+    blocks = _get_blocks(model, arrays, prior)
+    size, count = blocks[0].shape[:2]
+    C = model["C"]
+    x, P = start
+    x_post = np.empty((size, count, 7, 1))
+    P_post = np.empty((size, count, 7, 7))
+    for i in range(size):
+        F, c, Q_n, y, R, has_y = [block[i] for block in blocks]
+        x = np.matmul(F, x) + c
+        P = np.matmul(np.matmul(F, P), np.swapaxes(F, 1, 2)) + Q_n
+        PC_T = np.matmul(P, model["C_T"])
+        K = np.matmul(PC_T, inv_2x2(np.matmul(C, PC_T) + R, mask=has_y))
+        x = x + np.matmul(K, y - np.matmul(C, x))
+        P = P - np.matmul(K, np.swapaxes(PC_T, 1, 2))
+        x_post[i] = x
+        P_post[i] = P
+    n = len(arrays[0])
+    x_post = np.swapaxes(x_post, 0, 1).reshape(-1, 7)[:n]
+    P_post = np.swapaxes(P_post, 0, 1).reshape(-1, 7, 7)[:n]
+    if full:
+        return x_post, P_post
+    else:
+        return x_post, np.diagonal(P_post, 0, 1, 2).copy()
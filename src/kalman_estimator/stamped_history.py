@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2019 Daniel Hammer. All Rights Reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+
+
+class StampedHistory(object):
+
+    def __init__(self, width=1, capacity=1024, dtype=np.float64):
+        if not isinstance(width, int) or width < 1:
+            raise ValueError("Invalid history width!")
+        if not isinstance(capacity, int) or capacity < 1:
+            raise ValueError("Invalid history capacity!")
+        self._width = width
+        self._len = 0
+        # stamps always stay float64, only the values follow dtype
+        self._time = np.zeros(capacity)
+        self._values = np.zeros((capacity, width), dtype)
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._len))]
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("History index out of range!")
+        return self._time[index], tuple(self._values[index])
+
+    def __iter__(self):
+        # stamped tuples are only built while iterating
+        for index in range(self._len):
+            yield self._time[index], tuple(self._values[index])
+
+    @classmethod
+    def from_arrays(cls, time=None, values=None):
+        if time is None or values is None:
+            raise ValueError
+        values = np.asarray(values)
+        if values.ndim != 2 or len(time) != len(values):
+            raise ValueError("Time and values do not match!")
+        else:
+            # wraps the arrays without copying, a later append reallocates
+            history = cls(values.shape[1], 1)
+            history._time = np.asarray(time)
+            history._values = values
+            history._len = len(values)
+            return history
+
+    def select(self, columns=None):
+        if columns is None:
+            raise ValueError
+        columns = np.asarray(columns)
+        if columns.dtype == bool:
+            if len(columns) != self._width:
+                raise ValueError("Column mask does not match width!")
+            columns = np.flatnonzero(columns)
+        if not len(columns):
+            raise ValueError("No columns selected!")
+        else:
+            step = columns[1] - columns[0] if len(columns) > 1 else 1
+            if step > 0 and np.all(np.diff(columns) == step):
+                # evenly spaced columns stay a view of this history
+                columns = slice(columns[0], columns[-1] + 1, step)
+            return StampedHistory.from_arrays(self.get_time(),
+                                              self.get_values()[:, columns])
+
+    def get_width(self):
+        return self._width
+
+    def get_time(self):
+        return self._time[:self._len]
+
+    def get_values(self):
+        return self._values[:self._len]
+
+    def clear(self):
+        self._len = 0
+
+    def append(self, t=None, values=None):
+        if t is None or values is None:
+            raise ValueError
+        else:
+            self._reserve(self._len + 1)
+            self._time[self._len] = t
+            self._values[self._len] = values
+            self._len += 1
+
+    def extend(self, time=None, values=None):
+        if time is None or values is None or len(time) != len(values):
+            raise ValueError
+        else:
+            new_time, new_values = self.allocate(len(time))
+            new_time[:] = time
+            new_values[:] = values
+
+    def allocate(self, n=0):
+        if not isinstance(n, int) or n < 0:
+            raise ValueError
+        else:
+            self._reserve(self._len + n)
+            start = self._len
+            self._len += n
+            return self._time[start:self._len], self._values[start:self._len]
+
+    def _reserve(self, capacity=0):
+        if capacity > len(self._time):
+            # grow geometrically so appends stay amortized O(1)
+            new_capacity = max(capacity, 2 * len(self._time))
+            time = np.zeros(new_capacity, dtype=self._time.dtype)
+            values = np.zeros((new_capacity, self._width),
+                              dtype=self._values.dtype)
+            time[:self._len] = self._time[:self._len]
+            values[:self._len] = self._values[:self._len]
+            self._time = time
+            self._values = values
+
+
+class StampedSink(object):
+
+    def __init__(self, width=1, size=1024, flush=None):
+        if flush is not None and not callable(flush):
+            raise ValueError("Passed flush not callable!")
+        self._history = StampedHistory(width, size)
+        self._size = size
+        self._flush = flush
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def get_width(self):
+        return self._history.get_width()
+
+    def get_time(self):
+        return self._history.get_time()
+
+    def get_values(self):
+        return self._history.get_values()
+
+    def append(self, t=None, values=None):
+        # a full buffer is only flushed on the next append, without a flush
+        # callback the sink simply keeps the latest block of rows
+        if len(self._history) == self._size:
+            self.flush()
+            self._history.clear()
+        self._history.append(t, values)
+        self._count += 1
+
+    def flush(self):
+        if self._flush is not None and len(self._history):
+            self._flush(self._history.get_time(), self._history.get_values())
+            self._history.clear()
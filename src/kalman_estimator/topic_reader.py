@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2019 Daniel Hammer. All Rights Reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import glob
+import heapq
+
+import numpy as np
+
+from bag_cache import BagCache, get_digest
+from message_decoders import euler_from_quaternions
+from message_decoders import decode_raw, get_raw_kind
+from stamped_history import StampedHistory
+
+
+class TopicReader(object):
+    fields = {
+        "odom": ("pos_x", "pos_y", "pos_z",
+                 "roll", "pitch", "yaw",
+                 "lin_x", "lin_y", "lin_z",
+                 "ang_x", "ang_y", "ang_z"),
+        "imu": ("accel_x", "accel_y", "accel_z",
+                "gyro_x", "gyro_y", "gyro_z"),
+        "twist": ("lin_x", "lin_y", "lin_z",
+                  "ang_x", "ang_y", "ang_z")
+    }
+    # odometry orientation is decoded as a quaternion and converted to
+    # roll, pitch and yaw for all messages at once
+    decoded_fields = dict(fields, odom=(
+        "pos_x", "pos_y", "pos_z",
+        "orient_x", "orient_y", "orient_z", "orient_w",
+        "lin_x", "lin_y", "lin_z",
+        "ang_x", "ang_y", "ang_z"))
+
+    # serialized messages decoded per np.frombuffer call
+    raw_batch = 4096
+    # one entry per message of a topic, sorted by receive time
+    index_dtype = np.dtype([("time", "<i8"), ("chunk_pos", "<u8"),
+                            ("offset", "<u4")])
+
+    def __init__(self, bag_path="", cache=None):
+        if not bag_path:
+            raise ValueError
+        if cache is not None and not isinstance(cache, BagCache):
+            raise ValueError("Passed cache not BagCache!")
+        else:
+            self._bag_path = bag_path
+            self._cache = cache
+            self._indexes = {}
+
+    def get_start_time(self):
+        raise NotImplementedError
+
+    def get_end_time(self):
+        raise NotImplementedError
+
+    def read_topics(self, topics=None, start_time=None, end_time=None):
+        self._check_topics(topics)
+        window = self._get_window(start_time, end_time)
+        stamped_topics = {}
+        if self._cache:
+            for topic, kind in topics.items():
+                stamped_data = self._cache.load(self._bag_path,
+                                                topic, kind, window)
+                if stamped_data is not None:
+                    stamped_topics[topic] = stamped_data
+        missing = dict((topic, kind) for topic, kind in topics.items()
+                       if topic not in stamped_topics)
+        if missing:
+            decoded_topics = self._decode_topics(missing, *window)
+            if self._cache:
+                for topic, kind in missing.items():
+                    self._cache.store(self._bag_path, topic, kind,
+                                      decoded_topics[topic], window)
+            stamped_topics.update(decoded_topics)
+        return stamped_topics
+
+    def read_odom(self, topic=None):
+        if not topic:
+            raise ValueError
+        else:
+            return self.read_topics({topic: "odom"})[topic]
+
+    def read_imu(self, topic=None):
+        if not topic:
+            raise ValueError
+        else:
+            return self.read_topics({topic: "imu"})[topic]
+
+    def read_twist(self, topic=None):
+        if not topic:
+            raise ValueError
+        else:
+            return self.read_topics({topic: "twist"})[topic]
+
+    def get_index(self, topic=None):
+        if not topic:
+            raise ValueError
+        elif topic not in self._indexes:
+            # the index is kept as a sidecar .npy next to the bag, keyed
+            # like the cache so a rewritten bag gets a new one
+            path = self._get_index_path(topic)
+            if os.path.exists(path):
+                index = np.load(path, mmap_mode='r')
+            else:
+                index = self._build_index(topic)
+                self._store_index(path, index)
+            self._indexes[topic] = index
+        return self._indexes[topic]
+
+    def seek(self, topic=None, t=None):
+        if t is None:
+            raise ValueError
+        else:
+            index = self.get_index(topic)
+            return int(np.searchsorted(index["time"], int(round(t * 1e9))))
+
+    def read_range(self, topic=None, kind=None, start_time=None, count=1):
+        self._check_topics({topic: kind})
+        if count < 0:
+            raise ValueError("Invalid message count!")
+        else:
+            index = self.get_index(topic)
+            start = 0 if start_time is None else self.seek(topic, start_time)
+            entries = index[start:start + count]
+            stamped_data = StampedHistory(len(self.decoded_fields[kind]),
+                                          max(len(entries), 1))
+            for datatype, data in self._read_entries(topic, entries):
+                if get_raw_kind(datatype) == kind:
+                    stamped_data.extend(*decode_raw(datatype, [data]))
+                else:
+                    stamped_data.append(*self._decode_message(
+                        kind, (datatype, data)))
+            return StampedHistory.from_arrays(
+                stamped_data.get_time(),
+                self._get_fields(kind, stamped_data.get_values()))
+
+    def stream_topics(self, topics=None, delay=0.5,
+                      start_time=None, end_time=None):
+        self._check_topics(topics)
+        # messages are stored by receive time, a heap holding the last
+        # delay seconds puts them back into header stamp order
+        heap = []
+        index = 0
+        start_time, end_time = self._get_window(start_time, end_time)
+        for topic, datatype, data, raw_message in self._read_raw(
+                list(topics), start_time, end_time):
+            kind = topics[topic]
+            if get_raw_kind(datatype) == kind:
+                time, values = decode_raw(datatype, [data])
+                t, data = time[0], values
+            else:
+                t, data = self._decode_message(kind, raw_message)
+                data = np.array([data])
+            data = tuple(self._get_fields(kind, data)[0])
+            heapq.heappush(heap, (t, index, topic, data))
+            index += 1
+            while heap[0][0] <= t - delay:
+                t_k, _index, topic_k, data_k = heapq.heappop(heap)
+                yield topic_k, t_k, data_k
+        while heap:
+            t_k, _index, topic_k, data_k = heapq.heappop(heap)
+            yield topic_k, t_k, data_k
+
+    def stream_tuy(self, input_twist=None, output_imu=None,
+                   input_columns=(0, 5), output_columns=(0, 5), delay=0.5,
+                   start_time=None, end_time=None):
+        # the same events as an EventTable over both topics: one per
+        # distinct stamp with the input held, y is None for events without
+        # a new output so the filter skips the measurement update
+        if not input_twist or not output_imu:
+            raise ValueError("Input or output topic not defined!")
+        else:
+            u = (0, 0)
+            event = None
+            topics = {input_twist: "twist", output_imu: "imu"}
+            for topic, t, data in self.stream_topics(topics, delay,
+                                                     start_time, end_time):
+                if event is not None and event[0] != t:
+                    yield tuple(event)
+                if event is None or event[0] != t:
+                    event = [t, u, None]
+                if topic == input_twist:
+                    u = tuple(data[i] for i in input_columns)
+                    event[1] = u
+                else:
+                    event[2] = tuple(data[i] for i in output_columns)
+            if event is not None:
+                yield tuple(event)
+
+    def _read_raw(self, topics=None, start_time=None, end_time=None):
+        # yields (topic, datatype, data, raw_message) in bag order
+        raise NotImplementedError
+
+    def _decode_message(self, kind=None, raw_message=None):
+        # decodes a message without a raw layout into (t, decoded_fields)
+        raise NotImplementedError
+
+    def _get_message_count(self, topic=None, start_time=None, end_time=None):
+        raise NotImplementedError
+
+    def _build_index(self, topic=None):
+        # returns the index_dtype entries of a topic
+        raise NotImplementedError
+
+    def _read_entries(self, topic=None, entries=None):
+        # returns the (datatype, data) raw messages behind index entries
+        raise NotImplementedError
+
+    def _get_index_path(self, topic=None):
+        stat = os.stat(self._bag_path)
+        return os.path.join(self._bag_path + ".idx", "{}_{}.npy".format(
+            get_digest(topic), get_digest(stat.st_size, repr(stat.st_mtime))))
+
+    @staticmethod
+    def _store_index(path=None, index=None):
+        directory = os.path.dirname(path)
+        try:
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+            # indexes of older versions of the bag are stale
+            for stale_path in glob.glob(path[:path.rindex("_")] + "_*.npy"):
+                os.remove(stale_path)
+            tmp_path = path + ".tmp.npy"
+            np.save(tmp_path, index)
+            os.rename(tmp_path, path)
+        except (IOError, OSError):
+            # read-only bag directories just keep the index in memory
+            pass
+
+    def _decode_topics(self, topics=None, start_time=None, end_time=None):
+        if not topics:
+            raise ValueError
+        else:
+            # a single pass over the bag, each message is written into the
+            # preallocated columns of its topic
+            stamped_topics = {}
+            for topic, kind in topics.items():
+                count = self._get_message_count(topic, start_time, end_time)
+                stamped_topics[topic] = StampedHistory(
+                    len(self.decoded_fields[kind]), max(count, 1))
+            # known message types are decoded in batches from the raw
+            # buffers, anything else goes through _decode_message
+            buffers = dict((topic, []) for topic in topics)
+            datatypes = {}
+            for topic, datatype, data, raw_message in self._read_raw(
+                    list(topics), start_time, end_time):
+                if get_raw_kind(datatype) == topics[topic]:
+                    datatypes[topic] = datatype
+                    buffers[topic].append(data)
+                    if len(buffers[topic]) == self.raw_batch:
+                        stamped_topics[topic].extend(
+                            *decode_raw(datatype, buffers[topic]))
+                        buffers[topic] = []
+                else:
+                    stamped_topics[topic].append(
+                        *self._decode_message(topics[topic], raw_message))
+            for topic in topics:
+                if buffers[topic]:
+                    stamped_topics[topic].extend(
+                        *decode_raw(datatypes[topic], buffers[topic]))
+            for topic, kind in topics.items():
+                stamped_topics[topic] = StampedHistory.from_arrays(
+                    stamped_topics[topic].get_time(),
+                    self._get_fields(kind,
+                                     stamped_topics[topic].get_values()))
+            return stamped_topics
+
+    def _check_topics(self, topics=None):
+        if not topics or not isinstance(topics, dict):
+            raise ValueError
+        if not all(kind in self.fields for kind in topics.values()):
+            raise ValueError("Unknown message kind!")
+
+    @staticmethod
+    def _get_fields(kind=None, decoded_values=None):
+        if kind == "odom":
+            euler = euler_from_quaternions(decoded_values[:, 3:7])
+            return np.hstack((decoded_values[:, :3], euler,
+                              decoded_values[:, 7:]))
+        else:
+            return decoded_values
+
+    @staticmethod
+    def _get_window(start_time=None, end_time=None):
+        if start_time is not None and end_time is not None and \
+                end_time < start_time:
+            raise ValueError("Window ends before it starts!")
+        if end_time is not None and np.isinf(end_time):
+            end_time = None
+        return start_time, end_time
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+import rosunit
+import numpy as np
+
+from kalman_estimator import BagCache, StampedHistory
+
+
+def get_stamped_data(T=10, width=6):
+    time = np.arange(T) * 0.01
+    values = np.arange(T * width, dtype=float).reshape(T, width)
+    return StampedHistory.from_arrays(time, values)
+
+
+class TestBagCache(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._bag_path = os.path.join(self._directory, "test.bag")
+        with open(self._bag_path, "w") as bag:
+            bag.write("bag")
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def test_init(self):
+        self.assertRaises(ValueError, BagCache)
+        self.assertRaises(ValueError, BagCache, self._directory, 0)
+
+    def test_store_load(self):
+        cache = BagCache(os.path.join(self._directory, "cache"))
+        self.assertIsNone(cache.load(self._bag_path, "/imu", "imu"))
+        stamped_data = get_stamped_data()
+        cache.store(self._bag_path, "/imu", "imu", stamped_data)
+        loaded = cache.load(self._bag_path, "/imu", "imu")
+        np.testing.assert_array_equal(loaded.get_time(),
+                                      stamped_data.get_time())
+        np.testing.assert_array_equal(loaded.get_values(),
+                                      stamped_data.get_values())
+        self.assertIsNone(cache.load(self._bag_path, "/imu", "twist"))
+
+    def test_invalidate(self):
+        cache = BagCache(os.path.join(self._directory, "cache"))
+        cache.store(self._bag_path, "/imu", "imu", get_stamped_data())
+        cache.store(self._bag_path, "/twist", "twist", get_stamped_data())
+        cache.invalidate(os.path.join(self._directory, "other.bag"))
+        self.assertIsNotNone(cache.load(self._bag_path, "/imu", "imu"))
+        cache.invalidate(self._bag_path)
+        self.assertIsNone(cache.load(self._bag_path, "/imu", "imu"))
+        self.assertEqual(cache.get_size(), 0)
+
+    def test_modified_bag(self):
+        cache = BagCache(os.path.join(self._directory, "cache"))
+        cache.store(self._bag_path, "/imu", "imu", get_stamped_data())
+        with open(self._bag_path, "a") as bag:
+            bag.write("more")
+        self.assertIsNone(cache.load(self._bag_path, "/imu", "imu"))
+        cache.store(self._bag_path, "/imu", "imu", get_stamped_data())
+        self.assertEqual(len(os.listdir(cache.get_directory())), 1)
+
+    def test_eviction(self):
+        entry_size = get_stamped_data(width=7).get_values().nbytes + 128
+        cache = BagCache(os.path.join(self._directory, "cache"),
+                         2 * entry_size)
+        for k, topic in enumerate(("/a", "/b", "/c")):
+            cache.store(self._bag_path, topic, "imu", get_stamped_data())
+            path = cache._get_path(self._bag_path, topic, "imu")
+            os.utime(path, (k, k))
+            if topic == "/b":
+                # a load marks "/a" as the most recently used entry
+                cache.load(self._bag_path, "/a", "imu")
+        self.assertLessEqual(cache.get_size(), 2 * entry_size)
+        self.assertIsNotNone(cache.load(self._bag_path, "/a", "imu"))
+        self.assertIsNone(cache.load(self._bag_path, "/b", "imu"))
+
+
+if __name__ == '__main__':
+    rosunit.unitrun("kalman_estimator", 'test_bag_cache', TestBagCache)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+import unittest
+import rosunit
+import numpy as np
+
+from kalman_estimator import EventTable, StateEstimator, StampedHistory
+
+
+class TestEventTable(unittest.TestCase):
+    def test_init(self):
+        self.assertRaises(ValueError, EventTable, None, [1.])
+        self.assertRaises(ValueError, EventTable, [[1.]], [1.])
+
+    def test_unsorted(self):
+        # header stamps slightly out of receive order are sorted, ties
+        # keep the order they were received in
+        event_table = EventTable([0.1, 0.3, 0.2], [0.3, 0.2, 0.2])
+        np.testing.assert_array_equal(event_table.get_time(),
+                                      (0.1, 0.2, 0.3))
+        np.testing.assert_array_equal(event_table.get_input_index(),
+                                      (0, 2, 1))
+        np.testing.assert_array_equal(event_table.get_output_index(),
+                                      (-1, 2, 0))
+        U = event_table.get_input([[1, 1], [3, 3], [2, 2]])
+        np.testing.assert_array_equal(U, [[1, 1], [2, 2], [3, 3]])
+        Y = event_table.get_output([[3, 3], [1, 1], [2, 2]])
+        np.testing.assert_array_equal(Y, [[0, 0], [2, 2], [3, 3]])
+
+    def test_merge(self):
+        event_table = EventTable([0.1, 0.2, 0.4], [0.2, 0.3, 0.4, 0.5])
+        np.testing.assert_array_equal(event_table.get_time(),
+                                      (0.1, 0.2, 0.3, 0.4, 0.5))
+        # ties are a single event carrying both samples
+        np.testing.assert_array_equal(event_table.get_has_u(),
+                                      (True, True, False, True, False))
+        np.testing.assert_array_equal(event_table.get_has_y(),
+                                      (False, True, True, True, True))
+        np.testing.assert_array_equal(event_table.get_input_index(),
+                                      (0, 1, 1, 2, 2))
+        np.testing.assert_array_equal(event_table.get_output_index(),
+                                      (-1, 0, 1, 2, 3))
+
+    def test_hold(self):
+        event_table = EventTable([0.2, 0.4], [0.1, 0.2, 0.3, 0.4])
+        U = event_table.get_input([[1, 1], [2, 2]])
+        np.testing.assert_array_equal(U, [[0, 0], [1, 1], [1, 1], [2, 2]])
+        Y = event_table.get_output([[1], [2], [3], [4]])
+        np.testing.assert_array_equal(Y, [[1], [2], [3], [4]])
+        self.assertRaises(ValueError, event_table.get_input, [[1, 1]])
+
+    def test_state_estimator(self):
+        input = StampedHistory.from_arrays([0.1, 0.2], [[1, 1], [2, 2]])
+        output = StampedHistory.from_arrays([0.2, 0.3], [[3, 3], [4, 4]])
+        state_estimator = StateEstimator()
+        for _ in range(2):
+            state_estimator.set_stamped_input(input)
+            state_estimator.set_stamped_output(output)
+        event_table = state_estimator.get_event_table()
+        self.assertEqual(len(event_table), 3)
+        self.assertIs(state_estimator.get_event_table(), event_table)
+        time, U, Y = state_estimator._get_merged_input_output()
+        np.testing.assert_array_equal(U, [[1, 1], [2, 2], [2, 2]])
+        np.testing.assert_array_equal(Y, [[0, 0], [3, 3], [4, 4]])
+
+
+if __name__ == '__main__':
+    rosunit.unitrun("kalman_estimator", 'test_event_table', TestEventTable)
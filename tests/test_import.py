@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+
+import sys
+import json
+import unittest
+import subprocess
+import rosunit
+
+IMPORT_SCRIPT = """
+import sys
+import json
+import time
+start = time.time()
+{}
+elapsed = time.time() - start
+print(json.dumps([elapsed, sorted(sys.modules)]))
+"""
+
+CORE_IMPORT = ("from kalman_estimator import KalmanFilter, "
+               "AdaptiveKalmanFilter, MovingWeightedSigWindow, StateEstimator")
+
+# packages only needed by the bag, plotting and butterworth helpers
+HEAVY_MODULES = ("scipy", "matplotlib", "rosbag", "rospy", "tf", "genpy",
+                 "lz4")
+
+
+def get_import(statement="", repeat=3):
+    # a fresh interpreter per import, the best of a few runs is kept so a
+    # cold file cache does not fail the budget
+    timings = []
+    for _ in range(repeat):
+        output = subprocess.check_output(
+            [sys.executable, "-c", IMPORT_SCRIPT.format(statement)])
+        elapsed, modules = json.loads(output.decode("utf-8"))
+        timings.append(elapsed)
+    return min(timings), modules
+
+
+class TestImport(unittest.TestCase):
+    # seconds on top of importing numpy itself
+    budget = 0.25
+
+    def test_core_modules(self):
+        _elapsed, modules = get_import(CORE_IMPORT)
+        loaded = [module for module in modules
+                  if module.split(".")[0] in HEAVY_MODULES]
+        self.assertEqual(loaded, [])
+
+    def test_import_time(self):
+        numpy_elapsed, _modules = get_import("import numpy")
+        core_elapsed, _modules = get_import("import numpy\n" + CORE_IMPORT)
+        self.assertLess(core_elapsed - numpy_elapsed, self.budget)
+
+
+if __name__ == '__main__':
+    rosunit.unitrun("kalman_estimator", 'test_import', TestImport)
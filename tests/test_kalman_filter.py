@@ -0,0 +1,531 @@
+#!/usr/bin/env python
+
+import unittest
+import rosunit
+import numpy as np
+
+from kalman_estimator import KalmanFilter, BatchKalmanFilter
+from kalman_estimator import AdaptiveKalmanFilter, MovingWeightedSigWindow
+from kalman_estimator import MovingWeightedSigExpWindow
+from kalman_estimator import pack_covariances, unpack_covariances
+from kalman_estimator import allocate_history, rts_smooth
+from kalman_estimator import KalmanEstimator, StampedHistory
+from kalman_estimator import BatchKalmanEstimator
+from kalman_estimator import ParallelKalmanFilter
+
+
+def get_kalman_filter(micro_v=6, micro_dpsi=0.147, r1=0.05, r2=0.385,
+                      kernel="dense", dtype=np.float64):
+    R_k = np.zeros((2, 2))
+    R_k[0][0] = 0.04 * 0.04
+    R_k[1][1] = 0.02 * 0.02
+    Q_k = np.zeros((2, 2))
+    Q_k[0][0] = R_k[0][0] * r1 * r1
+    Q_k[1][1] = R_k[1][1] * r2 * r2
+    return KalmanFilter(Q_k, R_k, 10.905, 1.5267, 1.02, 0.25, 0.14,
+                        micro_v, micro_dpsi, kernel=kernel, dtype=dtype)
+
+
+def get_adaptive_kalman_filter(size=5, offline=False, window=None,
+                               kernel="dense", dtype=np.float64):
+    R_k = np.zeros((2, 2))
+    R_k[0][0] = 0.04 * 0.04
+    R_k[1][1] = 0.02 * 0.02
+    Q_k = np.zeros((2, 2))
+    Q_k[0][0] = R_k[0][0] * 0.05 * 0.05
+    Q_k[1][1] = R_k[1][1] * 0.385 * 0.385
+    M_k = np.zeros((2, 2))
+    M_k[0][0] = 100
+    M_k[1][1] = 0.02
+    return AdaptiveKalmanFilter(Q_k, R_k, 10.905, 1.5267, 1.02, 0.25, 0.14,
+                                6, 0.147,
+                                window or MovingWeightedSigWindow(size, 7),
+                                M_k, kernel=kernel, offline=offline,
+                                dtype=dtype)
+
+
+def get_stepped_U(T=200):
+    np.random.seed(1)
+    U = np.round(np.random.rand(T, 2) * 4) / 8
+    hold = np.random.rand(T) < 0.5
+    for k in range(1, T):
+        if hold[k]:
+            U[k] = U[k - 1]
+    return U
+
+
+def get_tuy(T=200):
+    np.random.seed(0)
+    t = np.arange(1, T + 1) * 0.02
+    U = np.zeros((T, 2))
+    U[T // 4:3 * T // 4, 0] = 0.5
+    U[T // 2:, 1] = 0.3
+    Y = np.random.normal(0, 0.05, (T, 2))
+    Y[:, 1] += np.linspace(0, 1, T)
+    return t, U, Y
+
+
+def run_filter_iter(kalman_filter, t, U, Y):
+    states = np.zeros((len(t), 7))
+    for k in range(len(t)):
+        kalman_filter.filter_iter((t[k], tuple(U[k]), tuple(Y[k])))
+        states[k] = kalman_filter.get_post_states()[:, 0]
+    return states
+
+
+class TestKalmanFilter(unittest.TestCase):
+    def test_init(self):
+        self.assertRaises(ValueError, get_kalman_filter, kernel="sparse")
+
+    def test_kernels(self):
+        t, U, Y = get_tuy()
+        dense_states = run_filter_iter(get_kalman_filter(), t, U, Y)
+        for kernel in KalmanFilter.kernels:
+            states = run_filter_iter(get_kalman_filter(kernel=kernel),
+                                     t, U, Y)
+            np.testing.assert_allclose(states, dense_states,
+                                       rtol=1e-9, atol=1e-12)
+
+    def test_kernels_coupled_noise(self):
+        t, U, Y = get_tuy()
+        Q_k = np.array([[4e-6, 1e-6], [1e-6, 6e-8]])
+        R_k = np.array([[1.6e-3, 2e-4], [2e-4, 4e-4]])
+        x0 = (0, 0, 0, 0, 0.5, 0, 0)
+        dense_states = run_filter_iter(
+            KalmanFilter(Q_k, R_k, 10.905, 1.5267, 1.02, 0.25, 0.14,
+                         6, 0.147, x0), t, U, Y)
+        for kernel in ("in_place", "block"):
+            kalman_filter = KalmanFilter(Q_k, R_k, 10.905, 1.5267, 1.02,
+                                         0.25, 0.14, 6, 0.147, x0,
+                                         kernel=kernel)
+            states = run_filter_iter(kalman_filter, t, U, Y)
+            np.testing.assert_allclose(states, dense_states,
+                                       rtol=1e-9, atol=1e-12)
+        self.assertRaises(ValueError, KalmanFilter, Q_k, R_k, 10.905,
+                          1.5267, 1.02, 0.25, 0.14, 6, 0.147, x0,
+                          kernel="sequential")
+
+    def test_cholesky(self):
+        t, U, Y = get_tuy()
+        Q_k = np.array([[4e-6, 1e-7], [1e-7, 6e-8]])
+        R_k = np.array([[1.6e-3, 2e-4], [2e-4, 4e-4]])
+        filters = [KalmanFilter(Q_k, R_k, 10.905, 1.5267, 1.02, 0.25, 0.14,
+                                6, 0.147, kernel=kernel)
+                   for kernel in ("dense", "cholesky")]
+        P_packed = np.zeros((2, len(t), 28))
+        states = [kalman_filter.filter_batch(t, U, Y, P_packed=P_packed[i])
+                  for i, kalman_filter in enumerate(filters)]
+        np.testing.assert_allclose(states[1], states[0],
+                                   rtol=1e-9, atol=1e-12)
+        np.testing.assert_allclose(P_packed[1], P_packed[0],
+                                   rtol=1e-7, atol=1e-15)
+        np.testing.assert_allclose(unpack_covariances(P_packed[1][-1]),
+                                   filters[1].get_post_covariance())
+
+    def test_cholesky_Q(self):
+        t, U, Y = get_tuy()
+        R_k = np.diag([1.6e-3, 4e-4])
+        # a semidefinite Q has no Cholesky factor but still a square root
+        Q_k = 4e-6 * np.array([[1, 0.5], [0.5, 0.25]])
+        states = [KalmanFilter(Q_k, R_k, 10.905, 1.5267, 1.02, 0.25, 0.14,
+                               6, 0.147, kernel=kernel).filter_batch(t, U, Y)
+                  for kernel in ("dense", "cholesky")]
+        np.testing.assert_allclose(states[1], states[0],
+                                   rtol=1e-9, atol=1e-12)
+        self.assertRaises(ValueError, KalmanFilter,
+                          np.array([[4e-6, 8e-6], [8e-6, 4e-6]]), R_k,
+                          kernel="cholesky")
+        # the adaptive filters replace Q every step, the factor follows
+        U = get_stepped_U()
+        states = [get_adaptive_kalman_filter(kernel=kernel).filter_batch(
+            t, U, Y) for kernel in ("dense", "cholesky")]
+        np.testing.assert_allclose(states[1], states[0],
+                                   rtol=1e-9, atol=1e-12)
+
+    def test_pack_covariances(self):
+        P = np.random.rand(3, 7, 7)
+        P += np.swapaxes(P, 1, 2)
+        P_packed = pack_covariances(P)
+        self.assertEqual(P_packed.shape, (3, 28))
+        np.testing.assert_array_equal(unpack_covariances(P_packed), P)
+        self.assertRaises(ValueError, unpack_covariances, np.zeros(27))
+
+    def test_float32(self):
+        t, U, Y = get_tuy()
+        self.assertRaises(ValueError, get_kalman_filter, kernel="in_place",
+                          dtype=np.int32)
+        # dense in float32 runs the in_place kernel
+        kalman_filter = get_kalman_filter(dtype=np.float32)
+        np.testing.assert_array_equal(
+            kalman_filter.filter_batch(t, U, Y),
+            get_kalman_filter(kernel="in_place",
+                              dtype=np.float32).filter_batch(t, U, Y))
+        self.assertEqual(kalman_filter.get_post_states().dtype, np.float32)
+        U = get_stepped_U()
+        adaptive_kalman_filter = get_adaptive_kalman_filter(
+            dtype=np.float32)
+        np.testing.assert_allclose(
+            adaptive_kalman_filter.filter_batch(t, U, Y),
+            get_adaptive_kalman_filter().filter_batch(t, U, Y), atol=1e-4)
+        self.assertEqual(adaptive_kalman_filter.get_post_states().dtype,
+                         np.float32)
+        dense_states = get_kalman_filter().filter_batch(t, U, Y)
+        for kernel in KalmanFilter.kernels[1:]:
+            kalman_filter = get_kalman_filter(kernel=kernel,
+                                              dtype=np.float32)
+            states = kalman_filter.filter_batch(t, U, Y)
+            self.assertEqual(kalman_filter.get_post_states().dtype,
+                             np.float32)
+            np.testing.assert_allclose(states, dense_states, atol=1e-4)
+
+    def test_sequential_missing_channel(self):
+        t, U, Y = get_tuy()
+        Y[:, 1] = np.nan
+        Y[::5] = np.nan
+        states = get_kalman_filter(kernel="sequential").filter_batch(t, U, Y)
+        # a missing channel is as good as one with an infinite variance
+        kalman_filter = get_kalman_filter()
+        kalman_filter._R_k[1][1] = 1e30
+        ignored_states = kalman_filter.filter_batch(
+            t, U, np.nan_to_num(Y), has_y=~np.isnan(Y[:, 0]))
+        np.testing.assert_allclose(states, ignored_states,
+                                   rtol=1e-6, atol=1e-9)
+
+    def test_filter_batch(self):
+        t, U, Y = get_tuy()
+        states = run_filter_iter(get_kalman_filter(), t, U, Y)
+        kalman_filter = get_kalman_filter()
+        batch_states = np.zeros((len(t), 7))
+        P_diag = np.zeros((len(t), 7))
+        Q_diag = np.zeros((len(t), 2))
+        kalman_filter.filter_batch(t, U, Y, batch_states, P_diag, Q_diag)
+        np.testing.assert_array_equal(batch_states, states)
+        np.testing.assert_array_equal(
+            P_diag[-1], kalman_filter._P_k_post.diagonal())
+        np.testing.assert_array_equal(
+            Q_diag[-1], kalman_filter._Q_k.diagonal())
+        self.assertRaises(ValueError, kalman_filter.filter_batch,
+                          t, U[:-1], Y)
+
+    def test_prediction_only(self):
+        t, U, Y = get_tuy()
+        has_y = np.arange(len(t)) % 4 == 0
+        dense_states = get_kalman_filter().filter_batch(t, U, Y,
+                                                        has_y=has_y)
+        # measurements between updates are never looked at
+        stale_Y = np.where(has_y[:, np.newaxis], Y, 99.)
+        for kernel in KalmanFilter.kernels:
+            states = get_kalman_filter(kernel=kernel).filter_batch(
+                t, U, stale_Y, has_y=has_y)
+            np.testing.assert_allclose(states, dense_states,
+                                       rtol=1e-9, atol=1e-12)
+        kalman_filter = get_kalman_filter()
+        for k in range(len(t)):
+            kalman_filter.filter_iter(
+                (t[k], tuple(U[k]), tuple(Y[k]) if has_y[k] else None))
+        np.testing.assert_array_equal(kalman_filter.get_post_states()[:, 0],
+                                      dense_states[-1])
+        self.assertRaises(ValueError, kalman_filter.filter_batch,
+                          t, U, Y, has_y=has_y[:-1])
+
+    def test_reset(self):
+        t, U, Y = get_tuy()
+        for kernel in KalmanFilter.kernels:
+            kalman_filter = get_kalman_filter(kernel=kernel)
+            kalman_filter.filter_batch(t, U[::-1], Y[::-1])
+            kalman_filter.reset()
+            np.testing.assert_array_equal(
+                kalman_filter.filter_batch(t, U, Y),
+                get_kalman_filter(kernel=kernel).filter_batch(t, U, Y))
+
+    def test_estimator(self):
+        t, U, Y = get_tuy()
+        kalman_estimator = KalmanEstimator(get_kalman_filter(8))
+        # new data has to be filtered again from x0
+        for T in (len(t), len(t) // 2):
+            fresh_kalman_estimator = KalmanEstimator(get_kalman_filter(8))
+            for estimator in (kalman_estimator, fresh_kalman_estimator):
+                estimator.set_stamped_input(
+                    StampedHistory.from_arrays(t[:T], U[:T]))
+                estimator.set_stamped_output(
+                    StampedHistory.from_arrays(t[:T:2], Y[:T:2]))
+            np.testing.assert_array_equal(
+                kalman_estimator.get_stamped_states().get_values(),
+                fresh_kalman_estimator.get_stamped_states().get_values())
+
+
+class TestAdaptiveKalmanFilter(unittest.TestCase):
+    def test_offline(self):
+        t, _, Y = get_tuy()
+        U = get_stepped_U()
+        for size in (5, 20):
+            online = get_adaptive_kalman_filter(size)
+            Q_diag = np.zeros((len(t), 2))
+            states = online.filter_batch(t, U, Y, Q_diag=Q_diag)
+            self.assertGreater(len(np.unique(Q_diag[:, 0])), 2)
+            offline = get_adaptive_kalman_filter(size, offline=True)
+            offline_Q_diag = np.zeros((len(t), 2))
+            offline_states = offline.filter_batch(
+                t, U, Y, Q_diag=offline_Q_diag)
+            np.testing.assert_allclose(offline_Q_diag, Q_diag, rtol=1e-12)
+            np.testing.assert_allclose(offline_states, states,
+                                       rtol=1e-9, atol=1e-12)
+
+    def test_offline_then_online(self):
+        t, _, Y = get_tuy()
+        U = get_stepped_U()
+        states = run_filter_iter(get_adaptive_kalman_filter(), t, U, Y)
+        adaptive_kalman_filter = get_adaptive_kalman_filter(offline=True)
+        offline_states = adaptive_kalman_filter.filter_batch(
+            t[:50], U[:50], Y[:50])
+        online_states = run_filter_iter(adaptive_kalman_filter,
+                                        t[50:], U[50:], Y[50:])
+        np.testing.assert_allclose(
+            np.vstack((offline_states, online_states)), states,
+            rtol=1e-9, atol=1e-12)
+
+    def test_recursive_window(self):
+        t, _, Y = get_tuy()
+        U = get_stepped_U()
+        states = run_filter_iter(get_adaptive_kalman_filter(
+            window=MovingWeightedSigExpWindow(20, 7)), t, U, Y)
+        adaptive_kalman_filter = get_adaptive_kalman_filter(
+            offline=True, window=MovingWeightedSigExpWindow(20, 7))
+        offline_states = adaptive_kalman_filter.filter_batch(
+            t[:50], U[:50], Y[:50])
+        online_states = run_filter_iter(adaptive_kalman_filter,
+                                        t[50:], U[50:], Y[50:])
+        np.testing.assert_allclose(
+            np.vstack((offline_states, online_states)), states,
+            rtol=1e-9, atol=1e-12)
+
+    def test_reset(self):
+        t, _, Y = get_tuy()
+        U = get_stepped_U()
+        for offline in (False, True):
+            for window in (MovingWeightedSigWindow(20, 7),
+                           MovingWeightedSigExpWindow(20, 7)):
+                adaptive_kalman_filter = get_adaptive_kalman_filter(
+                    offline=offline, window=window)
+                adaptive_kalman_filter.filter_batch(t, U[::-1], Y[::-1])
+                adaptive_kalman_filter.reset()
+                Q_diag = np.zeros((len(t), 2))
+                states = adaptive_kalman_filter.filter_batch(
+                    t, U, Y, Q_diag=Q_diag)
+                fresh_Q_diag = np.zeros((len(t), 2))
+                fresh_states = get_adaptive_kalman_filter(
+                    offline=offline, window=window).filter_batch(
+                        t, U, Y, Q_diag=fresh_Q_diag)
+                np.testing.assert_array_equal(Q_diag, fresh_Q_diag)
+                np.testing.assert_array_equal(states, fresh_states)
+
+    def test_step_input(self):
+        # a unit step leaving the window must not shrink Q below Ro R
+        t, _, Y = get_tuy()
+        np.random.seed(0)
+        U = np.zeros((len(t), 2))
+        U[len(t) // 4:] = 1
+        U += np.random.rand(len(t), 2) * 1e-3
+        for offline in (False, True):
+            adaptive_kalman_filter = get_adaptive_kalman_filter(
+                offline=offline, window=MovingWeightedSigExpWindow(20, 10))
+            Q_diag = np.zeros((len(t), 2))
+            adaptive_kalman_filter.filter_batch(t, U, Y, Q_diag=Q_diag)
+            self.assertGreaterEqual(Q_diag[:, 0].min(),
+                                    0.04 * 0.04 * 0.05 * 0.05 * (1 - 1e-9))
+            self.assertGreaterEqual(Q_diag[:, 1].min(),
+                                    0.02 * 0.02 * 0.385 * 0.385 * (1 - 1e-9))
+
+
+class TestRTSSmoother(unittest.TestCase):
+    def test_smooth_batch(self):
+        t, U, Y = get_tuy()
+        has_y = np.arange(len(t)) % 2 == 0
+        history = allocate_history(len(t))
+        states = get_kalman_filter().filter_batch(t, U, Y, has_y=has_y,
+                                                  history=history)
+        P_smooth = np.zeros((len(t), 7, 7))
+        smoothed = rts_smooth(states, history, P_smooth)
+        # plain backward recursion as the reference
+        x_pre, P_pre, P_post, Phi = history
+        x_s = states.copy()
+        P_s = P_post.copy()
+        for k in range(len(t) - 2, -1, -1):
+            A = P_post[k].dot(Phi[k].T).dot(np.linalg.pinv(P_pre[k + 1]))
+            x_s[k] += A.dot(x_s[k + 1] - x_pre[k + 1])
+            P_s[k] += A.dot(P_s[k + 1] - P_pre[k + 1]).dot(A.T)
+        np.testing.assert_allclose(smoothed, x_s, rtol=1e-6, atol=1e-8)
+        np.testing.assert_allclose(P_smooth, P_s, rtol=1e-6, atol=1e-10)
+        np.testing.assert_array_equal(smoothed[-1], states[-1])
+        self.assertTrue(np.all(P_smooth.diagonal(0, 1, 2) <=
+                               P_post.diagonal(0, 1, 2) + 1e-12))
+        for kernel in KalmanFilter.kernels:
+            np.testing.assert_allclose(
+                get_kalman_filter(kernel=kernel).smooth_batch(
+                    t, U, Y, has_y=has_y), smoothed, rtol=1e-6, atol=1e-8)
+        self.assertRaises(ValueError, rts_smooth, states[1:], history)
+
+    def test_estimator(self):
+        t, U, Y = get_tuy()
+        kalman_estimator = KalmanEstimator(get_kalman_filter(), smooth=True)
+        kalman_estimator.set_stamped_input(StampedHistory.from_arrays(t, U))
+        kalman_estimator.set_stamped_output(StampedHistory.from_arrays(t, Y))
+        smoothed = kalman_estimator.get_stamped_smoothed_states()
+        np.testing.assert_array_equal(
+            smoothed.get_time(),
+            kalman_estimator.get_stamped_states().get_time())
+        # psi is wrapped by the estimator
+        np.testing.assert_allclose(
+            np.delete(smoothed.get_values(), 4, 1),
+            np.delete(get_kalman_filter().smooth_batch(t, U, Y), 4, 1),
+            atol=1e-12)
+        self.assertRaises(ValueError, KalmanEstimator(
+            get_kalman_filter()).get_stamped_smoothed_states)
+
+
+class TestParallelKalmanFilter(unittest.TestCase):
+    def test_init(self):
+        self.assertRaises(ValueError, ParallelKalmanFilter, None)
+        self.assertRaises(ValueError, ParallelKalmanFilter,
+                          get_kalman_filter(), 0)
+
+    def test_filter_batch(self):
+        t, U, Y = get_tuy(500)
+        has_y = np.arange(len(t)) % 3 != 1
+        P_diag = np.zeros((len(t), 7))
+        states = get_kalman_filter(kernel="in_place").filter_batch(
+            t, U, Y, P_diag=P_diag, has_y=has_y)
+        for processes in (1, 2):
+            parallel_kalman_filter = ParallelKalmanFilter(
+                get_kalman_filter(), processes)
+            # several chunks per process
+            parallel_kalman_filter.chunk_size = 64
+            parallel_P_diag = np.zeros((len(t), 7))
+            parallel_states = parallel_kalman_filter.filter_batch(
+                t, U, Y, P_diag=parallel_P_diag, has_y=has_y)
+            np.testing.assert_allclose(parallel_states, states,
+                                       rtol=1e-9, atol=1e-12)
+            np.testing.assert_allclose(parallel_P_diag, P_diag,
+                                       rtol=1e-9, atol=1e-15)
+            # psi only settles Phi_k after the first pass
+            self.assertEqual(parallel_kalman_filter.get_passes(), 2)
+        parallel_kalman_filter.filter_batch(t, U, Y, has_y=has_y,
+                                            reference=states)
+        self.assertEqual(parallel_kalman_filter.get_passes(), 1)
+        self.assertRaises(ValueError, parallel_kalman_filter.filter_batch,
+                          t, U[1:], Y)
+
+    def test_adaptive(self):
+        t, U, Y = get_tuy()
+        U = get_stepped_U(len(t))
+        Q_diag = np.zeros((len(t), 2))
+        states = get_adaptive_kalman_filter().filter_batch(t, U, Y,
+                                                           Q_diag=Q_diag)
+        parallel_Q_diag = np.zeros((len(t), 2))
+        parallel_states = ParallelKalmanFilter(
+            get_adaptive_kalman_filter()).filter_batch(
+                t, U, Y, Q_diag=parallel_Q_diag)
+        np.testing.assert_allclose(parallel_states, states,
+                                   rtol=1e-9, atol=1e-12)
+        np.testing.assert_allclose(parallel_Q_diag, Q_diag, rtol=1e-12)
+
+    def test_continue(self):
+        # starts from the prior and the stamp of a filter that already ran
+        t, U, Y = get_tuy()
+        states = get_kalman_filter().filter_batch(t, U, Y)
+        kalman_filter = get_kalman_filter(kernel="cholesky")
+        kalman_filter.filter_batch(t[:50], U[:50], Y[:50])
+        self.assertEqual(kalman_filter.get_time(), t[49])
+        parallel_states = ParallelKalmanFilter(kalman_filter).filter_batch(
+            t[50:], U[50:], Y[50:])
+        np.testing.assert_allclose(parallel_states, states[50:],
+                                   rtol=1e-9, atol=1e-12)
+        self.assertRaises(ValueError, ParallelKalmanFilter(
+            kalman_filter).filter_batch, t, U, Y, history=allocate_history(2))
+
+    def test_smooth_batch(self):
+        t, U, Y = get_tuy()
+        has_y = np.arange(len(t)) % 2 == 0
+        P_smooth = np.zeros((len(t), 7, 7))
+        smoothed = get_kalman_filter().smooth_batch(t, U, Y, has_y=has_y,
+                                                    P_smooth=P_smooth)
+        parallel_P_smooth = np.zeros((len(t), 7, 7))
+        parallel_smoothed = ParallelKalmanFilter(
+            get_kalman_filter()).smooth_batch(t, U, Y, has_y=has_y,
+                                              P_smooth=parallel_P_smooth)
+        np.testing.assert_allclose(parallel_smoothed, smoothed,
+                                   rtol=1e-6, atol=1e-8)
+        np.testing.assert_allclose(parallel_P_smooth, P_smooth,
+                                   rtol=1e-6, atol=1e-10)
+
+
+class TestBatchKalmanFilter(unittest.TestCase):
+    def test_init(self):
+        self.assertRaises(ValueError, BatchKalmanFilter, [])
+        self.assertRaises(ValueError, BatchKalmanFilter, [None])
+
+    def test_filter_batch(self):
+        t, U, Y = get_tuy()
+        params = [(4, 0.143, 0.05, 0.385), (6, 0.147, 0.05, 0.385),
+                  (8, 0.151, 0.001, 0.001), (6, 0.147, 9999, 9999)]
+        batch_kalman_filter = BatchKalmanFilter(
+            [get_kalman_filter(*p) for p in params])
+        batch_states = batch_kalman_filter.filter_batch(t, U, Y)
+        self.assertEqual(batch_states.shape, (len(params), len(t), 7))
+        for i, p in enumerate(params):
+            states = run_filter_iter(get_kalman_filter(*p), t, U, Y)
+            np.testing.assert_allclose(batch_states[i], states,
+                                       rtol=1e-9, atol=1e-12)
+
+    def test_prediction_only(self):
+        t, U, Y = get_tuy()
+        has_y = np.arange(len(t)) % 3 == 0
+        batch_kalman_filter = BatchKalmanFilter(
+            [get_kalman_filter(), get_kalman_filter(8, 0.151)])
+        batch_states = batch_kalman_filter.filter_batch(t, U, Y, has_y)
+        states = get_kalman_filter(8, 0.151).filter_batch(t, U, Y,
+                                                          has_y=has_y)
+        np.testing.assert_allclose(batch_states[1], states,
+                                   rtol=1e-9, atol=1e-12)
+
+    def test_estimator(self):
+        t, U, Y = get_tuy()
+        batch_kalman_estimator = BatchKalmanEstimator(
+            BatchKalmanFilter([get_kalman_filter(), get_kalman_filter(8)]))
+        # new data has to be filtered again from x0, the references are
+        # built fresh for every data set
+        for T in (len(t), len(t) // 2):
+            kalman_estimator = KalmanEstimator(get_kalman_filter(8))
+            fresh_batch_kalman_estimator = BatchKalmanEstimator(
+                BatchKalmanFilter([get_kalman_filter(),
+                                   get_kalman_filter(8)]))
+            for estimator in (batch_kalman_estimator, kalman_estimator,
+                              fresh_batch_kalman_estimator):
+                estimator.set_stamped_input(
+                    StampedHistory.from_arrays(t[:T], U[:T]))
+                estimator.set_stamped_output(
+                    StampedHistory.from_arrays(t[:T:2], Y[:T:2]))
+            time, batch_states = batch_kalman_estimator.get_batch_states()
+            fresh_batch_states = \
+                fresh_batch_kalman_estimator.get_batch_states()[1]
+            stamped_states = kalman_estimator.get_stamped_states()
+            np.testing.assert_array_equal(time, stamped_states.get_time())
+            np.testing.assert_array_equal(batch_states, fresh_batch_states)
+            np.testing.assert_allclose(batch_states[1],
+                                       stamped_states.get_values(),
+                                       rtol=1e-9, atol=1e-12)
+        self.assertIs(batch_kalman_estimator.get_batch_states()[1],
+                      batch_kalman_estimator.get_batch_states()[1])
+
+
+if __name__ == '__main__':
+    rosunit.unitrun("kalman_estimator", 'test_kalman_filter',
+                    TestKalmanFilter)
+    rosunit.unitrun("kalman_estimator", 'test_adaptive_kalman_filter',
+                    TestAdaptiveKalmanFilter)
+    rosunit.unitrun("kalman_estimator", 'test_rts_smoother',
+                    TestRTSSmoother)
+    rosunit.unitrun("kalman_estimator", 'test_parallel_kalman_filter',
+                    TestParallelKalmanFilter)
+    rosunit.unitrun("kalman_estimator", 'test_batch_kalman_filter',
+                    TestBatchKalmanFilter)
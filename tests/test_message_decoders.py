@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+import struct
+import unittest
+import rosunit
+import numpy as np
+from tf import transformations
+
+from kalman_estimator.message_decoders import euler_from_quaternions
+from kalman_estimator.message_decoders import decode_raw
+
+
+def pack_header(seq=0, secs=0, nsecs=0, frame_id=""):
+    return struct.pack("<3I", seq, secs, nsecs) + \
+        struct.pack("<I", len(frame_id)) + frame_id.encode("ascii")
+
+
+def pack_floats(values=()):
+    return struct.pack("<{}d".format(len(values)), *values)
+
+
+def pack_imu(secs=0, nsecs=0, frame_id="", gyro=(), accel=()):
+    return pack_header(1, secs, nsecs, frame_id) + \
+        pack_floats((0, 0, 0, 1) + (0,) * 9 + tuple(gyro) + (0,) * 9 +
+                    tuple(accel) + (0,) * 9)
+
+
+def pack_twist(secs=0, nsecs=0, frame_id="", twist=()):
+    return pack_header(1, secs, nsecs, frame_id) + \
+        pack_floats(tuple(twist) + (0,) * 36)
+
+
+def pack_odom(secs=0, nsecs=0, frame_id="", child_frame_id="", pose=(),
+              twist=()):
+    return pack_header(1, secs, nsecs, frame_id) + \
+        struct.pack("<I", len(child_frame_id)) + \
+        child_frame_id.encode("ascii") + \
+        pack_floats(tuple(pose) + (0,) * 36 + tuple(twist) + (0,) * 36)
+
+
+class TestEulerFromQuaternions(unittest.TestCase):
+    def test_init(self):
+        self.assertRaises(ValueError, euler_from_quaternions)
+        self.assertRaises(ValueError, euler_from_quaternions, np.zeros((2, 3)))
+
+    def test_tf(self):
+        np.random.seed(0)
+        quaternions = np.random.normal(0, 1, (200, 4))
+        quaternions[:100] /= np.linalg.norm(quaternions[:100], axis=1)[
+            :, np.newaxis]
+        # gimbal lock, identity, zero and unnormalized quaternions
+        quaternions[100] = (0, np.sqrt(0.5), 0, np.sqrt(0.5))
+        quaternions[101] = (0, -np.sqrt(0.5), 0, np.sqrt(0.5))
+        quaternions[102] = (0, 0, 0, 1)
+        quaternions[103] = (0, 0, 0, 0)
+        quaternions[104] = (0, 0, 3, 4)
+        euler = euler_from_quaternions(quaternions)
+        tf_euler = [transformations.euler_from_quaternion(q)
+                    for q in quaternions]
+        np.testing.assert_allclose(euler, tf_euler, rtol=1e-12, atol=1e-12)
+
+
+class TestDecodeRaw(unittest.TestCase):
+    def test_init(self):
+        self.assertRaises(ValueError, decode_raw, "std_msgs/String", [])
+        self.assertRaises(ValueError, decode_raw, "sensor_msgs/Imu",
+                          [pack_imu(frame_id="imu")[:-8]])
+
+    def test_imu(self):
+        buffers = [pack_imu(10, 500000000, "imu", (1, 2, 3), (4, 5, 6)),
+                   pack_imu(11, 0, "imu_link", (7, 8, 9), (10, 11, 12)),
+                   pack_imu(12, 250000000, "imu", (13, 14, 15), (16, 17, 18))]
+        time, values = decode_raw("sensor_msgs/Imu", buffers)
+        np.testing.assert_array_equal(time, [10.5, 11, 12.25])
+        np.testing.assert_array_equal(values, [[4, 5, 6, 1, 2, 3],
+                                               [10, 11, 12, 7, 8, 9],
+                                               [16, 17, 18, 13, 14, 15]])
+
+    def test_twist(self):
+        buffers = [pack_twist(1, 0, "", range(6)),
+                   pack_twist(2, 0, "base_link", range(6, 12))]
+        time, values = decode_raw(
+            "geometry_msgs/TwistWithCovarianceStamped", buffers)
+        np.testing.assert_array_equal(time, [1, 2])
+        np.testing.assert_array_equal(values, np.arange(12).reshape(2, 6))
+
+    def test_odom(self):
+        buffers = [pack_odom(1, 0, "odom", "base", range(7), range(7, 13)),
+                   pack_odom(2, 0, "odom", "base_link", range(13, 20),
+                             range(20, 26))]
+        time, values = decode_raw("nav_msgs/Odometry", buffers)
+        np.testing.assert_array_equal(time, [1, 2])
+        np.testing.assert_array_equal(values, np.arange(26).reshape(2, 13))
+
+
+if __name__ == '__main__':
+    rosunit.unitrun("kalman_estimator", 'test_message_decoders',
+                    TestEulerFromQuaternions)
+    rosunit.unitrun("kalman_estimator", 'test_decode_raw', TestDecodeRaw)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+import unittest
+import rosunit
+import numpy as np
+from collections import deque
+
+from kalman_estimator import MovingWeightedSigWindow, MovingWindowBuffer
+from kalman_estimator import MovingWeightedExpWindow
+from kalman_estimator import MovingWeightedSigExpWindow
+
+
+class TestMovingWindowBuffer(unittest.TestCase):
+    def test_init(self):
+        self.assertRaises(ValueError, MovingWindowBuffer, 0)
+        self.assertRaises(ValueError, MovingWindowBuffer(3).get_max)
+
+    def test_window(self):
+        np.random.seed(0)
+        buffer = MovingWindowBuffer(7)
+        reference = deque([], 7)
+        for x in np.random.randint(0, 5, 100) * 0.5:
+            buffer.append(x)
+            reference.append(x)
+            self.assertEqual(len(buffer), len(reference))
+            self.assertEqual(buffer.get_max(), max(reference))
+            np.testing.assert_array_equal(buffer.get_view(),
+                                          list(reference))
+
+    def test_max_view(self):
+        np.random.seed(0)
+        buffer = MovingWindowBuffer(7)
+        max_buffer = MovingWindowBuffer(7, keep_values=False)
+        samples = np.random.randint(0, 5, 100) * 0.5
+        for x in samples:
+            buffer.append(x)
+            max_buffer.append(x)
+        self.assertRaises(ValueError, max_buffer.get_view)
+        for size in range(1, 8):
+            self.assertEqual(max(buffer.get_view()[-size:]),
+                             max(max_buffer.get_max_view()[-size:]))
+
+
+class TestMovingWeightedSigWindow(unittest.TestCase):
+    def test_weighted_sum(self):
+        window = MovingWeightedSigWindow(5, 7)
+        array = [0.5, 0, 0.25, 0, 1]
+        self.assertAlmostEqual(window.get_weighted_sum(np.array(array)),
+                               window.get_weighted_sum(array))
+
+
+class TestRecursiveWeightedWindow(unittest.TestCase):
+    def test_init(self):
+        self.assertRaises(ValueError, MovingWeightedExpWindow, 5, 0)
+        self.assertRaises(ValueError, MovingWeightedSigExpWindow, 5, 7, 0)
+
+    def test_update(self):
+        np.random.seed(0)
+        array = np.random.rand(20)
+        for window in (MovingWeightedExpWindow(20),
+                       MovingWeightedSigExpWindow(20, 7)):
+            state = window.get_initial_state()
+            for x in array:
+                weighted_sum = window.update(state, x)
+            self.assertAlmostEqual(
+                weighted_sum, np.dot(array, window.get_weights()))
+            self.assertAlmostEqual(
+                weighted_sum, window.get_weighted_sum(array))
+            np.testing.assert_allclose(
+                window.get_moving_weighted_sums(array), [weighted_sum])
+
+    def test_sigmoid_fit(self):
+        for size in (5, 20, 200):
+            window = MovingWeightedSigExpWindow(size, 7)
+            np.testing.assert_allclose(
+                window.get_weights(),
+                MovingWeightedSigWindow(size, 7).get_weights(), atol=0.05)
+
+    def test_sigmoid_fit_positive(self):
+        # the weights beyond the window too, a sample leaving it must not
+        # turn the weighted sum negative
+        for size in (5, 20, 200):
+            for alpha in (3, 7, 10):
+                window = MovingWeightedSigExpWindow(size, alpha)
+                impulse = np.zeros(30 * size)
+                impulse[0] = 1
+                self.assertGreaterEqual(window.get_weights().min(), 0)
+                self.assertGreaterEqual(window.filter(impulse).min(),
+                                        -1e-12)
+
+
+if __name__ == '__main__':
+    rosunit.unitrun("kalman_estimator", 'test_moving_window_buffer',
+                    TestMovingWindowBuffer)
+    rosunit.unitrun("kalman_estimator", 'test_moving_weighted_sig_window',
+                    TestMovingWeightedSigWindow)
+    rosunit.unitrun("kalman_estimator", 'test_recursive_weighted_window',
+                    TestRecursiveWeightedWindow)
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+import rosunit
+import numpy as np
+
+from kalman_estimator import NativeBagReader, NativeBagWriter, BagSysIO
+from kalman_estimator import StateEstimator, KalmanFilter
+from kalman_estimator import KalmanEstimator, StampedSink
+from kalman_estimator.message_decoders import encode_raw
+
+IMU = "sensor_msgs/Imu"
+TWIST = "geometry_msgs/TwistWithCovarianceStamped"
+ODOM = "nav_msgs/Odometry"
+
+
+def write_bag(bag_path="", compression="none", T=60):
+    bag_writer = NativeBagWriter(bag_path, compression, chunk_threshold=4096)
+    for k in range(T):
+        t = 100 + 0.01 * k
+        bag_writer.write("/imu", IMU, encode_raw(
+            IMU, t, np.arange(k, k + 6), "imu_link"), t)
+        if k % 3 == 0:
+            bag_writer.write("/twist", TWIST, encode_raw(
+                TWIST, t + 0.005, [0.1 * k] * 6), t + 0.005)
+        if k % 5 == 0:
+            q = (0, 0, np.sin(0.01 * k), np.cos(0.01 * k))
+            bag_writer.write("/odom", ODOM, encode_raw(
+                ODOM, t, (1, 2, 3) + q + (4, 5, 6, 7, 8, 9),
+                "odom", "base_link"), t)
+    bag_writer.close()
+
+
+def get_kalman_filter():
+    R_k = np.diag((0.04 * 0.04, 0.02 * 0.02))
+    Q_k = np.diag((0.04 * 0.04 * 0.05 * 0.05, 0.02 * 0.02 * 0.385 * 0.385))
+    return KalmanFilter(Q_k, R_k, 10.905, 1.5267, 1.02, 0.25, 0.14,
+                        6, 0.147)
+
+
+def write_tuy_bag(bag_path="", T=300):
+    # imu and twist messages with shared stamps, and imu header stamps
+    # that run slightly out of receive order
+    np.random.seed(2)
+    bag_writer = NativeBagWriter(bag_path, chunk_threshold=4096)
+    for k in range(T):
+        t = 100 + 0.01 * k
+        if k % 4 == 1:
+            stamp = t + 0.015
+        elif k % 4 == 2:
+            stamp = t - 0.015
+        else:
+            stamp = t
+        bag_writer.write("/imu", IMU, encode_raw(
+            IMU, stamp, np.random.normal(0, 1, 6), "imu_link"), t)
+        if k % 3 == 0:
+            twist_stamp = t if k % 2 else t + 0.005
+            bag_writer.write("/twist", TWIST, encode_raw(
+                TWIST, twist_stamp, [np.sin(0.05 * k)] * 6), t + 0.005)
+    bag_writer.close()
+
+
+class TestNativeBag(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def _get_bag(self, compression="none"):
+        bag_path = os.path.join(self._directory, compression + ".bag")
+        write_bag(bag_path, compression)
+        return NativeBagReader(bag_path)
+
+    def test_init(self):
+        bag_path = os.path.join(self._directory, "invalid.bag")
+        with open(bag_path, "wb") as bag_file:
+            bag_file.write(b"#ROSBAG V1.2\n")
+        self.assertRaises(ValueError, NativeBagReader, bag_path)
+        self.assertRaises(ValueError, NativeBagWriter,
+                          bag_path, "zip")
+
+    def test_read(self):
+        for compression in ("none", "bz2"):
+            bag_reader = self._get_bag(compression)
+            self.assertEqual(bag_reader.get_topics(),
+                             {"/imu": IMU, "/twist": TWIST, "/odom": ODOM})
+            self.assertAlmostEqual(bag_reader.get_start_time(), 100)
+            self.assertAlmostEqual(bag_reader.get_end_time(), 100.59)
+            imu = bag_reader.read_imu("/imu")
+            np.testing.assert_allclose(imu.get_time(),
+                                       100 + 0.01 * np.arange(60))
+            np.testing.assert_array_equal(
+                imu.get_values(), np.arange(60)[:, None] + np.arange(6))
+            twist = bag_reader.read_twist("/twist")
+            self.assertEqual(len(twist), 20)
+            self.assertAlmostEqual(twist[-1][1][5], 5.7)
+            odom = bag_reader.read_odom("/odom")
+            np.testing.assert_allclose(odom.get_values()[:, 5],
+                                       0.02 * np.arange(0, 60, 5))
+            np.testing.assert_array_equal(odom[0][1][6:],
+                                          (4, 5, 6, 7, 8, 9))
+
+    @unittest.skipIf("lz4" not in NativeBagWriter.get_compressions(),
+                     "lz4 not installed")
+    def test_read_lz4(self):
+        bag_reader = self._get_bag("lz4")
+        self.assertEqual(len(bag_reader.read_imu("/imu")), 60)
+
+    def test_window(self):
+        bag_reader = self._get_bag()
+        imu = bag_reader.read_topics({"/imu": "imu"}, 100.2, 100.3)["/imu"]
+        np.testing.assert_allclose(imu.get_time(),
+                                   100.2 + 0.01 * np.arange(11))
+
+    def test_index(self):
+        bag_reader = self._get_bag("bz2")
+        index = bag_reader.get_index("/imu")
+        self.assertEqual(len(index), 60)
+        self.assertEqual(len(os.listdir(bag_reader._bag_path + ".idx")), 1)
+        self.assertEqual(bag_reader.seek("/imu", 100.2), 20)
+        imu = bag_reader.read_range("/imu", "imu", 100.2, 5)
+        np.testing.assert_allclose(imu.get_time(),
+                                   100.2 + 0.01 * np.arange(5))
+        np.testing.assert_array_equal(
+            imu.get_values(), np.arange(20, 25)[:, None] + np.arange(6))
+        bag_reader = NativeBagReader(bag_reader._bag_path)
+        self.assertIsInstance(bag_reader.get_index("/imu"), np.memmap)
+        odom = bag_reader.read_range("/odom", "odom", 100.5, 10)
+        self.assertEqual(len(odom), 2)
+        np.testing.assert_allclose(odom.get_values()[:, 5], (1, 1.1))
+        self.assertEqual(len(bag_reader.read_range("/odom", "odom", 101)), 0)
+
+    def test_stream(self):
+        bag_reader = self._get_bag("bz2")
+        tuy = list(bag_reader.stream_tuy("/twist", "/imu"))
+        self.assertEqual(len(tuy), 80)
+        time = [t for t, _u, _y in tuy]
+        self.assertEqual(time, sorted(time))
+        self.assertEqual(tuy[-1][1:], ((5.7, 5.7), (59, 64)))
+        # twist only events carry no measurement
+        self.assertEqual(tuy[1][2], None)
+
+    def test_stream_events(self):
+        bag_path = os.path.join(self._directory, "tuy.bag")
+        write_tuy_bag(bag_path)
+        bag_reader = NativeBagReader(bag_path)
+        tuy = list(bag_reader.stream_tuy("/twist", "/imu"))
+        bag_sys_io = BagSysIO(bag_reader, "/twist", "/imu")
+        state_estimator = StateEstimator()
+        state_estimator.set_stamped_input(bag_sys_io.get_input())
+        state_estimator.set_stamped_output(bag_sys_io.get_output())
+        event_table = state_estimator.get_event_table()
+        time, U, Y = state_estimator._get_merged_input_output()
+        # one event per stamp, y only where a new output arrived
+        np.testing.assert_array_equal([t for t, _u, _y in tuy], time)
+        np.testing.assert_array_equal([y is not None for _t, _u, y in tuy],
+                                      event_table.get_has_y())
+        np.testing.assert_array_equal([u for _t, u, _y in tuy], U)
+        has_y = event_table.get_has_y()
+        np.testing.assert_array_equal(
+            [y for _t, _u, y in tuy if y is not None], Y[has_y])
+        # so filtering the stream gives the batch results
+        kalman_filter = get_kalman_filter()
+        states = np.zeros((len(tuy), 7))
+        for k, event in enumerate(tuy):
+            kalman_filter.filter_iter(event)
+            states[k] = kalman_filter.get_post_states()[:, 0]
+        np.testing.assert_array_equal(states, get_kalman_filter(
+        ).filter_batch(time, U, Y, has_y=has_y))
+
+    def test_filter_stream(self):
+        bag_path = os.path.join(self._directory, "tuy.bag")
+        write_tuy_bag(bag_path)
+        bag_reader = NativeBagReader(bag_path)
+        bag_sys_io = BagSysIO(bag_reader, "/twist", "/imu")
+        kalman_estimator = KalmanEstimator(get_kalman_filter())
+        kalman_estimator.set_stamped_input(bag_sys_io.get_input())
+        kalman_estimator.set_stamped_output(bag_sys_io.get_output())
+        stamped_states = kalman_estimator.get_stamped_states()
+        stamped_Q = kalman_estimator.get_stamped_Q()
+        # small sinks, so the rows arrive over several flushes
+        blocks = []
+        sink = StampedSink(7, 64, lambda time, values: blocks.append(
+            np.column_stack((time, values))))
+        Q_blocks = []
+        Q_sink = StampedSink(2, 64, lambda time, values: Q_blocks.append(
+            np.column_stack((time, values))))
+        KalmanEstimator(get_kalman_filter()).filter_stream(
+            bag_reader.stream_tuy("/twist", "/imu"), sink, Q_sink)
+        streamed = np.vstack(blocks)
+        np.testing.assert_array_equal(streamed[:, 0],
+                                      stamped_states.get_time())
+        np.testing.assert_array_equal(streamed[:, 1:],
+                                      stamped_states.get_values())
+        np.testing.assert_array_equal(np.vstack(Q_blocks)[:, 1:],
+                                      stamped_Q.get_values())
+
+    def test_bag_sys_io(self):
+        bag_sys_io = BagSysIO(self._get_bag(), "/twist", "/imu", "/odom")
+        np.testing.assert_allclose(bag_sys_io.get_input()[1][1], (0.3, 0.3))
+        self.assertEqual(bag_sys_io.get_output()[2][1], (2, 7))
+        self.assertEqual(len(bag_sys_io.get_states(None)[0][1]), 6)
+
+    def test_bag_sys_io_window(self):
+        bag_reader = self._get_bag()
+        # the read starts the warm-up margin before the window
+        bag_sys_io = BagSysIO(bag_reader, "/twist", "/imu",
+                              time_window=(0.2, 0.4), warmup=0.1)
+        output = bag_sys_io.get_output()
+        self.assertAlmostEqual(output[0][0], 100.1)
+        self.assertAlmostEqual(output[-1][0], 100.4)
+        np.testing.assert_allclose(bag_sys_io.get_slice(), (0.1, 0.3))
+        # a margin longer than the lead-in is clipped at the bag start
+        bag_sys_io = BagSysIO(bag_reader, "/twist", "/imu",
+                              time_window=(0.2, 0.4), warmup=0.5)
+        self.assertAlmostEqual(bag_sys_io.get_output()[0][0], 100)
+        np.testing.assert_allclose(bag_sys_io.get_slice(), (0.2, 0.4))
+        # an open window reads up to the end of the bag
+        bag_sys_io = BagSysIO(bag_reader, "/twist", "/imu",
+                              time_window=(0.3, np.inf), warmup=0.1)
+        output = bag_sys_io.get_output()
+        self.assertAlmostEqual(output[0][0], 100.2)
+        self.assertAlmostEqual(output[-1][0], 100.59)
+        self.assertEqual(bag_sys_io.get_slice(), (0.1, np.inf))
+        self.assertEqual(BagSysIO(bag_reader, "/twist", "/imu").get_slice(),
+                         (0, np.inf))
+        self.assertRaises(ValueError, BagSysIO, bag_reader, "/twist",
+                          "/imu", time_window=(0.4, 0.2))
+        self.assertRaises(ValueError, BagSysIO, bag_reader, "/twist",
+                          "/imu", warmup=-1)
+
+
+if __name__ == '__main__':
+    rosunit.unitrun("kalman_estimator", 'test_native_bag', TestNativeBag)
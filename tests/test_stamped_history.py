@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+import unittest
+import rosunit
+import numpy as np
+
+from kalman_estimator import StampedHistory, StampedSink
+
+
+class TestStampedHistory(unittest.TestCase):
+    def test_init(self):
+        self.assertRaises(ValueError, StampedHistory, 0)
+        self.assertRaises(ValueError, StampedHistory, 2, 0)
+
+    def test_append(self):
+        history = StampedHistory(2, 1)
+        for t in range(5):
+            history.append(0.1 * t, (t, -t))
+        self.assertEqual(len(history), 5)
+        self.assertEqual(history[3], (0.1 * 3, (3, -3)))
+        self.assertEqual(history[-1], (0.1 * 4, (4, -4)))
+        self.assertEqual(list(history)[1:3], history[1:3])
+        self.assertRaises(IndexError, history.__getitem__, 5)
+
+    def test_allocate(self):
+        history = StampedHistory(2, 2)
+        history.append(0.0, (1, 1))
+        time, values = history.allocate(3)
+        time[:] = (0.1, 0.2, 0.3)
+        values[:] = 2
+        np.testing.assert_array_equal(history.get_time(),
+                                      [0.0, 0.1, 0.2, 0.3])
+        np.testing.assert_array_equal(history.get_values()[:, 0],
+                                      [1, 2, 2, 2])
+        history.clear()
+        self.assertFalse(history)
+
+    def test_dtype(self):
+        history = StampedHistory(2, 1, np.float32)
+        for t in range(3):
+            history.append(1e9 + 0.1 * t, (t, -t))
+        self.assertEqual(history.get_values().dtype, np.float32)
+        np.testing.assert_array_equal(history.get_time(),
+                                      1e9 + 0.1 * np.arange(3))
+
+    def test_select(self):
+        values = np.arange(18.).reshape(3, 6)
+        history = StampedHistory.from_arrays((0.1, 0.2, 0.3), values)
+        self.assertEqual(history[1], (0.2, (6, 7, 8, 9, 10, 11)))
+        selected = history.select(np.array([1, 0, 0, 0, 0, 1], dtype=bool))
+        self.assertEqual(list(selected), [(0.1, (0, 5)), (0.2, (6, 11)),
+                                          (0.3, (12, 17))])
+        values[0, 5] = -1
+        self.assertEqual(selected[0], (0.1, (0, -1)))
+        selected = history.select([0, 1, 5])
+        np.testing.assert_array_equal(selected.get_values()[:, 2],
+                                      values[:, 5])
+        self.assertRaises(ValueError, history.select, [True, False])
+        self.assertRaises(ValueError, StampedHistory.from_arrays,
+                          (0.1, 0.2), values)
+
+
+class TestStampedSink(unittest.TestCase):
+    def test_flush(self):
+        blocks = []
+        sink = StampedSink(2, 3, lambda time, values: blocks.append(
+            (time.tolist(), values.tolist())))
+        for t in range(7):
+            sink.append(t, (t, -t))
+        self.assertEqual(len(sink), 7)
+        self.assertEqual([block[0] for block in blocks], [[0, 1, 2],
+                                                          [3, 4, 5]])
+        sink.flush()
+        self.assertEqual(blocks[-1], ([6], [[6, -6]]))
+        self.assertFalse(len(sink.get_time()))
+
+    def test_latest_block(self):
+        sink = StampedSink(1, 4)
+        for t in range(8):
+            sink.append(t, t)
+        sink.flush()
+        np.testing.assert_array_equal(sink.get_time(), [4, 5, 6, 7])
+
+
+if __name__ == '__main__':
+    rosunit.unitrun("kalman_estimator", 'test_stamped_history',
+                    TestStampedHistory)
+    rosunit.unitrun("kalman_estimator", 'test_stamped_sink',
+                    TestStampedSink)